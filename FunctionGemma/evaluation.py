@@ -0,0 +1,368 @@
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+import torch
+
+# --- Batched evaluation for the fine-tuned FunctionGemma model ---
+# Importable, CPU-runnable version of the notebook's evaluation helpers. Instead of the
+# text-generation pipeline with batch_size = 1, prompts are tokenized once, grouped into
+# batches of similar token length (so left padding stays small) and decoded greedily
+# with model.generate. Raw outputs are appended to a JSONL checkpoint after every batch,
+# so an interrupted run picks up where it stopped. Each record carries a fingerprint of
+# the model, tokenizer and generation settings, so a checkpoint is never reused for a
+# different run (e.g. the base model's outputs for the fine-tuned model).
+#
+#   from FunctionGemma.evaluation import get_scored_data_frame, review
+#   scored = get_scored_data_frame(eval_dataset, model, tokenizer, checkpoint_path="eval_trained.jsonl")
+#   print(scored["correct"].mean())
+
+# FunctionGemma stops after a turn or when it hands control back for a function response
+STOP_TOKENS = ("<end_of_turn>", "<start_function_response>")
+
+
+def extract_function_call(model_output):
+    """
+    Parses a string containing specific function call markers and returns
+    a list of function call objects. Here is an example of the obejct:
+
+    ```
+    <start_function_call>call:open_map{query:<escape>San Francisco<escape>}<end_function_call>
+    ```
+
+    Args:
+        model_output (str): The model output string.
+
+    Returns:
+        list: A list of dictionaries representing the function calls.
+    """
+    results = []
+
+    # Pattern to extract the full content of a single function call
+    # Flags: DOTALL allows matching across newlines if necessary
+    call_pattern = r"<start_function_call>(.*?)<end_function_call>"
+    raw_calls = re.findall(call_pattern, model_output, re.DOTALL)
+
+    for raw_call in raw_calls:
+        function_call = parse_function_call(raw_call)
+        if function_call is not None:
+            results.append(function_call)
+
+    return results
+
+
+def parse_function_call(raw_call):
+    """
+    Parses the text between <start_function_call> and <end_function_call>, e.g.
+    'call:open_map{query:<escape>San Francisco<escape>}'. Returns the function call
+    object, or None if the text is not a well-formed call.
+    """
+    # Check if the content starts with 'call:'
+    if not raw_call.strip().startswith("call:"):
+        return None
+
+    # Extract function name
+    # Expected format: call:func_name{...}
+    try:
+        # Split only on the first brace to separate name and args
+        pre_brace, args_segment = raw_call.split("{", 1)
+    except ValueError:
+        # Handles cases where syntax might be malformed (e.g., missing '{')
+        return None
+
+    function_name = pre_brace.replace("call:", "").strip()
+
+    # Remove the trailing closing brace '}'
+    args_content = args_segment.strip()
+    if args_content.endswith("}"):
+        args_content = args_content[:-1]
+
+    arguments = {}
+
+    # Pattern to extract arguments
+    # Looks for: key:<escape>value<escape>
+    # The key pattern [^:,]* ensures we don't accidentally eat previous commas
+    arg_pattern = r"(?P<key>[^:,]*?):<escape>(?P<value>.*?)<escape>"
+
+    arg_matches = re.finditer(arg_pattern, args_content, re.DOTALL)
+
+    for match in arg_matches:
+        key = match.group("key").strip()
+        value = match.group("value")
+        arguments[key] = value
+
+    return {
+        "function": {
+            "name": function_name,
+            "arguments": arguments
+        }
+    }
+
+
+def extract_text(model_output):
+    """
+    Extracts text content and removing the <end_of_turn> marker.
+
+    Args:
+        model_output (str): The model output string.
+
+    Returns:
+        str: The cleaned text.
+    """
+    if not model_output or model_output.startswith("<start_function_call>"):
+        return None
+    return model_output.replace("<end_of_turn>", "").strip()
+
+
+def apply_format(sample, tokenizer):
+    """
+    Splits one dataset row into prompt and completion with the chat template (notebook cell 14).
+    """
+    template_inputs = json.loads(sample['text'])
+    prompt_and_completion = tokenizer.apply_chat_template(
+        template_inputs['messages'], tools=template_inputs['tools'], tokenize=False, add_generation_prompt=False)
+    prompt = tokenizer.apply_chat_template(
+        template_inputs['messages'][:-1], tools=template_inputs['tools'], tokenize=False, add_generation_prompt=True)
+    return {
+        "prompt": prompt,
+        "completion": prompt_and_completion[len(prompt):],
+        "split": template_inputs["metadata"],
+    }
+
+
+def _rows(dataset):
+    # Accepts a datasets.Dataset or any sequence of dicts; HF datasets convert to a list once
+    return dataset.to_list() if hasattr(dataset, "to_list") else list(dataset)
+
+
+def _prompt_hash(prompt):
+    return hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+
+
+def length_bucketed_batches(lengths, batch_size, max_batch_tokens=None):
+    """
+    Groups example indices into batches of similar length, longest first, so each batch
+    pads to a length close to that of its members. A batch closes at batch_size examples
+    or when batch rows * longest row would exceed max_batch_tokens.
+    """
+    order = sorted(range(len(lengths)), key=lambda idx: lengths[idx], reverse=True)
+    batches, current = [], []
+    for idx in order:
+        # Longest first: the batch's padded length is that of its first member
+        too_many_tokens = max_batch_tokens and current and (len(current) + 1) * lengths[current[0]] > max_batch_tokens
+        if len(current) == batch_size or too_many_tokens:
+            batches.append(current)
+            current = []
+        current.append(idx)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def tokenizer_fingerprint(tokenizer):
+    """
+    Hash of everything that changes how rows are rendered and tokenized.
+    """
+    digest = hashlib.sha256()
+    if hasattr(tokenizer, "backend_tokenizer"):
+        digest.update(tokenizer.backend_tokenizer.to_str().encode("utf-8"))
+    else:
+        digest.update(json.dumps(tokenizer.get_vocab(), sort_keys=True).encode("utf-8"))
+    digest.update((tokenizer.chat_template or "").encode("utf-8"))
+    digest.update(json.dumps(tokenizer.special_tokens_map, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _hash_state(digest, value):
+    # state_dict values: tensors, or (for quantized layers) tuples holding quantized tensors
+    if isinstance(value, torch.Tensor):
+        tensor = value.int_repr() if value.is_quantized else value
+        digest.update(str(tensor.dtype).encode("utf-8"))
+        digest.update(tensor.detach().cpu().contiguous().view(-1).view(torch.uint8).numpy().tobytes())
+    elif isinstance(value, (tuple, list)):
+        for item in value:
+            _hash_state(digest, item)
+    else:
+        digest.update(repr(value).encode("utf-8"))
+
+
+def run_fingerprint(model, tokenizer, generation_settings):
+    """
+    Hash identifying an evaluation run: the model (name_or_path, config and weights),
+    the tokenizer and the generation settings.
+    """
+    digest = hashlib.sha256()
+    digest.update(str(getattr(model, "name_or_path", "")).encode("utf-8"))
+    digest.update(model.config.to_json_string(use_diff=False).encode("utf-8"))
+    for name, value in model.state_dict().items():
+        digest.update(name.encode("utf-8"))
+        _hash_state(digest, value)
+    digest.update(tokenizer_fingerprint(tokenizer).encode("utf-8"))
+    digest.update(json.dumps(generation_settings, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def load_checkpoint(checkpoint_path, prompts, fingerprint=None):
+    """
+    Returns {index: output} for checkpointed rows whose prompt still matches. Lines from a
+    different dataset order, or a partial last line left by a crash, are ignored. With a
+    run fingerprint, a checkpoint written by a different run raises ValueError.
+    """
+    done = {}
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return done
+    with open(checkpoint_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if fingerprint is not None and record.get("run_fingerprint") != fingerprint:
+                raise ValueError(f"Checkpoint {checkpoint_path} was written by a different run (model, tokenizer or "
+                                 "generation settings differ). Use a new checkpoint_path for this run.")
+            idx = record.get("index")
+            if isinstance(idx, int) and 0 <= idx < len(prompts) and record.get("prompt_sha1") == _prompt_hash(prompts[idx]):
+                done[idx] = record["output"]
+    return done
+
+
+def stop_token_ids(tokenizer):
+    ids = {tokenizer.eos_token_id}
+    for token in STOP_TOKENS:
+        token_id = tokenizer.convert_tokens_to_ids(token)
+        if token_id is not None and token_id != tokenizer.unk_token_id:
+            ids.add(token_id)
+    return sorted(token_id for token_id in ids if token_id is not None)
+
+
+def generate_outputs(prompts, model, tokenizer, batch_size=8, max_new_tokens=256, max_batch_tokens=None,
+                     checkpoint_path=None):
+    """
+    Greedy-decodes every prompt and returns the model outputs (prompt removed, stripped) in
+    input order. Prompts already in the checkpoint are not generated again; a checkpoint
+    from another model, tokenizer or max_new_tokens raises ValueError instead of being reused.
+    """
+    stop_ids = stop_token_ids(tokenizer)
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    fingerprint = None
+    if checkpoint_path:
+        fingerprint = run_fingerprint(model, tokenizer, {"max_new_tokens": max_new_tokens, "do_sample": False,
+                                                         "eos_token_id": stop_ids, "pad_token_id": pad_id})
+    outputs = load_checkpoint(checkpoint_path, prompts, fingerprint)
+    pending = [idx for idx in range(len(prompts)) if idx not in outputs]
+    if outputs:
+        print(f"Resuming evaluation: {len(outputs)} of {len(prompts)} outputs loaded from {checkpoint_path}")
+    if not pending:
+        return [outputs[idx] for idx in range(len(prompts))]
+
+    # The chat template already adds <bos>; tokenize once, without padding
+    encoded = tokenizer([prompts[idx] for idx in pending], add_special_tokens=False)["input_ids"]
+    lengths = [len(ids) for ids in encoded]
+    device = next(model.parameters()).device
+    checkpoint = open(checkpoint_path, "a", encoding="utf-8") if checkpoint_path else None
+    finished = len(outputs)
+    try:
+        for batch in length_bucketed_batches(lengths, batch_size, max_batch_tokens):
+            inputs = tokenizer.pad({"input_ids": [encoded[pos] for pos in batch]}, padding=True,
+                                   padding_side="left", return_tensors="pt").to(device)
+            with torch.inference_mode():
+                generated = model.generate(**inputs, max_new_tokens=max_new_tokens, do_sample=False,
+                                           eos_token_id=stop_ids, pad_token_id=pad_id)
+            new_tokens = generated[:, inputs["input_ids"].shape[1]:].tolist()
+            for pos, tokens in zip(batch, new_tokens):
+                # Rows that stopped early are right-padded by generate; drop that padding only
+                while tokens and tokens[-1] == pad_id:
+                    tokens.pop()
+                idx = pending[pos]
+                outputs[idx] = tokenizer.decode(tokens, skip_special_tokens=False).strip()
+                if checkpoint:
+                    checkpoint.write(json.dumps({"index": idx, "prompt_sha1": _prompt_hash(prompts[idx]),
+                                                 "run_fingerprint": fingerprint, "output": outputs[idx]}) + "\n")
+            if checkpoint:
+                checkpoint.flush()
+            finished += len(batch)
+            print(f"Eval process: {finished * 100.0 / len(prompts):.2f}%")
+    finally:
+        if checkpoint:
+            checkpoint.close()
+    return [outputs[idx] for idx in range(len(prompts))]
+
+
+def get_eval_logs(dataset, model, tokenizer, batch_size=8, max_new_tokens=256, max_batch_tokens=None,
+                  checkpoint_path=None):
+    """
+    Same log records as the notebook's get_eval_logs, generated in length-bucketed batches.
+    Rows without a 'prompt' column are formatted with apply_format first.
+    """
+    rows = _rows(dataset)
+    samples = [json.loads(row['text']) for row in rows] # Parsed once per row
+    prompts = [row['prompt'] if 'prompt' in row else apply_format(row, tokenizer)['prompt'] for row in rows]
+    model_outputs = generate_outputs(prompts, model, tokenizer, batch_size=batch_size, max_new_tokens=max_new_tokens,
+                                     max_batch_tokens=max_batch_tokens, checkpoint_path=checkpoint_path)
+
+    logs = []
+    for sample, model_output_only in zip(samples, model_outputs):
+        user_message = sample['messages'][1]
+        assistant_first_message = sample['messages'][2]
+        logs.append({
+            "user": user_message['content'],
+            "target_fc": assistant_first_message.get('tool_calls', []),
+            "target_text": assistant_first_message.get('content'),
+            "output_fc": extract_function_call(model_output_only),
+            "output_text": extract_text(model_output_only),
+        })
+    return logs
+
+
+def _call_keys(calls):
+    # Canonical JSON strings for a list of calls: names in order, arguments with sorted keys
+    names = [fc['function']['name'] for fc in calls]
+    arguments = [dict(sorted(fc['function']['arguments'].items())) for fc in calls]
+    return names, arguments, json.dumps(names), json.dumps(arguments, sort_keys=True)
+
+
+def score_logs(logs):
+    """
+    Builds the notebook's scored data frame from eval logs. Each row's calls are reduced to
+    canonical JSON strings once, and the name and argument comparisons run as whole-column
+    string comparisons instead of per-row pandas apply.
+    """
+    target = [_call_keys(log['target_fc']) for log in logs]
+    output = [_call_keys(log['output_fc']) for log in logs]
+
+    scored = pd.DataFrame({
+        'user': [log['user'] for log in logs],
+        'target_names': [keys[0] for keys in target],
+        'output_names': [keys[0] for keys in output],
+        'target_arguments': [keys[1] for keys in target],
+        'output_arguments': [keys[1] for keys in output],
+        'target_text': [log['target_text'] for log in logs],
+        'output_text': [log['output_text'] for log in logs],
+    })
+    scored['correct_names'] = np.array([keys[2] for keys in target], dtype=str) == np.array([keys[2] for keys in output], dtype=str)
+    scored['correct_arguments'] = np.array([keys[3] for keys in target], dtype=str) == np.array([keys[3] for keys in output], dtype=str)
+    scored['correct'] = scored['correct_names'] & scored['correct_arguments']
+    return scored
+
+
+def get_scored_data_frame(dataset, model, tokenizer, **options):
+    """
+    Runs get_eval_logs (options: batch_size, max_new_tokens, max_batch_tokens, checkpoint_path)
+    and scores the result.
+    """
+    return score_logs(get_eval_logs(dataset, model, tokenizer, **options))
+
+
+def review(scored):
+    scored["incorrect_names"] = ~scored["correct_names"]
+    scored["incorrect_arguments"] = ~scored["correct_arguments"]
+    scored["incorrect"] = ~scored["correct"]
+
+    for index, row in scored[scored["incorrect"]].iterrows():
+        print(f"\033[1mSample #{index} prompt  \033[0m: {row['user']}")
+        print(f"\033[1mSample #{index} expected\033[0m: {row['target_names']}, {row['target_arguments']}")
+        print(f"\033[1mSample #{index} actual  \033[0m: {row['output_names']}, {row['output_arguments']}")
+        print("---------------")
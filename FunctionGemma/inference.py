@@ -0,0 +1,363 @@
+import collections
+import concurrent.futures
+import datetime
+import queue
+import threading
+import time
+import warnings
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer, DynamicCache, StoppingCriteriaList
+
+from .evaluation import extract_text, stop_token_ids
+from .streaming import FunctionCallStoppingCriteria
+
+# --- CPU inference for the fine-tuned FunctionGemma model ---
+# FunctionCallingEngine loads the model once and turns free-text messages into function
+# calls. Every prompt starts with the same developer turn (system message + tool
+# declarations), so its key/value states are computed once and reused: a request only
+# prefills its own user turn. Concurrent requests are collected into micro-batches by a
+# single worker thread, and each row stops as soon as it has produced a complete call.
+#
+#   model, tokenizer = load_function_calling_model("/content/mobile-actions-functiongemma", quantize="int8")
+#   engine = FunctionCallingEngine(model, tokenizer, tools).start()
+#   result = engine.run("I just finished the quiz on cells")
+#   result["function_calls"] -> [{"function": {"name": "log_activity", "arguments": {...}}}]
+
+DEFAULT_DEVELOPER_MESSAGE = ("Current date and time given in YYYY-MM-DDTHH:MM:SS format: {now}. "
+                             "You are a model that can do function calling with the following functions")
+QUANTIZATION_MODES = ("int8",)
+
+
+class EngineNotRunningError(RuntimeError):
+    """
+    Raised for requests submitted to, or still queued in, an engine that is not running.
+    """
+
+
+def quantize_int8(model):
+    """
+    Dynamic int8 quantization of every nn.Linear (weights stored as int8, activations
+    quantized on the fly). CPU only; typically ~2x smaller and faster matmuls for a small
+    accuracy cost, so check the evaluation score of the quantized model.
+    """
+    with warnings.catch_warnings():
+        # torch.ao.quantization still works but warns that it is moving to torchao
+        warnings.simplefilter("ignore")
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_function_calling_model(model_path, quantize=None):
+    """
+    Loads the fine-tuned model and tokenizer for CPU inference (float32, eval mode).
+    quantize="int8" applies dynamic int8 quantization.
+    """
+    if quantize not in (None,) + QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization mode '{quantize}'. Use one of: {', '.join(QUANTIZATION_MODES)}")
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModelForCausalLM.from_pretrained(model_path, dtype=torch.float32)
+    model.eval()
+    if quantize == "int8":
+        model = quantize_int8(model)
+    print(f"Loaded function calling model from {model_path}" + (f" ({quantize})" if quantize else ""))
+    return model, tokenizer
+
+
+class PrefixKVCache:
+    """
+    Keeps the key/value states of recently used prompt prefixes (LRU). The states are
+    computed with a plain DynamicCache so they keep every position, even for layers that
+    use a sliding window; batch_cache() trims them per batch.
+    """
+    def __init__(self, model, tokenizer, max_entries=4):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def get(self, prefix):
+        """
+        Returns (prefix_ids, [(keys, values) per layer]) for a prefix string.
+        """
+        entry = self._entries.get(prefix)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(prefix)
+            return entry
+        self.misses += 1
+        prefix_ids = self.tokenizer(prefix, add_special_tokens=False, return_tensors="pt")["input_ids"]
+        cache = DynamicCache()
+        with torch.inference_mode():
+            self.model(input_ids=prefix_ids.to(self.model.device), past_key_values=cache, use_cache=True)
+        entry = (prefix_ids[0], [(layer.keys, layer.values) for layer in cache.layers])
+        self._entries[prefix] = entry
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def batch_cache(self, layer_states, pad_counts):
+        """
+        Builds the cache for a left-padded batch: row i is [pad * pad_counts[i], prefix,
+        suffix_i], and the cached part is its first len(prefix) positions, i.e. padding
+        followed by the prefix minus its last pad_counts[i] tokens (those are prefilled
+        with the suffix). This matches plain left-padded generation exactly, including
+        sliding-window layers.
+        """
+        batch = []
+        for keys, values in layer_states:
+            prefix_length = keys.shape[2]
+            rows_k, rows_v = [], []
+            for pad in pad_counts:
+                padding = keys.new_zeros((1, keys.shape[1], pad, keys.shape[3]))
+                rows_k.append(torch.cat([padding, keys[:, :, :prefix_length - pad]], dim=2))
+                rows_v.append(torch.cat([padding, values[:, :, :prefix_length - pad]], dim=2))
+            batch.append((torch.cat(rows_k), torch.cat(rows_v)))
+        return DynamicCache(ddp_cache_data=batch, config=self.model.config)
+
+    def get_metrics(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class FunctionCallingEngine:
+    def __init__(self, model, tokenizer, tools, developer_message=DEFAULT_DEVELOPER_MESSAGE, max_new_tokens=128,
+                 max_calls=1, batch_size=8, batch_max_delay=0.01, use_prefix_cache=True,
+                 time_resolution_seconds=3600, generate_kwargs=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.tools = tools
+        self.developer_message = developer_message
+        self.max_new_tokens = max_new_tokens
+        self.max_calls = max_calls # Rows stop generating after this many calls
+        self.batch_size = batch_size
+        self.batch_max_delay = batch_max_delay # How long the first request of a batch waits for company
+        # The developer message carries the current time; rounding it keeps the prefix (and its cache) stable
+        self.time_resolution_seconds = time_resolution_seconds
+        self.generate_kwargs = dict(generate_kwargs or {})
+        self.prefix_cache = PrefixKVCache(model, tokenizer) if use_prefix_cache else None
+        self._stop_ids = stop_token_ids(tokenizer)
+        self._pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+        self._device = next(model.parameters()).device
+        self._requests = queue.Queue()
+        self._worker = None
+        self._stopping = threading.Event()
+        self._metrics_lock = threading.Lock()
+        self._metrics = {"requests": 0, "batches": 0, "failed_batches": 0, "generated_tokens": 0,
+                         "generation_seconds": 0.0, "calls": 0, "time_to_first_call_seconds_total": 0.0}
+
+    # --- Prompt construction ---
+
+    def _system_message(self):
+        now = datetime.datetime.now().replace(microsecond=0)
+        if self.time_resolution_seconds:
+            seconds = now.hour * 3600 + now.minute * 60 + now.second
+            rounded = seconds - seconds % self.time_resolution_seconds
+            now = now.replace(hour=rounded // 3600, minute=rounded % 3600 // 60, second=rounded % 60)
+        return self.developer_message.format(now=now.isoformat())
+
+    def build_prompt(self, message):
+        """
+        Returns (prefix, suffix) where prefix is the shared developer turn and prefix + suffix
+        is the full chat-template prompt for the message.
+        """
+        system = {"role": "developer", "content": self._system_message()}
+        prefix = self.tokenizer.apply_chat_template([system], tools=self.tools, tokenize=False, add_generation_prompt=False)
+        prompt = self.tokenizer.apply_chat_template([system, {"role": "user", "content": message}], tools=self.tools,
+                                                    tokenize=False, add_generation_prompt=True)
+        if not prompt.startswith(prefix):
+            return "", prompt
+        return prefix, prompt[len(prefix):]
+
+    def _batch_inputs(self, messages):
+        """
+        Left-padded input_ids/attention_mask for the batch, plus the prefix cache when the
+        prompts share a cached prefix.
+        """
+        prompts = [self.build_prompt(message) for message in messages]
+        prefixes = {prefix for prefix, _ in prompts}
+        if self.prefix_cache is None or len(prefixes) != 1 or not prompts[0][0]:
+            rows = [self.tokenizer(prefix + suffix, add_special_tokens=False)["input_ids"] for prefix, suffix in prompts]
+            prefix_ids, layer_states = [], None
+        else:
+            prefix_tensor, layer_states = self.prefix_cache.get(prompts[0][0])
+            prefix_ids = prefix_tensor.tolist()
+            rows = [self.tokenizer(suffix, add_special_tokens=False)["input_ids"] for _, suffix in prompts]
+            # A row's padding takes the place of the prefix's last tokens in the cache, so it can
+            # be at most as long as the prefix; otherwise the batch runs without the cache
+            if max(len(row) for row in rows) - min(len(row) for row in rows) > len(prefix_ids):
+                rows = [prefix_ids + row for row in rows]
+                prefix_ids, layer_states = [], None
+        length = max(len(row) for row in rows)
+        pad_counts = [length - len(row) for row in rows]
+        input_ids = torch.tensor([[self._pad_id] * pad + prefix_ids + row for pad, row in zip(pad_counts, rows)])
+        attention_mask = torch.tensor([[0] * pad + [1] * (len(prefix_ids) + len(row)) for pad, row in zip(pad_counts, rows)])
+        past_key_values = self.prefix_cache.batch_cache(layer_states, pad_counts) if layer_states else None
+        return input_ids.to(self._device), attention_mask.to(self._device), past_key_values
+
+    # --- Generation ---
+
+    def generate_batch(self, messages, enqueued_at=None):
+        """
+        Runs one batch synchronously. Returns one result per message with the parsed
+        function calls, any text reply, and timings measured from enqueued_at (default now).
+        """
+        started = time.perf_counter()
+        enqueued_at = enqueued_at or [started] * len(messages)
+        input_ids, attention_mask, past_key_values = self._batch_inputs(messages)
+        first_call_at = [None] * len(messages)
+
+        def on_call(row, function_call):
+            if first_call_at[row] is None:
+                first_call_at[row] = time.perf_counter()
+
+        criteria = FunctionCallStoppingCriteria(self.tokenizer, input_ids.shape[1], max_calls=self.max_calls,
+                                                on_call=on_call)
+        kwargs = dict(self.generate_kwargs)
+        kwargs.setdefault("do_sample", False)
+        with torch.inference_mode():
+            generated = self.model.generate(
+                input_ids=input_ids, attention_mask=attention_mask, past_key_values=past_key_values,
+                max_new_tokens=self.max_new_tokens, eos_token_id=self._stop_ids, pad_token_id=self._pad_id,
+                stopping_criteria=StoppingCriteriaList([criteria]), **kwargs)
+        finished = time.perf_counter()
+
+        results = []
+        for row, tokens in enumerate(generated[:, input_ids.shape[1]:].tolist()):
+            while tokens and tokens[-1] == self._pad_id:
+                tokens.pop()
+            calls = criteria.calls[row] if criteria.parsers else []
+            output = self.tokenizer.decode(tokens, skip_special_tokens=False).strip()
+            results.append({
+                "function_calls": calls,
+                "text": None if calls else extract_text(output),
+                "generated_tokens": len(tokens),
+                "batch_size": len(messages),
+                "latency_seconds": round(finished - enqueued_at[row], 4),
+                "time_to_first_call_seconds": (round(first_call_at[row] - enqueued_at[row], 4)
+                                               if first_call_at[row] is not None else None),
+            })
+        self._record_batch(results, finished - started)
+        return results
+
+    def _record_batch(self, results, seconds):
+        with self._metrics_lock:
+            self._metrics["requests"] += len(results)
+            self._metrics["batches"] += 1
+            self._metrics["generation_seconds"] += seconds
+            for result in results:
+                self._metrics["generated_tokens"] += result["generated_tokens"]
+                if result["time_to_first_call_seconds"] is not None:
+                    self._metrics["calls"] += 1
+                    self._metrics["time_to_first_call_seconds_total"] += result["time_to_first_call_seconds"]
+
+    # --- Micro-batching worker ---
+
+    def start(self):
+        if self._worker is None:
+            self._stopping.clear()
+            self._worker = threading.Thread(target=self._run, name="function-calling-engine", daemon=True)
+            self._worker.start()
+        return self
+
+    def stop(self):
+        """
+        Stops the worker after the batch in progress; requests still queued fail.
+        """
+        if self._worker is None:
+            return
+        self._stopping.set()
+        self._worker.join()
+        self._worker = None
+        while True:
+            try:
+                _, future, _ = self._requests.get_nowait()
+            except queue.Empty:
+                break
+            future.set_exception(EngineNotRunningError("Function calling engine stopped."))
+
+    def submit(self, message):
+        """
+        Queues a message for the next micro-batch and returns a Future for its result.
+        """
+        if self._worker is None:
+            raise EngineNotRunningError("Function calling engine is not running; call start() first.")
+        future = concurrent.futures.Future()
+        self._requests.put((message, future, time.perf_counter()))
+        return future
+
+    def run(self, message, timeout=None):
+        return self.submit(message).result(timeout=timeout)
+
+    def _next_batch(self):
+        try:
+            batch = [self._requests.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.perf_counter() + self.batch_max_delay
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._requests.get(timeout=remaining) if remaining > 0 else self._requests.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                results = self.generate_batch([message for message, _, _ in batch], [t for _, _, t in batch])
+            except Exception as e:
+                print(f"Function calling batch of {len(batch)} failed: {e}")
+                with self._metrics_lock:
+                    self._metrics["failed_batches"] += 1
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+    def get_metrics(self):
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        seconds = metrics.pop("generation_seconds")
+        first_call_total = metrics.pop("time_to_first_call_seconds_total")
+        metrics["queue_depth"] = self._requests.qsize()
+        metrics["average_batch_size"] = round(metrics["requests"] / metrics["batches"], 2) if metrics["batches"] else 0
+        metrics["tokens_per_second"] = round(metrics["generated_tokens"] / seconds, 1) if seconds else 0
+        metrics["average_time_to_first_call_seconds"] = (round(first_call_total / metrics["calls"], 4)
+                                                         if metrics["calls"] else None)
+        metrics["prefix_cache"] = self.prefix_cache.get_metrics() if self.prefix_cache else None
+        return metrics
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else None
+
+
+def run_benchmark(engine, messages, concurrency=8):
+    """
+    Sends messages through a started engine from `concurrency` threads and reports
+    throughput (generated tokens/s, requests/s) and time-to-first-call percentiles.
+    """
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(engine.run, messages))
+    seconds = time.perf_counter() - start
+    first_calls = [r["time_to_first_call_seconds"] for r in results if r["time_to_first_call_seconds"] is not None]
+    tokens = sum(r["generated_tokens"] for r in results)
+    return {
+        "requests": len(results),
+        "concurrency": concurrency,
+        "seconds": round(seconds, 3),
+        "requests_per_second": round(len(results) / seconds, 2),
+        "tokens_per_second": round(tokens / seconds, 1),
+        "time_to_first_call_p50_seconds": _percentile(first_calls, 0.5),
+        "time_to_first_call_p95_seconds": _percentile(first_calls, 0.95),
+        "calls": len(first_calls),
+        "average_batch_size": round(sum(r["batch_size"] for r in results) / len(results), 2) if results else 0,
+    }
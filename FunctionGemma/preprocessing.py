@@ -0,0 +1,267 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+
+import numpy as np
+
+from .evaluation import _rows, apply_format, tokenizer_fingerprint
+
+# --- Parallel, cached preprocessing of the Mobile Actions dataset ---
+# The notebook's apply_format renders the chat template twice per row (with and without
+# the final message) and re-renders the full tool schema both times. Here the part of
+# the prompt that depends only on the tool set is rendered once per distinct tool set,
+# each row renders only its own turns once, and the rows are split and tokenized across
+# worker processes. The result (input_ids plus completion_mask, the pre-tokenized
+# prompt-completion layout SFTTrainer accepts) is written to a memory-mapped cache keyed
+# by the tokenizer and the data, so later runs load it without preprocessing at all.
+#
+#   from FunctionGemma.preprocessing import preprocess_dataset
+#   cache = preprocess_dataset(dataset, tokenizer, "/content/preprocessed")
+#   train_dataset = cache.to_dataset("train")
+
+CACHE_FORMAT_VERSION = 1
+CONTENT_SENTINEL = "\u0000FUNCTIONGEMMA_CONTENT\u0000"
+SYSTEM_ROLES = ("developer", "system")
+
+
+def data_fingerprint(rows):
+    digest = hashlib.sha256()
+    for row in rows:
+        digest.update(row["text"].encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def cache_key(tokenizer, rows):
+    return hashlib.sha256(
+        f"{CACHE_FORMAT_VERSION}:{tokenizer_fingerprint(tokenizer)}:{data_fingerprint(rows)}".encode("utf-8")).hexdigest()[:24]
+
+
+def _strip_prefix(text, prefix):
+    return text[len(prefix):] if prefix and text.startswith(prefix) else text
+
+
+def _generation_prompt(tokenizer):
+    # The text add_generation_prompt appends, e.g. '<start_of_turn>model\n'
+    messages = [{"role": "user", "content": "x"}]
+    with_prompt = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+    without_prompt = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=False)
+    return with_prompt[len(without_prompt):] if with_prompt.startswith(without_prompt) else None
+
+
+def build_tool_prefix(tokenizer, tools):
+    """
+    Renders the system turn for a tool set once, with a placeholder for the per-row
+    system message. Returns (head, tail) around the placeholder, or None if the
+    template does not render the content verbatim.
+    """
+    rendered = tokenizer.apply_chat_template([{"role": "developer", "content": CONTENT_SENTINEL}], tools=tools,
+                                             tokenize=False, add_generation_prompt=False)
+    if rendered.count(CONTENT_SENTINEL) != 1:
+        return None
+    head, tail = rendered.split(CONTENT_SENTINEL)
+    return head, tail
+
+
+def render_with_prefix(tokenizer, messages, prefix, generation_prompt):
+    """
+    One template render per row: the tool-set prefix is spliced in around the system
+    message, the remaining turns are rendered without tools, and the prompt/completion
+    boundary is the last generation prompt marker. Returns (prompt, completion).
+    """
+    head, tail = prefix
+    rest = tokenizer.apply_chat_template(messages[1:], tokenize=False, add_generation_prompt=False)
+    full = head + messages[0]["content"] + tail + _strip_prefix(rest, tokenizer.bos_token)
+    boundary = full.rfind(generation_prompt) + len(generation_prompt)
+    return full[:boundary], full[boundary:]
+
+
+# --- Worker processes ---
+
+_worker_state = {}
+
+
+def _init_worker(tokenizer, prefixes, generation_prompt):
+    _worker_state.update(tokenizer=tokenizer, prefixes=prefixes, generation_prompt=generation_prompt)
+
+
+def _process_chunk(chunk):
+    """
+    chunk: [(index, messages, tools_key, split, raw_text)]. Returns (indices, input_ids,
+    prompt_lengths, splits) for the chunk. Rows whose tool set could not use the fast
+    path (raw_text is set) go through apply_format.
+    """
+    tokenizer = _worker_state["tokenizer"]
+    prompts, completions = [], []
+    for index, messages, tools_key, split, raw_text in chunk:
+        if raw_text is None:
+            prompt, completion = render_with_prefix(tokenizer, messages, _worker_state["prefixes"][tools_key],
+                                                    _worker_state["generation_prompt"])
+        else:
+            formatted = apply_format({"text": raw_text}, tokenizer)
+            prompt, completion = formatted["prompt"], formatted["completion"]
+        prompts.append(prompt)
+        completions.append(completion)
+    # Tokenize prompt + completion once and locate the first completion token from the
+    # character alignment. A token straddling the boundary falls back to tokenizing the
+    # two halves separately.
+    encoded = tokenizer([p + c for p, c in zip(prompts, completions)], add_special_tokens=False)
+    full_ids = encoded["input_ids"]
+    prompt_lengths = []
+    for row, prompt in enumerate(prompts):
+        boundary = len(prompt)
+        if encoded.is_fast:
+            if not completions[row]:
+                prompt_lengths.append(len(full_ids[row]))
+                continue
+            token_index = encoded.char_to_token(row, boundary)
+            if token_index is not None and encoded.token_to_chars(row, token_index).start == boundary:
+                prompt_lengths.append(token_index)
+                continue
+        prompt_row = tokenizer(prompt, add_special_tokens=False)["input_ids"]
+        if full_ids[row][:len(prompt_row)] != prompt_row:
+            full_ids[row] = prompt_row + tokenizer(completions[row], add_special_tokens=False)["input_ids"]
+        prompt_lengths.append(len(prompt_row))
+    return [item[0] for item in chunk], full_ids, prompt_lengths, [item[3] for item in chunk]
+
+
+def _plan(rows, tokenizer):
+    """
+    Parses every row once, renders one prefix per distinct tool set and checks it against
+    apply_format on that tool set's first row. Returns (work items, prefixes, generation prompt).
+    """
+    generation_prompt = _generation_prompt(tokenizer)
+    prefixes, slow_tool_sets, items = {}, set(), []
+    for index, row in enumerate(rows):
+        sample = json.loads(row["text"])
+        tools_json = json.dumps(sample.get("tools"))
+        tools_key = hashlib.sha1(tools_json.encode("utf-8")).hexdigest()
+        messages = sample["messages"]
+        if tools_key not in prefixes and tools_key not in slow_tool_sets:
+            prefix = build_tool_prefix(tokenizer, sample.get("tools")) if generation_prompt else None
+            expected = apply_format(row, tokenizer)
+            if (prefix is None or messages[0]["role"] not in SYSTEM_ROLES or
+                    render_with_prefix(tokenizer, messages, prefix, generation_prompt) != (expected["prompt"], expected["completion"])):
+                print(f"Tool set {tools_key[:8]}: template prefix does not splice cleanly, using apply_format")
+                slow_tool_sets.add(tools_key)
+            else:
+                prefixes[tools_key] = prefix
+        fast = tools_key in prefixes and messages[0]["role"] in SYSTEM_ROLES
+        items.append((index, messages if fast else None, tools_key, sample["metadata"], None if fast else row["text"]))
+    return items, prefixes, generation_prompt
+
+
+def _write_cache(path, input_ids, prompt_lengths, splits, meta):
+    temp_path = f"{path}.tmp-{os.getpid()}"
+    os.makedirs(temp_path, exist_ok=True)
+    lengths = np.array([len(ids) for ids in input_ids], dtype=np.int64)
+    offsets = np.zeros(len(input_ids) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    flat = np.concatenate([np.asarray(ids, dtype=np.int32) for ids in input_ids]) if input_ids else np.zeros(0, dtype=np.int32)
+    split_names = sorted(set(splits))
+    np.save(os.path.join(temp_path, "input_ids.npy"), flat)
+    np.save(os.path.join(temp_path, "offsets.npy"), offsets)
+    np.save(os.path.join(temp_path, "prompt_lengths.npy"), np.array(prompt_lengths, dtype=np.int32))
+    np.save(os.path.join(temp_path, "splits.npy"), np.array([split_names.index(s) for s in splits], dtype=np.int16))
+    with open(os.path.join(temp_path, "meta.json"), "w") as f:
+        json.dump(dict(meta, splits=split_names, num_rows=len(input_ids)), f, indent=2)
+    # Rename into place last, so a half-written cache is never picked up
+    if os.path.exists(path):
+        shutil.rmtree(temp_path)
+    else:
+        os.replace(temp_path, path)
+
+
+def preprocess_dataset(dataset, tokenizer, cache_dir, num_proc=None, chunk_size=256):
+    """
+    Formats and tokenizes a Mobile Actions style dataset (rows with a 'text' column), or
+    loads the cached result if this tokenizer and data were processed before. num_proc
+    defaults to the CPU count; num_proc=1 runs in this process. Returns a
+    PreprocessedCache.
+    """
+    rows = _rows(dataset)
+    path = os.path.join(cache_dir, cache_key(tokenizer, rows))
+    if os.path.exists(os.path.join(path, "meta.json")):
+        print(f"Loading preprocessed dataset from {path}")
+        return PreprocessedCache(path)
+
+    items, prefixes, generation_prompt = _plan(rows, tokenizer)
+    chunks = [items[start:start + chunk_size] for start in range(0, len(items), chunk_size)]
+    num_proc = num_proc or os.cpu_count() or 1
+    if num_proc == 1 or len(chunks) == 1:
+        _init_worker(tokenizer, prefixes, generation_prompt)
+        results = [_process_chunk(chunk) for chunk in chunks]
+    else:
+        with multiprocessing.Pool(min(num_proc, len(chunks)), initializer=_init_worker,
+                                  initargs=(tokenizer, prefixes, generation_prompt)) as pool:
+            results = pool.map(_process_chunk, chunks)
+
+    input_ids, prompt_lengths, splits = [None] * len(rows), [0] * len(rows), [None] * len(rows)
+    for indices, chunk_ids, chunk_prompt_lengths, chunk_splits in results:
+        for position, index in enumerate(indices):
+            input_ids[index] = chunk_ids[position]
+            prompt_lengths[index] = chunk_prompt_lengths[position]
+            splits[index] = chunk_splits[position]
+
+    os.makedirs(cache_dir, exist_ok=True)
+    _write_cache(path, input_ids, prompt_lengths, splits, {
+        "format_version": CACHE_FORMAT_VERSION,
+        "tokenizer": getattr(tokenizer, "name_or_path", ""),
+        "tool_sets": len(prefixes),
+    })
+    print(f"Preprocessed {len(rows)} rows ({len(prefixes)} distinct tool sets) into {path}")
+    return PreprocessedCache(path)
+
+
+class PreprocessedCache:
+    """
+    Read-only view of a preprocessed cache directory. Token arrays are memory-mapped, so
+    opening a cache is cheap and rows are only read when accessed.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.input_ids = np.load(os.path.join(path, "input_ids.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.prompt_lengths = np.load(os.path.join(path, "prompt_lengths.npy"), mmap_mode="r")
+        self.split_codes = np.load(os.path.join(path, "splits.npy"), mmap_mode="r")
+
+    def __len__(self):
+        return self.meta["num_rows"]
+
+    def __getitem__(self, index):
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        prompt_length = int(self.prompt_lengths[index])
+        return {
+            "input_ids": self.input_ids[start:end].tolist(),
+            "completion_mask": [0] * prompt_length + [1] * (end - start - prompt_length),
+            "split": self.meta["splits"][self.split_codes[index]],
+        }
+
+    def indices(self, split):
+        if split not in self.meta["splits"]:
+            return []
+        return np.flatnonzero(self.split_codes == self.meta["splits"].index(split)).tolist()
+
+    @property
+    def max_length(self):
+        """
+        Longest tokenized example; the notebook sizes SFTConfig.max_length from this.
+        """
+        return int(np.diff(self.offsets).max()) if len(self) else 0
+
+    def to_dataset(self, split=None):
+        """
+        Builds a datasets.Dataset with input_ids and completion_mask columns, which
+        SFTTrainer uses as is instead of tokenizing again.
+        """
+        from datasets import Dataset
+        indices = range(len(self)) if split is None else self.indices(split)
+        examples = [self[index] for index in indices]
+        return Dataset.from_dict({
+            "input_ids": [example["input_ids"] for example in examples],
+            "completion_mask": [example["completion_mask"] for example in examples],
+        })
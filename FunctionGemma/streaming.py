@@ -0,0 +1,173 @@
+import queue
+import threading
+
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList
+
+from .evaluation import parse_function_call, stop_token_ids
+
+# --- Incremental function-call parsing for streamed FunctionGemma output ---
+# extract_function_call only runs once generation has finished. The parsers here consume
+# output as it is produced and hand back each call as soon as its <end_function_call>
+# arrives, so a caller can act on a log_activity call (and stop generating) without
+# waiting for the rest of the turn.
+#
+#   for function_call in stream_function_calls(model, tokenizer, prompt, max_calls=1):
+#       ...
+
+START_FUNCTION_CALL = "<start_function_call>"
+END_FUNCTION_CALL = "<end_function_call>"
+
+
+class FunctionCallStreamParser:
+    """
+    Text-level parser for decoded chunks, e.g. from a TextIteratorStreamer created with
+    skip_special_tokens=False. feed() returns the calls completed by that chunk. Markers
+    may be split across chunks; text outside calls is kept in .text.
+    """
+    def __init__(self):
+        self.calls = []
+        self._text_parts = []
+        self._buffer = ""
+        self._in_call = False
+        self._search_from = 0 # Where the next marker search starts, so each chunk is scanned once
+
+    @property
+    def text(self):
+        return "".join(self._text_parts + ([] if self._in_call else [self._buffer]))
+
+    def feed(self, chunk):
+        self._buffer += chunk
+        completed = []
+        while True:
+            marker = END_FUNCTION_CALL if self._in_call else START_FUNCTION_CALL
+            position = self._buffer.find(marker, self._search_from)
+            if position < 0:
+                # Keep a possible partial marker at the end of the buffer for the next chunk
+                keep_from = max(0, len(self._buffer) - len(marker) + 1)
+                if not self._in_call:
+                    self._text_parts.append(self._buffer[:keep_from])
+                    self._buffer = self._buffer[keep_from:]
+                    keep_from = 0
+                self._search_from = keep_from
+                return completed
+            if self._in_call:
+                function_call = parse_function_call(self._buffer[:position])
+                if function_call is not None:
+                    completed.append(function_call)
+                    self.calls.append(function_call)
+            else:
+                self._text_parts.append(self._buffer[:position])
+            self._buffer = self._buffer[position + len(marker):]
+            self._search_from = 0
+            self._in_call = not self._in_call
+
+
+class FunctionCallTokenParser:
+    """
+    Token-level parser: <start_function_call> and <end_function_call> are single special
+    tokens, so call boundaries are found by id and only the tokens of a finished call are
+    decoded. feed_ids() returns the calls completed by those ids.
+    """
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.calls = []
+        self._start_id = tokenizer.convert_tokens_to_ids(START_FUNCTION_CALL)
+        self._end_id = tokenizer.convert_tokens_to_ids(END_FUNCTION_CALL)
+        self._pad_id = tokenizer.pad_token_id
+        self._call_ids = None # Ids of the call being generated, or None outside a call
+
+    def feed_ids(self, token_ids):
+        completed = []
+        for token_id in token_ids:
+            if token_id == self._start_id:
+                self._call_ids = []
+            elif self._call_ids is None or token_id == self._pad_id:
+                continue
+            elif token_id == self._end_id:
+                function_call = parse_function_call(self.tokenizer.decode(self._call_ids, skip_special_tokens=False))
+                self._call_ids = None
+                if function_call is not None:
+                    completed.append(function_call)
+                    self.calls.append(function_call)
+            else:
+                self._call_ids.append(token_id)
+        return completed
+
+
+class FunctionCallStoppingCriteria(StoppingCriteria):
+    """
+    Parses each row's new tokens as model.generate produces them. on_call(row, call) is
+    called the moment a call closes, and a row stops once it has emitted max_calls calls
+    (max_calls=None never stops early). prompt_length is the padded input length.
+    """
+    def __init__(self, tokenizer, prompt_length, max_calls=1, on_call=None):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.max_calls = max_calls
+        self.on_call = on_call
+        self.parsers = []
+        self._consumed = prompt_length
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if not self.parsers:
+            self.parsers = [FunctionCallTokenParser(self.tokenizer) for _ in range(input_ids.shape[0])]
+        new_ids = input_ids[:, self._consumed:].tolist()
+        self._consumed = input_ids.shape[1]
+        done = []
+        for row, (parser, token_ids) in enumerate(zip(self.parsers, new_ids)):
+            for function_call in parser.feed_ids(token_ids):
+                if self.on_call:
+                    self.on_call(row, function_call)
+            done.append(self.max_calls is not None and len(parser.calls) >= self.max_calls)
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+    @property
+    def calls(self):
+        return [parser.calls for parser in self.parsers]
+
+
+def generate_function_calls(model, tokenizer, prompts, max_calls=1, max_new_tokens=256, on_call=None, **generate_kwargs):
+    """
+    Greedy-decodes a batch of prompts, stopping each row after max_calls calls, and
+    returns the calls per prompt. on_call(row, call) fires while generation is running.
+    """
+    inputs = tokenizer(list(prompts), add_special_tokens=False, padding=True, padding_side="left",
+                       return_tensors="pt").to(next(model.parameters()).device)
+    criteria = FunctionCallStoppingCriteria(tokenizer, inputs["input_ids"].shape[1], max_calls=max_calls, on_call=on_call)
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    generate_kwargs.setdefault("do_sample", False)
+    with torch.inference_mode():
+        model.generate(**inputs, max_new_tokens=max_new_tokens, eos_token_id=stop_token_ids(tokenizer),
+                       pad_token_id=pad_id, stopping_criteria=StoppingCriteriaList([criteria]), **generate_kwargs)
+    return criteria.calls if criteria.parsers else [[] for _ in prompts]
+
+
+def stream_function_calls(model, tokenizer, prompt, max_calls=1, max_new_tokens=256, **generate_kwargs):
+    """
+    Yields the calls for one prompt as they close. Generation runs on a background thread
+    and stops after max_calls calls, at a stop token, or at max_new_tokens.
+    """
+    calls = queue.Queue()
+    finished = object()
+    failure = []
+
+    def run():
+        try:
+            generate_function_calls(model, tokenizer, [prompt], max_calls=max_calls, max_new_tokens=max_new_tokens,
+                                    on_call=lambda row, function_call: calls.put(function_call), **generate_kwargs)
+        except Exception as e:
+            failure.append(e)
+        finally:
+            calls.put(finished)
+
+    worker = threading.Thread(target=run, name="function-call-stream", daemon=True)
+    worker.start()
+    while True:
+        function_call = calls.get()
+        if function_call is finished:
+            break
+        yield function_call
+    worker.join()
+    if failure:
+        raise failure[0]
@@ -0,0 +1,188 @@
+import datetime
+import queue
+import threading
+import time
+import uuid
+import zlib
+
+
+class ActivityIngestionQueue:
+    """
+    Write-behind ingestion for student activities.
+    Activities are accepted into bounded in-process queues and applied to the
+    StudentInteractionAgent instances in batches by background workers.
+
+    - Each student is pinned to one worker shard, so a student's activities are
+      applied in the order they were accepted.
+    - submit() never blocks: when the student's shard is full it returns None and
+      the caller should push back (e.g. HTTP 429).
+    - wait_until_applied() gives read-your-writes for a student: it blocks until
+      everything accepted for that student before the call has been applied, without
+      waiting on activities accepted while it waits.
+    """
+    def __init__(self, get_agent, capacity=1000, workers=2, batch_size=50):
+        """
+        get_agent: callable taking a student_id and returning its StudentInteractionAgent.
+        capacity: total number of activities that may be waiting, split across the worker shards.
+        """
+        if workers < 1 or capacity < workers:
+            raise ValueError("ActivityIngestionQueue needs at least one worker and one queue slot per worker.")
+        self.get_agent = get_agent
+        self.batch_size = batch_size
+        self.capacity = capacity
+        self._shards = [queue.Queue(maxsize=capacity // workers) for _ in range(workers)]
+        self._workers = []
+        self._stop_event = threading.Event()
+
+        # Bookkeeping for read-your-writes and metrics, guarded by _state_changed
+        self._state_changed = threading.Condition()
+        # Per-student sequence numbers: activities submitted, and submissions finished
+        # (applied, failed or rejected). A student's shard is FIFO, so once the finished
+        # count reaches n, every activity whose submit() returned before the n-th began is done.
+        self._submitted_by_student = {}
+        self._finished_by_student = {}
+        self._accepted = 0
+        self._rejected = 0
+        self._applied = 0
+        self._failed = 0
+        self._batches = 0
+        self._last_batch_lag_seconds = 0.0
+
+    def _shard_for(self, student_id):
+        return self._shards[zlib.crc32(str(student_id).encode("utf-8")) % len(self._shards)]
+
+    def start(self):
+        """
+        Starts the background workers. Safe to call more than once.
+        """
+        if self._workers:
+            return
+        self._stop_event.clear()
+        for idx, shard in enumerate(self._shards):
+            worker = threading.Thread(target=self._run_worker, args=(shard,),
+                                      name=f"activity-ingestion-{idx}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        print(f"Activity ingestion queue started with {len(self._workers)} workers.")
+
+    def stop(self, timeout=5):
+        """
+        Stops the workers after they have drained what is already queued.
+        """
+        self._stop_event.set()
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+
+    def submit(self, student_id, activity_type, activity_description, related_topic_id=None, outcome=None):
+        """
+        Accepts an activity for asynchronous logging.
+        Returns the new activity_id, or None if the queue is full.
+        """
+        pending = {
+            "activity_id": uuid.uuid4().hex,
+            "timestamp": datetime.datetime.now().isoformat(),
+            "activity_type": activity_type,
+            "activity_description": activity_description,
+            "related_topic_id": related_topic_id,
+            "outcome": outcome,
+            "enqueued_at": time.monotonic(),
+        }
+        with self._state_changed:
+            # Count it as submitted before a worker can possibly apply it
+            self._submitted_by_student[student_id] = self._submitted_by_student.get(student_id, 0) + 1
+        try:
+            self._shard_for(student_id).put_nowait((student_id, pending))
+        except queue.Full:
+            with self._state_changed:
+                self._finish(student_id, 1)
+                self._rejected += 1
+            return None
+        with self._state_changed:
+            self._accepted += 1
+        return pending["activity_id"]
+
+    def wait_until_applied(self, student_id, timeout=5.0):
+        """
+        Blocks until every activity accepted for student_id before this call has been
+        applied; activities accepted while waiting are not waited for, so steady writes
+        cannot stall a read. Returns False if that did not happen within the timeout.
+        """
+        with self._state_changed:
+            target = self._submitted_by_student.get(student_id, 0)
+            return self._state_changed.wait_for(lambda: self._finished_by_student.get(student_id, 0) >= target, timeout)
+
+    def get_metrics(self):
+        """
+        Returns queue depth, lag and throughput counters.
+        """
+        oldest_age = 0.0
+        now = time.monotonic()
+        for shard in self._shards:
+            with shard.mutex: # Peek at the head of each shard without dequeuing
+                if shard.queue:
+                    oldest_age = max(oldest_age, now - shard.queue[0][1]["enqueued_at"])
+        with self._state_changed:
+            return {
+                "queue_depth": sum(shard.qsize() for shard in self._shards),
+                "queue_capacity": self.capacity,
+                "shard_depths": [shard.qsize() for shard in self._shards],
+                "oldest_pending_age_seconds": round(oldest_age, 6),
+                "last_batch_lag_seconds": round(self._last_batch_lag_seconds, 6),
+                "students_with_pending_writes": sum(
+                    1 for student_id, submitted in self._submitted_by_student.items()
+                    if submitted > self._finished_by_student.get(student_id, 0)),
+                "accepted": self._accepted,
+                "rejected": self._rejected,
+                "applied": self._applied,
+                "failed": self._failed,
+                "batches": self._batches,
+                "workers": len(self._workers),
+            }
+
+    def _finish(self, student_id, count):
+        # Caller must hold _state_changed
+        self._finished_by_student[student_id] = self._finished_by_student.get(student_id, 0) + count
+
+    def _next_batch(self, shard):
+        try:
+            batch = [shard.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(shard.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run_worker(self, shard):
+        while not (self._stop_event.is_set() and shard.empty()):
+            batch = self._next_batch(shard)
+            if batch:
+                self._apply_batch(batch)
+
+    def _apply_batch(self, batch):
+        by_student = {}
+        for student_id, pending in batch:
+            by_student.setdefault(student_id, []).append(pending)
+
+        for student_id, pending_activities in by_student.items():
+            applied = True
+            try:
+                self.get_agent(student_id).log_activities(pending_activities)
+            except Exception as e:
+                # Don't let one bad student kill the worker; the activities are dropped
+                print(f"Error: Could not apply {len(pending_activities)} queued activities for student {student_id}: {e}")
+                applied = False
+            with self._state_changed:
+                self._finish(student_id, len(pending_activities))
+                if applied:
+                    self._applied += len(pending_activities)
+                else:
+                    self._failed += len(pending_activities)
+                self._state_changed.notify_all()
+
+        with self._state_changed:
+            self._batches += 1
+            self._last_batch_lag_seconds = time.monotonic() - batch[0][1]["enqueued_at"]
@@ -0,0 +1,35 @@
+import threading
+import zlib
+
+
+class StripedLock:
+    """
+    A fixed pool of locks shared out by key.
+    Each key (e.g. a student_id) always maps to the same lock, so work on one
+    student is serialized while work on different students mostly proceeds in
+    parallel, without keeping one lock object alive per student forever.
+    """
+    def __init__(self, stripes=64):
+        if stripes < 1:
+            raise ValueError("StripedLock requires at least one stripe.")
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def __len__(self):
+        return len(self._locks)
+
+    def lock_for(self, key):
+        """
+        Returns the lock guarding the given key.
+        crc32 is used instead of hash() so the mapping is stable across processes.
+        """
+        return self._locks[self._index_for(key)]
+
+    def locks_for(self, keys):
+        """
+        Returns the distinct locks guarding the given keys, in stripe order. Acquire
+        them in that order so that two callers locking overlapping keys cannot deadlock.
+        """
+        return [self._locks[index] for index in sorted({self._index_for(key) for key in keys})]
+
+    def _index_for(self, key):
+        return zlib.crc32(str(key).encode("utf-8")) % len(self._locks)
@@ -0,0 +1,241 @@
+import contextlib
+import threading
+
+import numpy as np
+
+from .locking import StripedLock
+from .student_interaction_agent import APPLICATION_ACTIVITY_TYPES
+
+
+class MasteryEngine:
+    """
+    Bayesian knowledge tracing (BKT) over each student's ordered activities, as an
+    alternative to the threshold rules in StudentInteractionAgent.get_strengths_weaknesses.
+
+    State for the whole class lives in NumPy arrays of shape (students, topics):
+    P(topic mastered) and the number of activities seen. Each logged activity
+    updates one cell incrementally; recompute() replays whole activity logs for
+    many students at once, vectorized across students.
+
+    How activities are read as BKT steps:
+    - An activity with an 'outcome' (True/False or a 0-1 score) is an observation;
+      fractional scores blend the correct and incorrect posteriors.
+    - An application activity (quiz, exercise, ...) without an outcome counts as a
+      correct observation, matching the rule-based mode which treats it as positive evidence.
+    - Any other activity (e.g. 'learning') carries no evidence and leaves the estimate
+      unchanged; the learning transition is only applied after observed practice, so
+      reading alone never makes a topic a strength.
+
+    For watched students the engine remembers how much of each activity log it has
+    applied. Listener updates and recompute_class() both work from the log itself under
+    the student's stripe of _student_locks, so an activity is applied exactly once even
+    while a recompute runs, and writes for different students never wait on each other.
+    """
+    def __init__(self, syllabus, p_init=0.2, p_learn=0.15, p_slip=0.1, p_guess=0.2,
+                 strength_threshold=0.85, weakness_threshold=0.5, initial_capacity=64):
+        topics = (syllabus or {}).get("topics", [])
+        self.topic_ids = [topic.get("id") for topic in topics]
+        self.topic_titles = [topic.get("title", "Unknown Topic") for topic in topics]
+        self._topic_index = {topic_id: idx for idx, topic_id in enumerate(self.topic_ids)}
+
+        self.p_init = p_init
+        self.p_learn = p_learn
+        self.p_slip = p_slip
+        self.p_guess = p_guess
+        self.strength_threshold = strength_threshold
+        self.weakness_threshold = weakness_threshold
+
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock() # Serializes recompute_class calls
+        self._student_locks = StripedLock() # Per-student: catch-ups and replays of that student's log
+        self._applied_counts = {} # student_id: number of log entries already applied, for watched students
+        self._student_index = {} # student_id: row in the state arrays
+        self._mastery = np.full((initial_capacity, len(self.topic_ids)), p_init, dtype=np.float64)
+        self._counts = np.zeros((initial_capacity, len(self.topic_ids)), dtype=np.int64)
+
+    # --- BKT step, shared by the incremental and batched paths ---
+
+    def _step(self, p_mastered, outcome):
+        """
+        Applies one BKT step element-wise. outcome is NaN where there is no evidence.
+        """
+        correct = p_mastered * (1 - self.p_slip)
+        correct_posterior = correct / (correct + (1 - p_mastered) * self.p_guess)
+        wrong = p_mastered * self.p_slip
+        wrong_posterior = wrong / (wrong + (1 - p_mastered) * (1 - self.p_guess))
+
+        has_evidence = ~np.isnan(outcome)
+        score = np.where(has_evidence, outcome, 0.0)
+        posterior = score * correct_posterior + (1 - score) * wrong_posterior
+        # Learning transition only after practice; without evidence the estimate stays put
+        return np.where(has_evidence, posterior + (1 - posterior) * self.p_learn, p_mastered)
+
+    @staticmethod
+    def outcome_for(activity):
+        """
+        Returns the observation for an activity: a score in [0, 1], or NaN for no evidence.
+        """
+        outcome = activity.get("outcome")
+        if outcome is not None:
+            return min(max(float(outcome), 0.0), 1.0)
+        if activity.get("activity_type") in APPLICATION_ACTIVITY_TYPES:
+            return 1.0
+        return np.nan
+
+    # --- State management ---
+
+    def _row_for(self, student_id):
+        # Caller must hold _lock
+        row = self._student_index.get(student_id)
+        if row is None:
+            row = len(self._student_index)
+            if row == self._mastery.shape[0]: # Grow by doubling so appends stay amortized O(1)
+                extra = max(row, 1)
+                self._mastery = np.vstack([self._mastery, np.full((extra, self._mastery.shape[1]), self.p_init)])
+                self._counts = np.vstack([self._counts, np.zeros((extra, self._counts.shape[1]), dtype=np.int64)])
+            self._student_index[student_id] = row
+        return row
+
+    def watch_student(self, student_agent):
+        """
+        Attaches the engine to a StudentInteractionAgent: replays its existing log,
+        then updates incrementally on every newly logged activity.
+        """
+        # Listen first: anything logged meanwhile is picked up by the replay or the catch-up after it
+        student_agent.add_activity_listener(self._on_activities_logged)
+        self.recompute_class([student_agent])
+        student_agent.mastery_engine = self # Published last, so mastery reads never see a partial replay
+
+    def _on_activities_logged(self, student_agent, activities):
+        # Apply the unapplied tail of the log rather than `activities`, which may overlap a replay
+        with self._student_locks.lock_for(student_agent.student_id):
+            applied = self._applied_counts.get(student_agent.student_id, 0)
+            new_activities = student_agent.activity_log[applied:]
+            for activity in new_activities:
+                self.update(student_agent.student_id, activity)
+            self._applied_counts[student_agent.student_id] = applied + len(new_activities)
+
+    def update(self, student_id, activity):
+        """
+        Incrementally applies one activity. Activities for topics outside the syllabus are ignored.
+        """
+        topic = self._topic_index.get(activity.get("related_topic_id"))
+        if topic is None:
+            return
+        outcome = np.array([self.outcome_for(activity)])
+        with self._lock:
+            row = self._row_for(student_id)
+            self._mastery[row, topic] = self._step(self._mastery[row, topic:topic + 1], outcome)[0]
+            self._counts[row, topic] += 1
+
+    def recompute(self, activities_by_student):
+        """
+        Rebuilds the state for many students from their full, ordered activity logs.
+        Sequences are padded into (students, steps) arrays and replayed one step at a
+        time for all students together, so the Python loop runs over the longest log
+        rather than over every activity in the class. For watched students use
+        recompute_class(), which keeps the replay in step with the listener updates.
+        """
+        student_ids = list(activities_by_student)
+        if not student_ids:
+            return
+        sequences = []
+        for student_id in student_ids:
+            steps = [(self._topic_index[act.get("related_topic_id")], self.outcome_for(act))
+                     for act in activities_by_student[student_id]
+                     if act.get("related_topic_id") in self._topic_index]
+            sequences.append(steps)
+
+        n_students = len(student_ids)
+        max_steps = max((len(steps) for steps in sequences), default=0)
+        topic_steps = np.zeros((n_students, max_steps), dtype=np.int64)
+        outcome_steps = np.full((n_students, max_steps), np.nan)
+        valid_steps = np.zeros((n_students, max_steps), dtype=bool)
+        for idx, steps in enumerate(sequences):
+            if steps:
+                topic_steps[idx, :len(steps)], outcome_steps[idx, :len(steps)] = zip(*steps)
+                valid_steps[idx, :len(steps)] = True
+
+        mastery = np.full((n_students, len(self.topic_ids)), self.p_init)
+        counts = np.zeros((n_students, len(self.topic_ids)), dtype=np.int64)
+        for step in range(max_steps):
+            rows = np.flatnonzero(valid_steps[:, step])
+            topics = topic_steps[rows, step]
+            mastery[rows, topics] = self._step(mastery[rows, topics], outcome_steps[rows, step])
+            counts[rows, topics] += 1
+
+        with self._lock:
+            target_rows = [self._row_for(student_id) for student_id in student_ids]
+            self._mastery[target_rows] = mastery
+            self._counts[target_rows] = counts
+
+    def recompute_class(self, student_agents):
+        """
+        Batched recomputation for a whole class of StudentInteractionAgent instances.
+        Safe to run while activities are being logged: activities logged after the
+        snapshot are applied by their listener once the replay is done.
+        """
+        with self._sync_lock, contextlib.ExitStack() as stack:
+            # Hold the students' stripes so no catch-up for them runs between snapshot and overwrite
+            for lock in self._student_locks.locks_for(agent.student_id for agent in student_agents):
+                stack.enter_context(lock)
+            logs = {agent.student_id: agent.get_activities() for agent in student_agents}
+            self.recompute(logs)
+            for student_id, log in logs.items():
+                self._applied_counts[student_id] = len(log)
+
+    # --- Reading estimates ---
+
+    def get_mastery(self, student_id):
+        """
+        Returns {topic_title: P(mastered)} for one student.
+        """
+        with self._lock:
+            row = self._student_index.get(student_id)
+            estimates = self._mastery[row].copy() if row is not None else np.full(len(self.topic_ids), self.p_init)
+        return {title: round(float(p), 4) for title, p in zip(self.topic_titles, estimates)}
+
+    def get_class_mastery(self):
+        """
+        Returns the student ids and a copy of the (students, topics) mastery matrix.
+        """
+        with self._lock:
+            student_ids = list(self._student_index)
+            return student_ids, self._mastery[:len(student_ids)].copy()
+
+    def get_strengths_weaknesses(self, student_id):
+        """
+        Same shape as StudentInteractionAgent.get_strengths_weaknesses, plus the raw estimates.
+        """
+        if not self.topic_ids:
+            return {"strengths": [], "weaknesses": [], "message": "Syllabus not loaded or has no topics.", "details": {}}
+        with self._lock:
+            row = self._student_index.get(student_id)
+            if row is None:
+                estimates = np.full(len(self.topic_ids), self.p_init)
+                counts = np.zeros(len(self.topic_ids), dtype=np.int64)
+            else:
+                estimates = self._mastery[row].copy()
+                counts = self._counts[row].copy()
+
+        strengths = []
+        weaknesses = []
+        details = {}
+        for title, p_mastered, count in zip(self.topic_titles, estimates, counts):
+            if count == 0:
+                weaknesses.append(f"{title} (No activity logged)")
+                details[title] = "Weakness: No activities logged for this topic."
+            elif p_mastered >= self.strength_threshold:
+                strengths.append(title)
+                details[title] = f"Strength: Estimated mastery {p_mastered:.2f}."
+            elif p_mastered < self.weakness_threshold:
+                weaknesses.append(f"{title} (Low estimated mastery)")
+                details[title] = f"Weakness: Estimated mastery {p_mastered:.2f}."
+
+        return {
+            "strengths": sorted(strengths),
+            "weaknesses": sorted(weaknesses),
+            "message": "Analysis complete (mastery estimates).",
+            "details": details,
+            "mastery": {title: round(float(p), 4) for title, p in zip(self.topic_titles, estimates)},
+        }
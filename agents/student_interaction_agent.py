@@ -1,11 +1,37 @@
 import json
 import datetime
+import threading
+
+# Activity types that count as applying a topic rather than just reviewing it
+APPLICATION_ACTIVITY_TYPES = ["exercise", "assessment", "quiz", "project"] # Extend as needed
+
+# Thresholds for the rule-based strengths/weaknesses (can be tuned)
+MIN_ACTIVITIES_FOR_STRENGTH = 3
+MIN_LEARNING_ONLY_FOR_WEAKNESS = 2
+
+def classify_topic(activity_count, has_application_activity):
+    """
+    The rule-based verdict for one syllabus topic, as get_strengths_weaknesses decides it:
+    "strength", "weakness" or None. Lets callers re-classify single topics incrementally.
+    """
+    if activity_count == 0:
+        return None # Every syllabus topic appears in the summary, so none reaches the "No activity logged" case
+    if activity_count >= MIN_ACTIVITIES_FOR_STRENGTH and has_application_activity:
+        return "strength"
+    if not has_application_activity:
+        return "weakness" # Primarily review, or low engagement without application
+    return None
 
 class StudentInteractionAgent:
     def __init__(self, student_id, syllabus_path=None):
         self.student_id = student_id
         self.syllabus = None
+        # activity_log is append-only. Writers serialize on _write_lock; readers never
+        # take it and work from a snapshot instead (see _snapshot_activities).
         self.activity_log = []
+        self._write_lock = threading.Lock()
+        self._activity_listeners = [] # Callables notified with each list of newly logged activities
+        self.mastery_engine = None # Set by MasteryEngine.watch_student to enable the 'mastery' analysis mode
         if syllabus_path:
             self.load_syllabus(syllabus_path)
 
@@ -24,29 +50,86 @@ class StudentInteractionAgent:
             print(f"Error: Could not decode JSON from syllabus file {syllabus_path}")
             self.syllabus = {}
 
-    def log_activity(self, activity_type, activity_description, related_topic_id=None):
+    def log_activity(self, activity_type, activity_description, related_topic_id=None, outcome=None):
         """
         Logs a student activity.
+        outcome is optional: True/False or a score between 0 and 1 for graded activities
+        such as quizzes. It is only stored when given.
         """
-        activity = {
-            "student_id": self.student_id,
-            "timestamp": datetime.datetime.now().isoformat(),
-            "activity_type": activity_type,
-            "activity_description": activity_description,
-            "related_topic_id": related_topic_id
-        }
-        self.activity_log.append(activity)
+        with self._write_lock:
+            # Timestamp under the lock so log order always matches timestamp order
+            activity = {
+                "student_id": self.student_id,
+                "timestamp": datetime.datetime.now().isoformat(),
+                "activity_type": activity_type,
+                "activity_description": activity_description,
+                "related_topic_id": related_topic_id
+            }
+            if outcome is not None:
+                activity["outcome"] = outcome
+            self.activity_log.append(activity)
         print(f"Activity logged for student {self.student_id}: {activity_description}")
+        self._notify_activity_listeners([activity])
         return activity
 
+    def log_activities(self, pending_activities):
+        """
+        Logs a batch of activities with a single acquisition of the write lock.
+        Each item is a dict with 'activity_type', 'activity_description' and optionally
+        'related_topic_id', 'outcome', 'timestamp' (when it was accepted) and 'activity_id'.
+        Used by the write-behind ingestion queue.
+        """
+        logged = []
+        with self._write_lock:
+            for pending in pending_activities:
+                activity = {
+                    "student_id": self.student_id,
+                    "timestamp": pending.get("timestamp") or datetime.datetime.now().isoformat(),
+                    "activity_type": pending["activity_type"],
+                    "activity_description": pending["activity_description"],
+                    "related_topic_id": pending.get("related_topic_id")
+                }
+                if pending.get("outcome") is not None:
+                    activity["outcome"] = pending["outcome"]
+                if pending.get("activity_id"):
+                    activity["activity_id"] = pending["activity_id"]
+                logged.append(activity)
+            self.activity_log.extend(logged)
+        print(f"{len(logged)} activities logged for student {self.student_id} in one batch.")
+        self._notify_activity_listeners(logged)
+        return logged
+
+    def add_activity_listener(self, listener):
+        """
+        Registers a callable to be invoked as listener(agent, activities) after activities are logged.
+        Listeners run on the logging thread, outside the write lock, and should be quick.
+        """
+        self._activity_listeners.append(listener)
+
+    def _notify_activity_listeners(self, activities):
+        for listener in list(self._activity_listeners):
+            try:
+                listener(self, activities)
+            except Exception as e:
+                print(f"Error: Activity listener failed for student {self.student_id}: {e}")
+
+    def _snapshot_activities(self):
+        """
+        Returns a point-in-time copy of the activity log without taking the write lock.
+        Slicing a list is atomic in CPython and the log is only ever appended to,
+        so the copy is always a consistent prefix of the log.
+        """
+        return self.activity_log[:]
+
     def get_activities(self, topic_id=None):
         """
         Retrieves logged activities.
         Can be filtered by topic_id.
         """
+        activities = self._snapshot_activities()
         if topic_id:
-            return [activity for activity in self.activity_log if activity.get("related_topic_id") == topic_id]
-        return self.activity_log
+            return [activity for activity in activities if activity.get("related_topic_id") == topic_id]
+        return activities
 
     def get_activity_summary(self):
         """
@@ -56,11 +139,20 @@ class StudentInteractionAgent:
         if not self.syllabus or not self.syllabus.get("topics"):
             return {"error": "Syllabus not loaded or has no topics."}
 
+        # Work from one snapshot so per-topic counts and untagged counts agree,
+        # and bucket it in a single pass instead of rescanning the log per topic.
+        activities_by_topic = {}
+        untagged_activities = []
+        for act in self._snapshot_activities():
+            activities_by_topic.setdefault(act.get("related_topic_id"), []).append(act)
+            if not act.get("related_topic_id"):
+                untagged_activities.append(act)
+
         summary = {}
         for topic in self.syllabus["topics"]:
             topic_id = topic.get("id")
             topic_title = topic.get("title", "Unknown Topic")
-            activities_for_topic = [act for act in self.activity_log if act.get("related_topic_id") == topic_id]
+            activities_for_topic = list(activities_by_topic.get(topic_id, []))
             summary[topic_title] = {
                 "topic_id": topic_id,
                 "activity_count": len(activities_for_topic),
@@ -68,7 +160,6 @@ class StudentInteractionAgent:
             }
 
         # Count activities not linked to any specific topic
-        untagged_activities = [act for act in self.activity_log if not act.get("related_topic_id")]
         if untagged_activities:
             summary["Untagged Activities"] = {
                 "topic_id": None,
@@ -77,7 +168,7 @@ class StudentInteractionAgent:
             }
         return summary
 
-    def get_strengths_weaknesses(self):
+    def get_strengths_weaknesses(self, mode="rules"):
         """
         Rudimentary analysis of strengths and weaknesses based on activity count.
         More sophisticated analysis will be added later.
@@ -85,7 +176,15 @@ class StudentInteractionAgent:
         - A topic with many activities might be a strength (or a struggle if activities are 'attempts').
         - A topic with few activities might be a weakness or simply not yet covered.
         This is highly simplistic for now.
+
+        mode="mastery" delegates to the Bayesian knowledge tracing estimates of the
+        attached MasteryEngine instead (see agents/mastery_engine.py).
         """
+        if mode == "mastery":
+            if self.mastery_engine is None:
+                return {"strengths": [], "weaknesses": [], "message": "Mastery engine not enabled for this student.", "details": {}}
+            return self.mastery_engine.get_strengths_weaknesses(self.student_id)
+
         summary = self.get_activity_summary()
         if "error" in summary:
             return {"strengths": [], "weaknesses": [], "message": summary["error"], "details": {}}
@@ -97,11 +196,6 @@ class StudentInteractionAgent:
         if not self.syllabus or not self.syllabus.get("topics"):
             return {"strengths": [], "weaknesses": [], "message": "Syllabus not loaded or has no topics.", "details": {}}
 
-        # Constants for thresholds (can be tuned)
-        MIN_ACTIVITIES_FOR_STRENGTH = 3
-        MIN_LEARNING_ONLY_FOR_WEAKNESS = 2
-        APPLICATION_ACTIVITY_TYPES = ["exercise", "assessment", "quiz", "project"] # Extend as needed
-
         topics_in_syllabus_details = {
             topic.get("id"): topic.get("title") for topic in self.syllabus.get("topics", [])
         }
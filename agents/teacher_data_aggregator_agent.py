@@ -27,10 +27,12 @@ except ImportError:
 
 
 import json # For the main test block
+import threading
 
 class TeacherDataAggregatorAgent:
     def __init__(self):
         self.student_agents = {} # student_id: StudentInteractionAgent_instance
+        self._registration_lock = threading.Lock() # Lookups stay lock-free; only registration locks
 
     def register_student_agent(self, student_agent_instance):
         """
@@ -40,9 +42,10 @@ class TeacherDataAggregatorAgent:
             print("Error: Attempted to register an object that is not a StudentInteractionAgent.")
             return
 
-        if student_agent_instance.student_id in self.student_agents:
-            print(f"Warning: Student agent for {student_agent_instance.student_id} already registered. Overwriting.")
-        self.student_agents[student_agent_instance.student_id] = student_agent_instance
+        with self._registration_lock:
+            if student_agent_instance.student_id in self.student_agents:
+                print(f"Warning: Student agent for {student_agent_instance.student_id} already registered. Overwriting.")
+            self.student_agents[student_agent_instance.student_id] = student_agent_instance
         print(f"StudentInteractionAgent for student '{student_agent_instance.student_id}' registered.")
 
     def get_student_activity_summary(self, student_id):
@@ -54,14 +57,15 @@ class TeacherDataAggregatorAgent:
             return {"error": f"No student agent found for student_id: {student_id}"}
         return student_agent.get_activity_summary()
 
-    def get_student_strengths_weaknesses(self, student_id):
+    def get_student_strengths_weaknesses(self, student_id, mode="rules"):
         """
         Retrieves the strengths and weaknesses analysis for a specific student.
+        mode is "rules" (default) or "mastery" (Bayesian knowledge tracing estimates).
         """
         student_agent = self.student_agents.get(student_id)
         if not student_agent:
             return {"error": f"No student agent found for student_id: {student_id}"}
-        return student_agent.get_strengths_weaknesses()
+        return student_agent.get_strengths_weaknesses(mode=mode)
 
     def get_all_student_ids(self):
         """
@@ -0,0 +1,181 @@
+import collections
+import json
+import threading
+
+from .locking import StripedLock
+from .student_interaction_agent import APPLICATION_ACTIVITY_TYPES, classify_topic
+
+
+class TeacherEventFeed:
+    """
+    Pushes compact deltas about a teacher's students to live dashboards.
+
+    Two kinds of events are published:
+    - 'activity': a newly logged activity, without the fields the dashboard already knows.
+    - 'classification': a topic whose strength/weakness classification changed for a student.
+
+    Every event gets an increasing id. A bounded history is kept so that a reconnecting
+    client can resume from its Last-Event-ID; if it asks for something older than the
+    history, it receives a 'reset' event and should re-fetch the full summary.
+
+    Classifications are kept incrementally: per student and topic, the activity count and
+    whether an application activity was seen. A write only re-classifies the topics it
+    touched, under that student's stripe lock, so it costs O(new activities) and writes
+    for different students do not wait on each other.
+    """
+    def __init__(self, history_size=1000, max_buffered_per_connection=100):
+        self.max_buffered_per_connection = max_buffered_per_connection
+        self._lock = threading.Lock()
+        self._history = collections.deque(maxlen=history_size)
+        self._next_event_id = 1
+        self._subscriptions = set()
+        # Per-student: serializes classification diffs so concurrent writes publish each change once
+        self._student_locks = StripedLock()
+        self._topic_stats = {} # student_id: {topic_id: [activity_count, has_application_activity]}
+        self._applied_counts = {} # student_id: number of log entries counted in _topic_stats
+        self._classifications = {} # student_id: {topic_title: "strength" | "weakness"}
+
+    def watch_student(self, student_agent):
+        """
+        Starts publishing events for the given StudentInteractionAgent.
+        """
+        student_id = student_agent.student_id
+        with self._student_locks.lock_for(student_id):
+            topics = (student_agent.syllabus or {}).get("topics", [])
+            self._topic_stats[student_id] = {topic.get("id"): [0, False] for topic in topics}
+            self._applied_counts[student_id] = 0
+            self._classifications[student_id] = {}
+            self._update_classifications(student_agent, all_topics=True) # Counts the existing log; publishes nothing
+        student_agent.add_activity_listener(self._on_activities_logged)
+
+    def subscribe(self, last_event_id=None):
+        """
+        Opens a subscription for one connection, replaying history after last_event_id.
+        """
+        subscription = _Subscription(self.max_buffered_per_connection)
+        with self._lock:
+            if last_event_id is not None:
+                oldest_id = self._history[0]["id"] if self._history else self._next_event_id
+                if last_event_id < oldest_id - 1 or last_event_id >= self._next_event_id:
+                    subscription.push(self._make_reset_event("Requested event is no longer buffered."))
+                else:
+                    for event in self._history:
+                        if event["id"] > last_event_id:
+                            subscription.push(event)
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def connection_count(self):
+        with self._lock:
+            return len(self._subscriptions)
+
+    def publish(self, event_type, data):
+        with self._lock:
+            event = {"id": self._next_event_id, "event": event_type, "data": data}
+            self._next_event_id += 1
+            self._history.append(event)
+            for subscription in self._subscriptions:
+                subscription.push(event)
+        return event
+
+    def _make_reset_event(self, reason):
+        # Reset events are per-connection and reuse the latest id so the client resumes from here
+        return {"id": self._next_event_id - 1, "event": "reset", "data": {"reason": reason}}
+
+    def _on_activities_logged(self, student_agent, activities):
+        for activity in activities:
+            self.publish("activity", {
+                "student_id": activity["student_id"],
+                "activity_type": activity["activity_type"],
+                "related_topic_id": activity.get("related_topic_id"),
+                "timestamp": activity["timestamp"],
+            })
+
+        with self._student_locks.lock_for(student_agent.student_id):
+            for topic, before, after in self._update_classifications(student_agent):
+                self.publish("classification", {
+                    "student_id": student_agent.student_id,
+                    "topic": topic,
+                    "from": before,
+                    "to": after,
+                })
+
+    def _update_classifications(self, student_agent, all_topics=False):
+        """
+        Counts the log entries not seen yet and re-classifies the topics they touched.
+        Returns (topic_title, before, after) for each change. Caller holds the student's stripe.
+        """
+        student_id = student_agent.student_id
+        stats = self._topic_stats[student_id]
+        applied = self._applied_counts[student_id]
+        # Read the log's unseen tail rather than the listener's activities, so concurrent
+        # writes are each counted once whatever order their listeners run in
+        new_activities = student_agent.activity_log[applied:]
+        self._applied_counts[student_id] = applied + len(new_activities)
+        touched = set()
+        for activity in new_activities:
+            topic_stats = stats.get(activity.get("related_topic_id"))
+            if topic_stats is None: # Untagged, or not in the syllabus
+                continue
+            topic_stats[0] += 1
+            topic_stats[1] = topic_stats[1] or activity.get("activity_type") in APPLICATION_ACTIVITY_TYPES
+            touched.add(activity.get("related_topic_id"))
+
+        titles = {topic.get("id"): topic.get("title", "Unknown Topic") for topic in student_agent.syllabus.get("topics", [])}
+        classification = self._classifications[student_id]
+        if all_topics:
+            touched = set(stats)
+        changes = []
+        for topic_id in touched:
+            title = titles[topic_id]
+            before, after = classification.get(title), classify_topic(*stats[topic_id])
+            if after is None:
+                classification.pop(title, None)
+            else:
+                classification[title] = after
+            if before != after:
+                changes.append((title, before, after))
+        return sorted(changes)
+
+
+class _Subscription:
+    """
+    Per-connection buffer. It never holds more than max_buffered events: when a slow
+    client falls behind, the oldest events are dropped and a 'reset' is delivered first.
+    """
+    def __init__(self, max_buffered):
+        self._events = collections.deque(maxlen=max_buffered)
+        self._ready = threading.Condition()
+        self._overflowed = False
+
+    def push(self, event):
+        with self._ready:
+            if len(self._events) == self._events.maxlen:
+                self._overflowed = True
+            self._events.append(event)
+            self._ready.notify()
+
+    def next_events(self, timeout):
+        """
+        Waits up to timeout seconds for events; returns an empty list on timeout.
+        """
+        with self._ready:
+            self._ready.wait_for(lambda: self._events, timeout)
+            events = list(self._events)
+            self._events.clear()
+            if self._overflowed and events:
+                self._overflowed = False
+                events.insert(0, {"id": events[0]["id"] - 1, "event": "reset",
+                                  "data": {"reason": "Connection fell behind; some events were dropped."}})
+            return events
+
+
+def format_sse(event):
+    """
+    Serializes one event in text/event-stream format.
+    """
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
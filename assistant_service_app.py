@@ -0,0 +1,154 @@
+from flask import Flask, jsonify, request
+from client.teaching_companion_client import DEFAULT_STUDENT_SERVICE_URL, TeachingCompanionAPIError, TeachingCompanionClient
+from request_profiler import install_request_profiler
+import concurrent.futures
+import os
+import requests
+
+app = Flask(__name__)
+# Opt-in per-request profiling (REQUEST_PROFILING_ENABLED=1); registers nothing when disabled
+request_profiler = install_request_profiler(app, "assistant_service")
+
+# --- Natural-language front end for the student service ---
+# Runs the fine-tuned FunctionGemma model (see FunctionGemma/) on CPU, turns a student's
+# free-text message into one function call and executes it against the student service.
+# The model is loaded once by initialize_assistant_service(); concurrent requests are
+# micro-batched by the engine's worker thread.
+function_calling_engine = None
+student_client = None
+ASSISTANT_TIMEOUT_SECONDS = 30
+
+# Tool declarations shown to the model, in the Mobile Actions dataset format. Every tool
+# maps onto an existing student service endpoint in FUNCTION_HANDLERS below.
+STUDENT_TOOLS = [
+    {"function": {
+        "name": "log_activity",
+        "description": "Logs a learning activity the student has done, such as reading, an exercise or a quiz.",
+        "parameters": {"type": "OBJECT", "properties": {
+            "activity_type": {"type": "STRING", "description": "One of learning, exercise, assessment, quiz, project."},
+            "activity_description": {"type": "STRING", "description": "Short description of what the student did."},
+            "related_topic_id": {"type": "STRING", "description": "Syllabus topic id, if known."},
+        }, "required": ["activity_type", "activity_description"]}}},
+    {"function": {
+        "name": "get_syllabus",
+        "description": "Shows the student's course syllabus and its topics.",
+        "parameters": {"type": "OBJECT", "properties": {}}}},
+    {"function": {
+        "name": "get_dashboard_data",
+        "description": "Shows the student's progress: activity summary, strengths and weaknesses.",
+        "parameters": {"type": "OBJECT", "properties": {}}}},
+]
+
+FUNCTION_HANDLERS = {
+    "log_activity": lambda client, student_id, args: client.log_activity(
+        student_id, args.get("activity_type"), args.get("activity_description"), args.get("related_topic_id")),
+    "get_syllabus": lambda client, student_id, args: client.get_syllabus(student_id),
+    "get_dashboard_data": lambda client, student_id, args: client.get_dashboard_data(student_id),
+}
+
+
+def initialize_assistant_service(model=None, tokenizer=None, model_path=None, quantize=None,
+                                 student_service_url=DEFAULT_STUDENT_SERVICE_URL, **engine_options):
+    """
+    Loads the model (unless one is passed in), starts the function calling engine and
+    connects to the student service. engine_options go to FunctionCallingEngine.
+    """
+    global function_calling_engine, student_client
+    # Imported here so the student and teacher services never pay for torch/transformers
+    from FunctionGemma.inference import FunctionCallingEngine, load_function_calling_model, quantize_int8
+
+    if model is None:
+        model, tokenizer = load_function_calling_model(model_path, quantize=quantize)
+    elif quantize == "int8":
+        model = quantize_int8(model)
+
+    shutdown_assistant_service()
+    function_calling_engine = FunctionCallingEngine(model, tokenizer, STUDENT_TOOLS, **engine_options).start()
+    student_client = TeachingCompanionClient(student_base_url=student_service_url)
+    print(f"Assistant service initialized; student service at {student_service_url}")
+
+
+def shutdown_assistant_service():
+    global function_calling_engine, student_client
+    if function_calling_engine is not None:
+        function_calling_engine.stop()
+        function_calling_engine = None
+    if student_client is not None:
+        student_client.close()
+        student_client = None
+
+
+def execute_function_call(student_id, function_call):
+    """
+    Runs a parsed function call against the student service.
+    Returns (response body, HTTP status).
+    """
+    name = function_call["function"]["name"]
+    handler = FUNCTION_HANDLERS.get(name)
+    if handler is None:
+        return {"error": f"The model called unknown function '{name}'.", "function_call": function_call}, 422
+    try:
+        return {"function_call": function_call, "result": handler(student_client, student_id, function_call["function"]["arguments"])}, 200
+    except TeachingCompanionAPIError as e:
+        # e.g. 400 when the model left out a required argument; pass the student service's answer through
+        return {"error": str(e), "function_call": function_call, "result": e.payload}, e.status_code
+    except requests.exceptions.RequestException as e:
+        return {"error": f"Student service unavailable: {e}", "function_call": function_call}, 502
+
+
+@app.route('/students/<student_id>/assistant', methods=['POST'])
+def ask_assistant(student_id):
+    """
+    Body: {"message": "...", "execute": true}. With execute=false the function call is
+    returned without being run.
+    """
+    if function_calling_engine is None:
+        return jsonify({"error": "Assistant model is not loaded."}), 503
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get("message"), str) or not data["message"].strip():
+        return jsonify({"error": "Missing required field: message"}), 400
+
+    from FunctionGemma.inference import EngineNotRunningError # Already loaded by initialize_assistant_service
+
+    try:
+        result = function_calling_engine.run(data["message"].strip(), timeout=ASSISTANT_TIMEOUT_SECONDS)
+    except concurrent.futures.TimeoutError:
+        return jsonify({"error": "The assistant model timed out."}), 504
+    except EngineNotRunningError as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        print(f"Assistant request for student {student_id} failed: {e}")
+        return jsonify({"error": f"Function calling failed: {e}"}), 500
+
+    metrics = {key: result[key] for key in ("generated_tokens", "batch_size", "latency_seconds", "time_to_first_call_seconds")}
+    response = {"student_id": student_id, "function_call": None, "text": result["text"], "metrics": metrics}
+    if not result["function_calls"]:
+        return jsonify(response)
+    response["function_call"] = result["function_calls"][0]
+    if data.get("execute", True) is False:
+        return jsonify(response)
+    body, status = execute_function_call(student_id, response["function_call"])
+    response.update(body)
+    return jsonify(response), status
+
+
+@app.route('/assistant/metrics', methods=['GET'])
+def get_assistant_metrics():
+    if function_calling_engine is None:
+        return jsonify({"error": "Assistant model is not loaded."}), 503
+    return jsonify(function_calling_engine.get_metrics())
+
+
+if __name__ == '__main__':
+    model_path = os.environ.get("FUNCTIONGEMMA_MODEL_PATH")
+    if not model_path:
+        raise SystemExit("Set FUNCTIONGEMMA_MODEL_PATH to the fine-tuned model directory (the notebook's output_dir).")
+    initialize_assistant_service(
+        model_path=model_path,
+        quantize=os.environ.get("FUNCTIONGEMMA_QUANTIZE") or None,
+        student_service_url=os.environ.get("STUDENT_SERVICE_URL", DEFAULT_STUDENT_SERVICE_URL),
+        batch_size=int(os.environ.get("FUNCTIONGEMMA_BATCH_SIZE", "8")),
+    )
+    print("Assistant service app starting on port 5002.")
+    # threaded so concurrent requests reach the engine together and get batched; no reloader, the model loads once
+    app.run(debug=False, port=5002, threaded=True)
@@ -0,0 +1,519 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import aiohttp
+except ImportError:
+    # Only AsyncTeachingCompanionClient needs aiohttp; the sync client works without it.
+    aiohttp = None
+
+# Python client for student_service_app.py and teacher_service_app.py.
+#
+# - Connections are pooled and kept alive across calls (one session per client).
+# - queue_activity() micro-batches writes: activities are buffered for up to
+#   batch_max_delay seconds (or until batch_size is reached) and sent together to
+#   POST /activities/batch. Batches are sent one at a time, in the order they were queued,
+#   so a student's activities are logged in order.
+# - Transient failures are retried with exponential backoff and jitter, honouring Retry-After.
+#   Reads are retried on connection errors and 429/502/503/504. Writes are retried on
+#   connection errors and on 429/503, where the server has rejected the write; a connection
+#   dropped after the server received a write can therefore log it twice. Items of a batch
+#   rejected with 429/503 are resent with the same backoff; such a retried write can land
+#   after later writes from the same batch.
+# - get_dashboards()/get_summaries() read many students concurrently over the shared pool.
+
+DEFAULT_STUDENT_SERVICE_URL = "http://localhost:5001"
+DEFAULT_TEACHER_SERVICE_URL = "http://localhost:5000"
+RETRYABLE_READ_STATUSES = {429, 502, 503, 504}
+RETRYABLE_WRITE_STATUSES = {429, 503}
+
+
+class TeachingCompanionAPIError(Exception):
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self.payload = payload
+        message = payload.get("error") if isinstance(payload, dict) else payload
+        super().__init__(f"HTTP {status_code}: {message}")
+
+
+class _ClientBase:
+    def __init__(self, student_base_url, teacher_base_url, timeout, max_retries, backoff_factor,
+                 batch_size, batch_max_delay, profile_token):
+        self.student_base_url = student_base_url.rstrip("/")
+        self.teacher_base_url = teacher_base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.batch_size = batch_size
+        self.batch_max_delay = batch_max_delay
+        self.profile_token = profile_token
+
+    def _backoff_seconds(self, attempt, retry_after=None):
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        delay = self.backoff_factor * (2 ** attempt)
+        return delay + random.uniform(0, delay / 2)
+
+    def _should_retry(self, method, status_code, attempt):
+        if attempt >= self.max_retries:
+            return False
+        statuses = RETRYABLE_READ_STATUSES if method == "GET" else RETRYABLE_WRITE_STATUSES
+        return status_code in statuses
+
+    def _resolve_batch_results(self, chunk, results, attempt):
+        """
+        Settles the futures of a sent batch and returns the (payload, future) items the
+        server rejected with a retryable status, to be resent after a backoff.
+        """
+        retry = []
+        for item, result in zip(chunk, results):
+            future = item[1]
+            if future.done():
+                continue
+            if result["status"] < 400:
+                future.set_result(result["activity"])
+            elif result["status"] in RETRYABLE_WRITE_STATUSES and attempt < self.max_retries:
+                retry.append(item)
+            else:
+                future.set_exception(TeachingCompanionAPIError(result["status"], result))
+        return retry
+
+    def _service_url(self, service):
+        return self.student_base_url if service == "student" else self.teacher_base_url
+
+    def _profile_headers(self):
+        return {"X-Profile-Token": self.profile_token} if self.profile_token else {}
+
+    @staticmethod
+    def _activity_payload(activity_type, activity_description, related_topic_id, outcome):
+        payload = {"activity_type": activity_type, "activity_description": activity_description}
+        if related_topic_id is not None:
+            payload["related_topic_id"] = related_topic_id
+        if outcome is not None:
+            payload["outcome"] = outcome
+        return payload
+
+    @staticmethod
+    def _parse_sse_lines(lines):
+        """
+        Turns text/event-stream lines into {'id', 'event', 'data'} dicts; skips comments (heartbeats).
+        """
+        event = {}
+        for line in lines:
+            if line == "":
+                if "data" in event:
+                    yield {"id": event.get("id"), "event": event.get("event", "message"), "data": json.loads(event["data"])}
+                event = {}
+            elif line.startswith(":"):
+                continue
+            else:
+                field, _, value = line.partition(":")
+                value = value[1:] if value.startswith(" ") else value
+                if field == "id":
+                    event["id"] = int(value)
+                elif field in ("event", "data"):
+                    event[field] = event[field] + "\n" + value if field == "data" and "data" in event else value
+
+
+class TeachingCompanionClient(_ClientBase):
+    """
+    Synchronous client with a pooled keep-alive requests.Session.
+    Safe to share between threads. Use as a context manager, or call close().
+    """
+    def __init__(self, student_base_url=DEFAULT_STUDENT_SERVICE_URL, teacher_base_url=DEFAULT_TEACHER_SERVICE_URL,
+                 timeout=5.0, max_retries=3, backoff_factor=0.1, pool_maxsize=20,
+                 batch_size=50, batch_max_delay=0.05, max_workers=8, profile_token=None):
+        super().__init__(student_base_url, teacher_base_url, timeout, max_retries, backoff_factor,
+                         batch_size, batch_max_delay, profile_token)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tc-client")
+        self._batch_lock = threading.Lock()
+        self._send_lock = threading.Lock() # One batch in flight at a time, so batches leave in queued order
+        self._pending = [] # (payload, Future)
+        self._flush_timer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+    def _request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(self._backoff_seconds(attempt))
+                attempt += 1
+                continue
+            if self._should_retry(method, response.status_code, attempt):
+                time.sleep(self._backoff_seconds(attempt, response.headers.get("Retry-After")))
+                attempt += 1
+                continue
+            if response.status_code >= 400:
+                try:
+                    payload = response.json()
+                except ValueError:
+                    payload = response.text
+                raise TeachingCompanionAPIError(response.status_code, payload)
+            return response
+
+    def _get_json(self, service, path, params=None, headers=None):
+        return self._request("GET", f"{self._service_url(service)}{path}", params=params, headers=headers).json()
+
+    # --- Student service ---
+
+    def log_activity(self, student_id, activity_type, activity_description, related_topic_id=None, outcome=None):
+        """
+        Logs one activity immediately. Returns the logged activity (201), or the queued receipt (202).
+        """
+        payload = self._activity_payload(activity_type, activity_description, related_topic_id, outcome)
+        return self._request("POST", f"{self.student_base_url}/students/{student_id}/activities", json=payload).json()
+
+    def log_activities(self, activities):
+        """
+        Sends a list of activity dicts (each with 'student_id') in one request.
+        Returns the per-activity results from POST /activities/batch.
+        """
+        return self._request("POST", f"{self.student_base_url}/activities/batch", json={"activities": activities}).json()["results"]
+
+    def queue_activity(self, student_id, activity_type, activity_description, related_topic_id=None, outcome=None):
+        """
+        Buffers an activity for micro-batching. Returns a concurrent.futures.Future that
+        resolves to the logged activity, or raises TeachingCompanionAPIError.
+        """
+        payload = self._activity_payload(activity_type, activity_description, related_topic_id, outcome)
+        payload["student_id"] = student_id
+        future = Future()
+        with self._batch_lock:
+            self._pending.append((payload, future))
+            batch_full = len(self._pending) >= self.batch_size
+            if not batch_full and self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.batch_max_delay, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+        if batch_full:
+            self.flush()
+        return future
+
+    def flush(self):
+        """
+        Sends every buffered activity now and waits for the results.
+        """
+        with self._send_lock:
+            # Taking the buffer under the send lock keeps batches in the order they were queued
+            with self._batch_lock:
+                pending, self._pending = self._pending, []
+                if self._flush_timer is not None:
+                    self._flush_timer.cancel()
+                    self._flush_timer = None
+            for start in range(0, len(pending), self.batch_size):
+                self._send_batch(pending[start:start + self.batch_size])
+
+    def _send_batch(self, chunk):
+        attempt = 0
+        while chunk:
+            try:
+                results = self.log_activities([payload for payload, _ in chunk])
+            except Exception as e:
+                for _, future in chunk:
+                    future.set_exception(e)
+                return
+            chunk = self._resolve_batch_results(chunk, results, attempt)
+            if chunk:
+                time.sleep(self._backoff_seconds(attempt))
+                attempt += 1
+
+    def get_dashboard_data(self, student_id, analysis=None):
+        params = {"analysis": analysis} if analysis else None
+        return self._get_json("student", f"/students/{student_id}/dashboard_data", params)
+
+    def get_syllabus(self, student_id):
+        return self._get_json("student", f"/students/{student_id}/syllabus")
+
+    def get_ingestion_metrics(self):
+        return self._get_json("student", "/ingestion/metrics")
+
+    def get_dashboards(self, student_ids, analysis=None):
+        """
+        Fetches dashboard data for many students concurrently. Returns {student_id: data}.
+        """
+        futures = {s_id: self._executor.submit(self.get_dashboard_data, s_id, analysis) for s_id in student_ids}
+        return {s_id: future.result() for s_id, future in futures.items()}
+
+    # --- Teacher service ---
+
+    def get_students(self, teacher_id):
+        return self._get_json("teacher", f"/teachers/{teacher_id}/students")
+
+    def get_student_summary(self, teacher_id, student_id):
+        return self._get_json("teacher", f"/teachers/{teacher_id}/students/{student_id}/summary")
+
+    def get_student_strengths_weaknesses(self, teacher_id, student_id, analysis=None):
+        params = {"analysis": analysis} if analysis else None
+        return self._get_json("teacher", f"/teachers/{teacher_id}/students/{student_id}/strengths_weaknesses", params)
+
+    def get_class_mastery(self, teacher_id, recompute=False):
+        params = {"recompute": "true"} if recompute else None
+        return self._get_json("teacher", f"/teachers/{teacher_id}/students/mastery", params)
+
+    def get_summaries(self, teacher_id, student_ids):
+        """
+        Fetches the teacher's summary for many students concurrently. Returns {student_id: data}.
+        """
+        futures = {s_id: self._executor.submit(self.get_student_summary, teacher_id, s_id) for s_id in student_ids}
+        return {s_id: future.result() for s_id, future in futures.items()}
+
+    def stream_events(self, teacher_id, last_event_id=None):
+        """
+        Yields events from the teacher's live feed until the connection closes.
+        Not retried: reconnect with the last event's id to resume.
+        """
+        headers = {"Last-Event-ID": str(last_event_id)} if last_event_id is not None else {}
+        response = self._request("GET", f"{self.teacher_base_url}/teachers/{teacher_id}/students/events",
+                                 headers=headers, stream=True, timeout=(self.timeout, None))
+        with response:
+            yield from self._parse_sse_lines(response.iter_lines(decode_unicode=True))
+
+    # --- Profiles (when the service runs with REQUEST_PROFILING_ENABLED=1) ---
+
+    def list_profiles(self, service="student"):
+        return self._get_json(service, "/_profiles", headers=self._profile_headers())
+
+    def get_profile(self, profile_id, service="student", text=False):
+        """
+        Returns the raw dump bytes, or the rendered pstats summary if text=True.
+        """
+        params = {"format": "text"} if text else None
+        response = self._request("GET", f"{self._service_url(service)}/_profiles/{profile_id}",
+                                 params=params, headers=self._profile_headers())
+        return response.text if text else response.content
+
+
+class AsyncTeachingCompanionClient(_ClientBase):
+    """
+    asyncio client with a pooled keep-alive aiohttp session. Requires aiohttp.
+    Use with 'async with', or await close().
+    """
+    def __init__(self, student_base_url=DEFAULT_STUDENT_SERVICE_URL, teacher_base_url=DEFAULT_TEACHER_SERVICE_URL,
+                 timeout=5.0, max_retries=3, backoff_factor=0.1, pool_maxsize=20,
+                 batch_size=50, batch_max_delay=0.05, max_concurrency=16, profile_token=None):
+        if aiohttp is None:
+            raise ImportError("AsyncTeachingCompanionClient requires aiohttp (pip install aiohttp).")
+        super().__init__(student_base_url, teacher_base_url, timeout, max_retries, backoff_factor,
+                         batch_size, batch_max_delay, profile_token)
+        self.pool_maxsize = pool_maxsize
+        self.max_concurrency = max_concurrency
+        self.session = None # Created lazily so the client can be constructed outside a running loop
+        self._pending = [] # (payload, asyncio.Future)
+        self._flush_task = None
+        self._inflight_flushes = set()
+        self._send_lock = asyncio.Lock() # One batch in flight at a time, so batches leave in queued order
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _session(self):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_maxsize, keepalive_timeout=30),
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self.session
+
+    async def close(self):
+        await self.flush()
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _request(self, method, url, params=None, json_body=None, headers=None, read="json"):
+        attempt = 0
+        while True:
+            try:
+                async with self._session().request(method, url, params=params, json=json_body, headers=headers) as response:
+                    if self._should_retry(method, response.status, attempt):
+                        retry_after = response.headers.get("Retry-After")
+                    elif response.status >= 400:
+                        try:
+                            payload = await response.json(content_type=None)
+                        except ValueError:
+                            payload = await response.text()
+                        raise TeachingCompanionAPIError(response.status, payload)
+                    elif read == "json":
+                        return await response.json()
+                    elif read == "text":
+                        return await response.text()
+                    else:
+                        return await response.read()
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt >= self.max_retries:
+                    raise
+                retry_after = None
+            await asyncio.sleep(self._backoff_seconds(attempt, retry_after))
+            attempt += 1
+
+    async def _get_json(self, service, path, params=None, headers=None):
+        return await self._request("GET", f"{self._service_url(service)}{path}", params=params, headers=headers)
+
+    async def _gather_limited(self, coroutines):
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def limited(coroutine):
+            async with semaphore:
+                return await coroutine
+        return await asyncio.gather(*(limited(c) for c in coroutines))
+
+    # --- Student service ---
+
+    async def log_activity(self, student_id, activity_type, activity_description, related_topic_id=None, outcome=None):
+        payload = self._activity_payload(activity_type, activity_description, related_topic_id, outcome)
+        return await self._request("POST", f"{self.student_base_url}/students/{student_id}/activities", json_body=payload)
+
+    async def log_activities(self, activities):
+        result = await self._request("POST", f"{self.student_base_url}/activities/batch", json_body={"activities": activities})
+        return result["results"]
+
+    async def queue_activity(self, student_id, activity_type, activity_description, related_topic_id=None, outcome=None):
+        """
+        Buffers an activity for micro-batching and waits until its batch has been sent.
+        Returns the logged activity, or raises TeachingCompanionAPIError.
+        """
+        payload = self._activity_payload(activity_type, activity_description, related_topic_id, outcome)
+        payload["student_id"] = student_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((payload, future))
+        if len(self._pending) >= self.batch_size:
+            self._start_flush()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_after_delay())
+        return await future
+
+    async def _flush_after_delay(self):
+        await asyncio.sleep(self.batch_max_delay)
+        self._flush_task = None
+        self._start_flush()
+
+    def _start_flush(self):
+        pending, self._pending = self._pending, []
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if pending:
+            task = asyncio.create_task(self._send_batch(pending))
+            self._inflight_flushes.add(task)
+            task.add_done_callback(self._inflight_flushes.discard)
+
+    async def flush(self):
+        """
+        Sends every buffered activity now and waits for all in-flight batches.
+        """
+        self._start_flush()
+        if self._inflight_flushes:
+            await asyncio.gather(*self._inflight_flushes, return_exceptions=True)
+
+    async def _send_batch(self, pending):
+        # Flush tasks start in creation order and asyncio.Lock wakes waiters first-come first-served
+        async with self._send_lock:
+            for start in range(0, len(pending), self.batch_size):
+                chunk = pending[start:start + self.batch_size]
+                attempt = 0
+                while chunk:
+                    try:
+                        results = await self.log_activities([payload for payload, _ in chunk])
+                    except Exception as e:
+                        for _, future in chunk:
+                            if not future.done():
+                                future.set_exception(e)
+                        break
+                    chunk = self._resolve_batch_results(chunk, results, attempt)
+                    if chunk:
+                        await asyncio.sleep(self._backoff_seconds(attempt))
+                        attempt += 1
+
+    async def get_dashboard_data(self, student_id, analysis=None):
+        params = {"analysis": analysis} if analysis else None
+        return await self._get_json("student", f"/students/{student_id}/dashboard_data", params)
+
+    async def get_syllabus(self, student_id):
+        return await self._get_json("student", f"/students/{student_id}/syllabus")
+
+    async def get_ingestion_metrics(self):
+        return await self._get_json("student", "/ingestion/metrics")
+
+    async def get_dashboards(self, student_ids, analysis=None):
+        student_ids = list(student_ids)
+        results = await self._gather_limited([self.get_dashboard_data(s_id, analysis) for s_id in student_ids])
+        return dict(zip(student_ids, results))
+
+    # --- Teacher service ---
+
+    async def get_students(self, teacher_id):
+        return await self._get_json("teacher", f"/teachers/{teacher_id}/students")
+
+    async def get_student_summary(self, teacher_id, student_id):
+        return await self._get_json("teacher", f"/teachers/{teacher_id}/students/{student_id}/summary")
+
+    async def get_student_strengths_weaknesses(self, teacher_id, student_id, analysis=None):
+        params = {"analysis": analysis} if analysis else None
+        return await self._get_json("teacher", f"/teachers/{teacher_id}/students/{student_id}/strengths_weaknesses", params)
+
+    async def get_class_mastery(self, teacher_id, recompute=False):
+        params = {"recompute": "true"} if recompute else None
+        return await self._get_json("teacher", f"/teachers/{teacher_id}/students/mastery", params)
+
+    async def get_summaries(self, teacher_id, student_ids):
+        student_ids = list(student_ids)
+        results = await self._gather_limited([self.get_student_summary(teacher_id, s_id) for s_id in student_ids])
+        return dict(zip(student_ids, results))
+
+    async def stream_events(self, teacher_id, last_event_id=None):
+        """
+        Async-iterates events from the teacher's live feed until the connection closes.
+        """
+        headers = {"Last-Event-ID": str(last_event_id)} if last_event_id is not None else {}
+        url = f"{self.teacher_base_url}/teachers/{teacher_id}/students/events"
+        async with self._session().get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.timeout)) as response:
+            if response.status >= 400:
+                raise TeachingCompanionAPIError(response.status, await response.json(content_type=None))
+            lines = []
+            async for raw_line in response.content:
+                lines.append(raw_line.decode("utf-8").rstrip("\r\n"))
+                if lines[-1] == "":
+                    for event in self._parse_sse_lines(lines):
+                        yield event
+                    lines = []
+
+    # --- Profiles ---
+
+    async def list_profiles(self, service="student"):
+        return await self._get_json(service, "/_profiles", headers=self._profile_headers())
+
+    async def get_profile(self, profile_id, service="student", text=False):
+        params = {"format": "text"} if text else None
+        return await self._request("GET", f"{self._service_url(service)}/_profiles/{profile_id}",
+                                   params=params, headers=self._profile_headers(), read="text" if text else "bytes")
@@ -0,0 +1,226 @@
+import cProfile
+import collections
+import io
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+
+from flask import abort, g, jsonify, request, send_from_directory
+
+# --- On-demand per-request profiling for the Flask services ---
+# Disabled unless REQUEST_PROFILING_ENABLED=1. When disabled no hooks or routes are
+# registered at all, so requests pay nothing for it.
+#
+# When enabled, a request is profiled only if it asks for it, with the header
+# 'X-Profile: cprofile|sample' or the query flag '?_profile=cprofile|sample'
+# ('1' means cprofile), and only within the sampling limits below. Dumps are written
+# to REQUEST_PROFILING_DIR and listed/served under /_profiles.
+
+PROFILE_MODES = ("cprofile", "sample")
+PROFILE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.-]+$")
+
+
+class RequestProfiler:
+    def __init__(self, service_name, output_dir, token=None, max_per_minute=10,
+                 sample_rate=1.0, max_dumps=50, sample_interval_seconds=0.005):
+        self.service_name = service_name
+        self.output_dir = output_dir
+        self.token = token # If set, requests must also send it as X-Profile-Token
+        self.max_per_minute = max_per_minute
+        self.sample_rate = sample_rate # Fraction of flagged requests actually profiled
+        self.max_dumps = max_dumps
+        self.sample_interval_seconds = sample_interval_seconds
+        self._recent_starts = collections.deque()
+        self._limit_lock = threading.Lock()
+        # cProfile and the stack sampler both observe the whole process; one profile at a time
+        self._active = threading.Lock()
+        os.makedirs(output_dir, exist_ok=True)
+
+    def _authorized(self):
+        return not self.token or request.headers.get("X-Profile-Token") == self.token
+
+    def requested_mode(self):
+        """
+        Returns the profiling mode asked for by the current request, or None.
+        """
+        flag = request.headers.get("X-Profile") or request.args.get("_profile")
+        if not flag:
+            return None
+        mode = "cprofile" if flag == "1" else flag
+        return mode if mode in PROFILE_MODES else None
+
+    def _within_limits(self):
+        if random.random() >= self.sample_rate:
+            return False
+        now = time.monotonic()
+        with self._limit_lock:
+            while self._recent_starts and now - self._recent_starts[0] > 60:
+                self._recent_starts.popleft()
+            if len(self._recent_starts) >= self.max_per_minute:
+                return False
+            self._recent_starts.append(now)
+            return True
+
+    def before_request(self):
+        mode = self.requested_mode()
+        if mode is None or request.path.startswith("/_profiles") or not self._authorized():
+            return
+        if not self._within_limits() or not self._active.acquire(blocking=False):
+            g.profile_skipped = "rate limited or another profile in progress"
+            return
+        if mode == "cprofile":
+            profiler = cProfile.Profile()
+        else:
+            profiler = _StackSampler(threading.get_ident(), self.sample_interval_seconds)
+        g.request_profile = (mode, profiler, time.perf_counter())
+        profiler.enable()
+
+    def after_request(self, response):
+        active = g.pop("request_profile", None)
+        if active is None:
+            if g.get("profile_skipped"):
+                response.headers["X-Profile-Skipped"] = g.profile_skipped
+            return response
+        mode, profiler, started = active
+        try:
+            profiler.disable()
+            elapsed = time.perf_counter() - started
+            profile_id = self._write_dump(mode, profiler, elapsed, response.status_code)
+            response.headers["X-Profile-Id"] = profile_id
+        finally:
+            self._active.release()
+        return response
+
+    def teardown_request(self, exc):
+        # after_request is skipped when the view raises; make sure the profiler is released
+        active = g.pop("request_profile", None)
+        if active is not None:
+            active[1].disable()
+            self._active.release()
+
+    def _write_dump(self, mode, profiler, elapsed, status_code):
+        stamp = time.strftime("%Y%m%dT%H%M%S")
+        extension = "prof" if mode == "cprofile" else "txt"
+        profile_id = f"{self.service_name}-{stamp}-{uuid.uuid4().hex[:8]}.{extension}"
+        path = os.path.join(self.output_dir, profile_id)
+        header = f"{request.method} {request.full_path.rstrip('?')} -> {status_code} in {elapsed * 1000:.1f} ms"
+        if mode == "cprofile":
+            profiler.dump_stats(path)
+            with open(path + ".meta", "w") as f:
+                f.write(header + "\n")
+        else:
+            with open(path, "w") as f:
+                f.write(f"# {header}\n# {profiler.sample_count} samples every {self.sample_interval_seconds * 1000:.1f} ms; folded stacks: count\n")
+                for stack, count in profiler.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+        print(f"Request profile written to {path} ({header})")
+        self._prune_dumps()
+        return profile_id
+
+    def _prune_dumps(self):
+        dumps = sorted((entry for entry in os.scandir(self.output_dir) if not entry.name.endswith(".meta")),
+                       key=lambda entry: entry.stat().st_mtime)
+        for entry in dumps[:-self.max_dumps]:
+            os.remove(entry.path)
+            if os.path.exists(entry.path + ".meta"):
+                os.remove(entry.path + ".meta")
+
+    # --- Retrieval endpoints ---
+
+    def list_profiles(self):
+        if not self._authorized():
+            abort(403)
+        names = sorted((name for name in os.listdir(self.output_dir) if not name.endswith(".meta")), reverse=True)
+        return jsonify({"service": self.service_name, "profiles": names})
+
+    def get_profile(self, profile_id):
+        """
+        Serves a dump. cProfile dumps are binary pstats files (load with pstats.Stats);
+        ?format=text renders the top entries by cumulative time instead.
+        """
+        if not self._authorized():
+            abort(403)
+        if not PROFILE_ID_PATTERN.match(profile_id) or not os.path.exists(os.path.join(self.output_dir, profile_id)):
+            return jsonify({"error": f"Profile {profile_id} not found."}), 404
+        if profile_id.endswith(".prof") and request.args.get("format") == "text":
+            limit = request.args.get("limit", "40")
+            if not limit.isdigit() or int(limit) < 1:
+                return jsonify({"error": "'limit' must be a positive integer."}), 400
+            limit = int(limit)
+            out = io.StringIO()
+            meta_path = os.path.join(self.output_dir, profile_id + ".meta")
+            if os.path.exists(meta_path):
+                with open(meta_path) as f:
+                    out.write(f.read())
+            stats = pstats.Stats(os.path.join(self.output_dir, profile_id), stream=out)
+            stats.sort_stats("cumulative").print_stats(limit)
+            return out.getvalue(), 200, {"Content-Type": "text/plain; charset=utf-8"}
+        return send_from_directory(os.path.abspath(self.output_dir), profile_id)
+
+
+class _StackSampler:
+    """
+    Low-overhead alternative to cProfile: a background thread records the request
+    thread's stack every interval and counts identical stacks (folded-stack format).
+    """
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def enable(self):
+        self._thread = threading.Thread(target=self._run, name="request-stack-sampler", daemon=True)
+        self._thread.start()
+
+    def disable(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+            self.sample_count += 1
+
+
+def install_request_profiler(app, service_name, enabled=None, **options):
+    """
+    Registers the profiling hooks and /_profiles routes on a Flask app if enabled.
+    enabled=None reads REQUEST_PROFILING_ENABLED; other settings come from options or
+    REQUEST_PROFILING_DIR, REQUEST_PROFILING_TOKEN, REQUEST_PROFILING_MAX_PER_MINUTE and
+    REQUEST_PROFILING_SAMPLE_RATE. Returns the RequestProfiler, or None when disabled.
+    """
+    if enabled is None:
+        enabled = os.environ.get("REQUEST_PROFILING_ENABLED") == "1"
+    if not enabled:
+        return None
+
+    options.setdefault("output_dir", os.environ.get("REQUEST_PROFILING_DIR", os.path.join(os.getcwd(), "profiles")))
+    options.setdefault("token", os.environ.get("REQUEST_PROFILING_TOKEN"))
+    options.setdefault("max_per_minute", int(os.environ.get("REQUEST_PROFILING_MAX_PER_MINUTE", "10")))
+    options.setdefault("sample_rate", float(os.environ.get("REQUEST_PROFILING_SAMPLE_RATE", "1.0")))
+    profiler = RequestProfiler(service_name, **options)
+
+    app.before_request(profiler.before_request)
+    app.after_request(profiler.after_request)
+    app.teardown_request(profiler.teardown_request)
+    app.add_url_rule("/_profiles", "list_request_profiles", profiler.list_profiles, methods=["GET"])
+    app.add_url_rule("/_profiles/<profile_id>", "get_request_profile", profiler.get_profile, methods=["GET"])
+    print(f"Request profiling enabled for {service_name}; dumps go to {profiler.output_dir}")
+    return profiler
@@ -1,44 +1,120 @@
 from flask import Flask, request, jsonify
 from agents.student_interaction_agent import StudentInteractionAgent
+from agents.locking import StripedLock
+from agents.ingestion_queue import ActivityIngestionQueue
+from agents.mastery_engine import MasteryEngine
+from request_profiler import install_request_profiler
 import os
 import json
 
 app = Flask(__name__)
+# Opt-in per-request profiling (REQUEST_PROFILING_ENABLED=1); registers nothing when disabled
+request_profiler = install_request_profiler(app, "student_service")
 
 # --- In-memory storage for student agents ---
 # In a real application, you'd have a more robust way to manage and persist these.
 # For MVP, we'll pre-initialize a couple.
 student_agents = {}
+# Guards creation of agents under a threaded server. Lookups of existing agents stay lock-free;
+# only the first request for a student takes the stripe for that student_id.
+student_agent_locks = StripedLock()
+
+# --- Optional write-behind ingestion ---
+# When enabled, POST /activities only enqueues and returns 202; background workers apply
+# activities to the agents in batches. Set STUDENT_SERVICE_INGESTION_MODE=queued to enable it
+# when running this file, or call enable_queued_ingestion() from a launcher or test.
+ingestion_queue = None
+READ_YOUR_WRITES_TIMEOUT_SECONDS = 5.0
+
+# --- Mastery estimation (alternative to the rule-based strengths/weaknesses) ---
+# One engine per course, shared by every student on that syllabus; use ?analysis=mastery to read it.
+# A student is attached on their first mastery read, so writes for everyone else never pay for it.
+mastery_engines = {} # course_name: MasteryEngine
+ANALYSIS_MODES = ("rules", "mastery")
 
 # --- Helper function to get or create student agent ---
 def get_student_agent(student_id):
-    if student_id not in student_agents:
-        # For MVP, assume a common syllabus or specific ones if configured
-        syllabus_filename = "sample_syllabus.json" # Ensure this exists
-        syllabus_path = os.path.join(os.path.dirname(__file__), 'agents', syllabus_filename)
-
-        if not os.path.exists(syllabus_path):
-            # Create a minimal dummy if not found, to prevent crash, but log error
-            print(f"ERROR: Syllabus file {syllabus_path} not found! Creating a placeholder for student {student_id}.")
-            placeholder_syllabus_content = {"course_name": "Placeholder Course - File Missing", "topics": []}
-            # Attempt to create it in the expected location for future runs if possible
-            try:
-                os.makedirs(os.path.join(os.path.dirname(__file__), 'agents'), exist_ok=True)
-                with open(syllabus_path, 'w') as f:
-                    json.dump(placeholder_syllabus_content, f)
-                print(f"Placeholder syllabus created at {syllabus_path}")
-            except Exception as e:
-                print(f"Could not create placeholder syllabus: {e}")
-            # Still initialize agent with a basic structure
-            student_agents[student_id] = StudentInteractionAgent(student_id=student_id)
-            student_agents[student_id].syllabus = placeholder_syllabus_content # Manually set basic syllabus
-        else:
-            student_agents[student_id] = StudentInteractionAgent(student_id=student_id, syllabus_path=syllabus_path)
-            if not student_agents[student_id].syllabus: # If loading failed for other reasons
-                 student_agents[student_id].syllabus = {"course_name": "Placeholder Course - Load Failed", "topics": []}
+    agent = student_agents.get(student_id)
+    if agent is not None:
+        return agent
+    with student_agent_locks.lock_for(student_id):
+        # Re-check: another thread may have created the agent while we waited on the stripe
+        if student_id not in student_agents:
+            student_agents[student_id] = _create_student_agent(student_id)
+    return student_agents[student_id]
 
+def _create_student_agent(student_id):
+    # Builds the agent fully (syllabus included) before get_student_agent publishes it,
+    # so lock-free readers never see a half-initialized agent.
+    # For MVP, assume a common syllabus or specific ones if configured
+    syllabus_filename = "sample_syllabus.json" # Ensure this exists
+    syllabus_path = os.path.join(os.path.dirname(__file__), 'agents', syllabus_filename)
 
-    return student_agents[student_id]
+    if not os.path.exists(syllabus_path):
+        # Create a minimal dummy if not found, to prevent crash, but log error
+        print(f"ERROR: Syllabus file {syllabus_path} not found! Creating a placeholder for student {student_id}.")
+        placeholder_syllabus_content = {"course_name": "Placeholder Course - File Missing", "topics": []}
+        # Attempt to create it in the expected location for future runs if possible
+        try:
+            os.makedirs(os.path.join(os.path.dirname(__file__), 'agents'), exist_ok=True)
+            with open(syllabus_path, 'w') as f:
+                json.dump(placeholder_syllabus_content, f)
+            print(f"Placeholder syllabus created at {syllabus_path}")
+        except Exception as e:
+            print(f"Could not create placeholder syllabus: {e}")
+        # Still initialize agent with a basic structure
+        agent = StudentInteractionAgent(student_id=student_id)
+        agent.syllabus = placeholder_syllabus_content # Manually set basic syllabus
+    else:
+        agent = StudentInteractionAgent(student_id=student_id, syllabus_path=syllabus_path)
+        if not agent.syllabus: # If loading failed for other reasons
+             agent.syllabus = {"course_name": "Placeholder Course - Load Failed", "topics": []}
+    return agent
+
+def enable_mastery_analysis(agent):
+    """
+    Attaches the student to their course's MasteryEngine, replaying their log, unless already attached.
+    """
+    if agent.mastery_engine is not None:
+        return
+    with student_agent_locks.lock_for(agent.student_id):
+        if agent.mastery_engine is not None: # Attached by a concurrent mastery read
+            return
+        course_name = agent.syllabus.get("course_name")
+        engine = mastery_engines.get(course_name)
+        if engine is None:
+            # setdefault keeps this atomic when students of the same course are attached on different stripes
+            engine = mastery_engines.setdefault(course_name, MasteryEngine(agent.syllabus))
+        engine.watch_student(agent)
+
+def enable_queued_ingestion(capacity=1000, workers=2, batch_size=50):
+    global ingestion_queue
+    if ingestion_queue is None:
+        ingestion_queue = ActivityIngestionQueue(get_student_agent, capacity=capacity, workers=workers, batch_size=batch_size)
+        ingestion_queue.start()
+    return ingestion_queue
+
+def disable_queued_ingestion():
+    global ingestion_queue
+    if ingestion_queue is not None:
+        ingestion_queue.stop()
+        ingestion_queue = None
+
+def wait_for_pending_writes(student_id):
+    # Read-your-writes: a student's reads see every activity they had accepted before the read began
+    if ingestion_queue is not None and not ingestion_queue.wait_until_applied(student_id, READ_YOUR_WRITES_TIMEOUT_SECONDS):
+        print(f"Warning: Queued activities for student {student_id} not applied within {READ_YOUR_WRITES_TIMEOUT_SECONDS}s; serving a possibly stale read.")
+
+def validate_activity_payload(data):
+    """
+    Returns an error message for an invalid activity payload, or None if it is valid.
+    """
+    if not all([data.get('activity_type'), data.get('activity_description')]):
+        return "Missing 'activity_type' or 'activity_description'"
+    outcome = data.get('outcome') # Optional: true/false or a score between 0 and 1
+    if outcome is not None and not (isinstance(outcome, (bool, int, float)) and 0 <= outcome <= 1):
+        return "'outcome' must be true, false or a number between 0 and 1"
+    return None
 
 @app.route('/students/<student_id>/activities', methods=['POST'])
 def log_student_activity(student_id):
@@ -50,18 +126,86 @@ def log_student_activity(student_id):
     activity_type = data.get('activity_type')
     activity_description = data.get('activity_description')
     related_topic_id = data.get('related_topic_id')
+    outcome = data.get('outcome')
 
-    if not all([activity_type, activity_description]):
-        return jsonify({"error": "Missing 'activity_type' or 'activity_description'"}), 400
+    error = validate_activity_payload(data)
+    if error:
+        return jsonify({"error": error}), 400
 
-    activity = agent.log_activity(activity_type, activity_description, related_topic_id)
+    if ingestion_queue is not None:
+        activity_id = ingestion_queue.submit(student_id, activity_type, activity_description, related_topic_id, outcome)
+        if activity_id is None:
+            response = jsonify({"error": "Activity ingestion queue is full. Retry later."})
+            response.headers["Retry-After"] = "1"
+            return response, 429
+        return jsonify({"activity_id": activity_id, "student_id": student_id, "status": "queued"}), 202
+
+    activity = agent.log_activity(activity_type, activity_description, related_topic_id, outcome)
     return jsonify(activity), 201
 
+MAX_ACTIVITY_BATCH_SIZE = 500
+
+@app.route('/activities/batch', methods=['POST'])
+def log_activities_batch():
+    """
+    Logs activities for any number of students in one request (used by the client SDK's
+    micro-batching). Body: {"activities": [{"student_id": ..., "activity_type": ..., ...}, ...]}.
+    Responds 200 with one result per activity, in order, each carrying the status code the
+    single-activity endpoint would have returned.
+    """
+    body = request.get_json(silent=True) if request.is_json else None
+    if not isinstance(body, dict) or not isinstance(body.get('activities'), list):
+        return jsonify({"error": "Request must be JSON with an 'activities' list"}), 400
+    activities = body['activities']
+    if len(activities) > MAX_ACTIVITY_BATCH_SIZE:
+        return jsonify({"error": f"At most {MAX_ACTIVITY_BATCH_SIZE} activities per batch"}), 413
+
+    results = [None] * len(activities)
+    valid_by_student = {} # student_id: [(index, payload)], so each agent takes its write lock once
+    for idx, data in enumerate(activities):
+        if not isinstance(data, dict) or not data.get('student_id'):
+            results[idx] = {"status": 400, "error": "Missing 'student_id'"}
+            continue
+        if not isinstance(data['student_id'], str):
+            results[idx] = {"status": 400, "error": "'student_id' must be a string"}
+            continue
+        error = validate_activity_payload(data)
+        if error:
+            results[idx] = {"status": 400, "error": error}
+            continue
+        valid_by_student.setdefault(data['student_id'], []).append((idx, data))
+
+    for student_id, items in valid_by_student.items():
+        if ingestion_queue is not None:
+            for idx, data in items:
+                activity_id = ingestion_queue.submit(student_id, data['activity_type'], data['activity_description'],
+                                                     data.get('related_topic_id'), data.get('outcome'))
+                if activity_id is None:
+                    results[idx] = {"status": 429, "error": "Activity ingestion queue is full. Retry later."}
+                else:
+                    results[idx] = {"status": 202, "activity": {"activity_id": activity_id, "student_id": student_id, "status": "queued"}}
+        else:
+            # Copy only the client-settable fields; timestamps and ids are assigned by the agent
+            pending = [{key: data.get(key) for key in ('activity_type', 'activity_description', 'related_topic_id', 'outcome')}
+                       for _, data in items]
+            logged = get_student_agent(student_id).log_activities(pending)
+            for (idx, _), activity in zip(items, logged):
+                results[idx] = {"status": 201, "activity": activity}
+
+    return jsonify({"results": results})
+
 @app.route('/students/<student_id>/dashboard_data', methods=['GET'])
 def get_student_dashboard_data(student_id):
+    analysis_mode = request.args.get('analysis', 'rules')
+    if analysis_mode not in ANALYSIS_MODES:
+        return jsonify({"error": f"'analysis' must be one of {', '.join(ANALYSIS_MODES)}"}), 400
+
     agent = get_student_agent(student_id)
+    wait_for_pending_writes(student_id)
+    if analysis_mode == "mastery":
+        enable_mastery_analysis(agent)
     summary = agent.get_activity_summary()
-    sw_analysis = agent.get_strengths_weaknesses()
+    sw_analysis = agent.get_strengths_weaknesses(mode=analysis_mode)
 
     # Handle cases where syllabus might not have been loaded correctly by the agent
     if "error" in summary and agent.syllabus and not agent.syllabus.get("topics"):
@@ -89,6 +233,14 @@ def get_student_syllabus(student_id):
         # This case should ideally be handled by get_student_agent creating a placeholder
         return jsonify({"error": "Syllabus not loaded for this student."}), 404
 
+@app.route('/ingestion/metrics', methods=['GET'])
+def get_ingestion_metrics():
+    if ingestion_queue is None:
+        return jsonify({"mode": "inline"})
+    metrics = ingestion_queue.get_metrics()
+    metrics["mode"] = "queued"
+    return jsonify(metrics)
+
 if __name__ == '__main__':
     # Pre-initialize a default student for testing purposes
     print("Initializing default student 'student007' for testing student_service_app...")
@@ -97,5 +249,11 @@ if __name__ == '__main__':
     # You can add more pre-initialized students here if needed for testing:
     # get_student_agent("student008")
 
+    if os.environ.get("STUDENT_SERVICE_INGESTION_MODE") == "queued":
+        enable_queued_ingestion(
+            capacity=int(os.environ.get("STUDENT_SERVICE_INGESTION_CAPACITY", "1000")),
+            workers=int(os.environ.get("STUDENT_SERVICE_INGESTION_WORKERS", "2")),
+        )
+
     print("Student service app starting on port 5001.")
     app.run(debug=True, port=5001)
@@ -1,16 +1,28 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify, request, stream_with_context
 from agents.teacher_console_agent import TeacherConsoleAgent
 from agents.teacher_data_aggregator_agent import TeacherDataAggregatorAgent
 from agents.student_interaction_agent import StudentInteractionAgent
+from agents.teacher_event_feed import TeacherEventFeed, format_sse
+from agents.mastery_engine import MasteryEngine
+from request_profiler import install_request_profiler
 import os
 import json
 
 app = Flask(__name__)
+# Opt-in per-request profiling (REQUEST_PROFILING_ENABLED=1); registers nothing when disabled
+request_profiler = install_request_profiler(app, "teacher_service")
 
 # --- Global instances for the teacher service ---
 # In a real app, managing these instances and their lifecycle would be more sophisticated.
 teacher_aggregator = None
 teacher_console = None
+teacher_event_feed = None
+teacher_mastery_engine = None
+ANALYSIS_MODES = ("rules", "mastery")
+
+# --- Live feed settings ---
+SSE_HEARTBEAT_SECONDS = 15
+SSE_MAX_BUFFERED_EVENTS_PER_CONNECTION = 100
 
 # --- Student data for the teacher service's aggregator ---
 # This will be a separate set of student agent instances from student_service_app.py for now.
@@ -18,9 +30,10 @@ teacher_console = None
 teacher_managed_student_agents = {}
 
 def initialize_teacher_service():
-    global teacher_aggregator, teacher_console
+    global teacher_aggregator, teacher_console, teacher_event_feed, teacher_mastery_engine
 
     teacher_aggregator = TeacherDataAggregatorAgent()
+    teacher_event_feed = TeacherEventFeed(max_buffered_per_connection=SSE_MAX_BUFFERED_EVENTS_PER_CONNECTION)
 
     # --- Initialize and register some student agents for the teacher to see ---
     # These are distinct from any instances managed by student_service_app.py in this MVP model
@@ -38,7 +51,7 @@ def initialize_teacher_service():
             json.dump({"course_name": "Placeholder Course - File Missing", "topics": []}, f)
         print(f"Created placeholder syllabus at {syllabus_path} for teacher_service_app")
 
-
+    teacher_mastery_engine = None
     for s_id in student_ids_for_teacher:
         if s_id not in teacher_managed_student_agents:
             student_agent_instance = StudentInteractionAgent(student_id=s_id, syllabus_path=syllabus_path)
@@ -48,6 +61,10 @@ def initialize_teacher_service():
 
             teacher_managed_student_agents[s_id] = student_agent_instance
             teacher_aggregator.register_student_agent(student_agent_instance)
+            teacher_event_feed.watch_student(student_agent_instance)
+            if teacher_mastery_engine is None: # All of the teacher's students share one syllabus in this MVP
+                teacher_mastery_engine = MasteryEngine(student_agent_instance.syllabus)
+            teacher_mastery_engine.watch_student(student_agent_instance)
 
             # Log some mock activity for these students so the teacher sees something
             if s_id == "student001":
@@ -85,13 +102,73 @@ def get_student_summary_for_teacher(teacher_id, student_id):
 def get_student_strengths_weaknesses_for_teacher(teacher_id, student_id):
     if not teacher_console:
         return jsonify({"error": "Teacher console not initialized"}), 500
+    analysis_mode = request.args.get('analysis', 'rules')
+    if analysis_mode not in ANALYSIS_MODES:
+        return jsonify({"error": f"'analysis' must be one of {', '.join(ANALYSIS_MODES)}"}), 400
 
-    sw_data = teacher_console.aggregator.get_student_strengths_weaknesses(student_id) # Direct call for MVP
+    sw_data = teacher_console.aggregator.get_student_strengths_weaknesses(student_id, mode=analysis_mode) # Direct call for MVP
     if "error" in sw_data and student_id not in teacher_managed_student_agents:
          return jsonify({"error": f"Student {student_id} not managed or found by this teacher service."}), 404
     return jsonify({"teacher_id": teacher_id, "student_id": student_id, "strengths_weaknesses": sw_data})
 
+@app.route('/teachers/<teacher_id>/students/mastery', methods=['GET'])
+def get_class_mastery_for_teacher(teacher_id):
+    """
+    Mastery estimates for every student of the teacher, by topic.
+    ?recompute=true rebuilds all estimates from the activity logs in one batched pass.
+    """
+    if not teacher_console or not teacher_mastery_engine:
+        return jsonify({"error": "Teacher console not initialized"}), 500
+
+    if request.args.get('recompute', '').lower() in ('1', 'true', 'yes'):
+        teacher_mastery_engine.recompute_class(list(teacher_managed_student_agents.values()))
+
+    student_ids, mastery = teacher_mastery_engine.get_class_mastery()
+    return jsonify({
+        "teacher_id": teacher_id,
+        "topics": teacher_mastery_engine.topic_titles,
+        "students": {s_id: [round(float(p), 4) for p in row] for s_id, row in zip(student_ids, mastery)}
+    })
+
+@app.route('/teachers/<teacher_id>/students/events', methods=['GET'])
+def stream_student_events_for_teacher(teacher_id):
+    """
+    Server-sent events feed of compact deltas for the teacher's students:
+    'activity' for each newly logged activity and 'classification' when a topic's
+    strength/weakness verdict changes. Resume with the Last-Event-ID header
+    (or ?last_event_id=); a 'reset' event means the dashboard should re-fetch summaries.
+    """
+    if not teacher_console or not teacher_event_feed:
+        return jsonify({"error": "Teacher console not initialized"}), 500
+
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({"error": "Last-Event-ID must be an integer"}), 400
+
+    subscription = teacher_event_feed.subscribe(last_event_id)
+
+    def generate():
+        try:
+            yield f"retry: {SSE_HEARTBEAT_SECONDS * 1000}\n\n"
+            while True:
+                events = subscription.next_events(timeout=SSE_HEARTBEAT_SECONDS)
+                if not events:
+                    yield ": heartbeat\n\n" # Keeps proxies from closing an idle connection
+                for event in events:
+                    yield format_sse(event)
+        finally:
+            # Runs when the client disconnects and the server closes the generator
+            teacher_event_feed.unsubscribe(subscription)
+
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
 if __name__ == '__main__':
     initialize_teacher_service()
     print("Teacher service app starting on port 5000.")
-    app.run(debug=True, port=5000)
+    # threaded=True (the default) is required: each live feed holds a worker thread open
+    app.run(debug=True, port=5000, threaded=True)
@@ -0,0 +1,161 @@
+"""
+Tiny, randomly initialized stand-ins for FunctionGemma 270M and its tokenizer, built
+locally so the FunctionGemma/ module tests run on CPU without downloading anything.
+The chat template mimics FunctionGemma's format closely enough for prompt/completion
+splitting, tool declarations and <start_function_call> output.
+"""
+import json
+
+import torch
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+from transformers import Gemma3ForCausalLM, Gemma3TextConfig, LogitsProcessor, PreTrainedTokenizerFast
+
+SPECIAL_TOKENS = [
+    "<pad>", "<eos>", "<bos>", "<start_of_turn>", "<end_of_turn>",
+    "<start_function_declaration>", "<end_function_declaration>",
+    "<start_function_call>", "<end_function_call>",
+    "<start_function_response>", "<end_function_response>", "<escape>",
+]
+
+CHAT_TEMPLATE = (
+    "{{ bos_token }}"
+    "{%- for message in messages -%}"
+    "{%- if message.role in ['developer', 'system'] -%}"
+    "{{ '<start_of_turn>developer\\n' + message.content }}"
+    "{%- for tool in tools or [] -%}"
+    "{%- set fn = tool.function if tool.function is defined else tool -%}"
+    "{{ '<start_function_declaration>declaration:' + fn.name + (fn | tojson) + '<end_function_declaration>' }}"
+    "{%- endfor -%}"
+    "{{ '<end_of_turn>\\n' }}"
+    "{%- elif message.role == 'user' -%}"
+    "{{ '<start_of_turn>user\\n' + message.content + '<end_of_turn>\\n' }}"
+    "{%- else -%}"
+    "{{ '<start_of_turn>model\\n' }}"
+    "{%- for call in message.tool_calls or [] -%}"
+    "{{ '<start_function_call>call:' + call.function.name + '{' }}"
+    "{%- for key, value in call.function.arguments.items() -%}"
+    "{{ key + ':<escape>' + value + '<escape>' }}{{ ',' if not loop.last else '' }}"
+    "{%- endfor -%}"
+    "{{ '}<end_function_call>' }}"
+    "{%- endfor -%}"
+    "{{ (message.content or '') + '<end_of_turn>\\n' }}"
+    "{%- endif -%}"
+    "{%- endfor -%}"
+    "{%- if add_generation_prompt -%}{{ '<start_of_turn>model\\n' }}{%- endif -%}"
+)
+
+TOOLS = [
+    {"function": {"name": "log_activity", "description": "Logs a learning activity for the student.",
+                  "parameters": {"type": "OBJECT", "properties": {
+                      "activity_type": {"type": "STRING"}, "activity_description": {"type": "STRING"},
+                      "related_topic_id": {"type": "STRING"}}, "required": ["activity_type", "activity_description"]}}},
+    {"function": {"name": "get_syllabus", "description": "Shows the student's syllabus.",
+                  "parameters": {"type": "OBJECT", "properties": {}}}},
+]
+
+DEVELOPER_MESSAGE = "Current date and time given in YYYY-MM-DDTHH:MM:SS format: 2024-11-15T05:59:00. You are a model that can do function calling with the following functions"
+
+
+def build_tiny_tokenizer():
+    byte_alphabet = pre_tokenizers.ByteLevel.alphabet()
+    vocab = {token: idx for idx, token in enumerate(SPECIAL_TOKENS + sorted(byte_alphabet))}
+    backend = Tokenizer(models.BPE(vocab=vocab, merges=[]))
+    backend.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False, use_regex=False)
+    backend.decoder = decoders.ByteLevel()
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=backend, bos_token="<bos>", eos_token="<eos>",
+                                        pad_token="<pad>", additional_special_tokens=SPECIAL_TOKENS[3:])
+    tokenizer.chat_template = CHAT_TEMPLATE
+    tokenizer.padding_side = "left"
+    return tokenizer
+
+
+def build_tiny_model(tokenizer, seed=0):
+    torch.manual_seed(seed)
+    config = Gemma3TextConfig(
+        vocab_size=len(tokenizer), hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+        num_attention_heads=2, num_key_value_heads=1, head_dim=16, sliding_window=64,
+        max_position_embeddings=2048, pad_token_id=tokenizer.pad_token_id,
+        bos_token_id=tokenizer.bos_token_id, eos_token_id=tokenizer.eos_token_id)
+    model = Gemma3ForCausalLM(config)
+    model.eval()
+    return model
+
+
+def make_rows(count, split="eval"):
+    """
+    Rows in the Mobile Actions dataset layout: {'text': json.dumps({'metadata', 'tools', 'messages'})}.
+    Prompt lengths vary so length bucketing has something to do.
+    """
+    rows = []
+    for idx in range(count):
+        description = "read chapter " + "and notes " * (idx % 7) + str(idx)
+        if idx % 4 == 3:
+            assistant = {"role": "assistant", "content": "Keep going, you are doing well!"}
+        elif idx % 4 == 2:
+            assistant = {"role": "assistant", "tool_calls": [{"function": {"name": "get_syllabus", "arguments": {}}}]}
+        else:
+            assistant = {"role": "assistant", "tool_calls": [{"function": {"name": "log_activity", "arguments": {
+                "activity_type": "learning", "activity_description": description}}}]}
+        rows.append({"text": json.dumps({
+            "metadata": split,
+            "tools": TOOLS,
+            "messages": [
+                {"role": "developer", "content": DEVELOPER_MESSAGE},
+                {"role": "user", "content": f"I {description}"},
+                assistant,
+            ],
+        })})
+    return rows
+
+
+class ScriptedLogitsProcessor(LogitsProcessor):
+    """
+    Forces generation to follow a scripted completion per row, so the random tiny model
+    "answers" with real function calls. Once a row's script runs out it emits <eos>.
+    """
+    def __init__(self, tokenizer, completions, prompt_length):
+        self.scripts = [tokenizer(text, add_special_tokens=False)["input_ids"] for text in completions]
+        self.prompt_length = prompt_length
+        self.eos_token_id = tokenizer.eos_token_id
+
+    def __call__(self, input_ids, scores):
+        step = input_ids.shape[1] - self.prompt_length
+        forced = torch.full_like(scores, float("-inf"))
+        for row, script in enumerate(self.scripts):
+            forced[row, script[step] if step < len(script) else self.eos_token_id] = 0.0
+        return forced
+
+
+class ForcedCompletionLogitsProcessor(LogitsProcessor):
+    """
+    Stateless variant of ScriptedLogitsProcessor that can be reused across generate calls:
+    each row is forced to continue `completion` from the longest part of it the row already
+    ends with. `completion` may be a callable taking the text of the row's last user turn,
+    to answer different messages differently.
+    """
+    def __init__(self, tokenizer, completion):
+        self.tokenizer = tokenizer
+        self.completion = completion
+        self.eos_token_id = tokenizer.eos_token_id
+        self.turn_id = tokenizer.convert_tokens_to_ids("<start_of_turn>")
+        self._scripts = {}
+
+    def _script(self, ids):
+        if not callable(self.completion):
+            key = None
+        else:
+            # The last user turn sits between the last two <start_of_turn> tokens
+            turns = [idx for idx in range(len(ids) - 1, -1, -1) if ids[idx] == self.turn_id][:2]
+            key = tuple(ids[turns[-1]:turns[0]])
+        if key not in self._scripts:
+            text = self.completion(self.tokenizer.decode(list(key))) if callable(self.completion) else self.completion
+            self._scripts[key] = self.tokenizer(text, add_special_tokens=False)["input_ids"] + [self.eos_token_id]
+        return self._scripts[key]
+
+    def __call__(self, input_ids, scores):
+        forced = torch.full_like(scores, float("-inf"))
+        for row, ids in enumerate(input_ids.tolist()):
+            script = self._script(ids)
+            done = next(k for k in range(min(len(script) - 1, len(ids)), -1, -1) if k == 0 or ids[-k:] == script[:k])
+            forced[row, script[done]] = 0.0
+        return forced
@@ -0,0 +1,13 @@
+"""
+Helpers shared by the in-process test modules.
+"""
+import contextlib
+import io
+import os
+
+SYLLABUS_PATH = os.path.join(os.path.dirname(__file__), '..', 'agents', 'sample_syllabus.json')
+
+
+def quiet():
+    # The agents and services print on every logged activity; keep test output readable
+    return contextlib.redirect_stdout(io.StringIO())
@@ -0,0 +1,135 @@
+import unittest
+import threading
+import time
+
+import student_service_app
+from agents.student_interaction_agent import StudentInteractionAgent
+from tests.helpers import SYLLABUS_PATH, quiet
+
+# Unlike test_api_endpoints.py, these tests run in-process and need no running services.
+
+
+def run_threads(target, count, *args):
+    threads = [threading.Thread(target=target, args=(idx,) + args) for idx in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class TestAgentConcurrency(unittest.TestCase):
+
+    def setUp(self):
+        student_service_app.student_agents.clear()
+
+    def test_01_concurrent_writes_lose_no_activities(self):
+        writers, writes_per_thread = 8, 250
+        student_ids = [f"stress_student_{i}" for i in range(4)]
+
+        def writer(idx):
+            for n in range(writes_per_thread):
+                agent = student_service_app.get_student_agent(student_ids[n % len(student_ids)])
+                agent.log_activity("exercise", f"writer {idx} activity {n}", "sci_topic_01")
+
+        with quiet():
+            run_threads(writer, writers)
+
+        total = sum(len(student_service_app.student_agents[s].get_activities()) for s in student_ids)
+        self.assertEqual(total, writers * writes_per_thread)
+        for student_id in student_ids:
+            timestamps = [a["timestamp"] for a in student_service_app.student_agents[student_id].get_activities()]
+            self.assertEqual(timestamps, sorted(timestamps))
+
+    def test_02_get_student_agent_creates_one_agent_per_student(self):
+        created = []
+        original_create = student_service_app._create_student_agent
+
+        def slow_create(student_id):
+            created.append(student_id)
+            time.sleep(0.05) # Widen the check-then-insert window
+            return original_create(student_id)
+
+        barrier = threading.Barrier(16)
+        results = [None] * 16
+
+        def worker(idx):
+            barrier.wait()
+            results[idx] = student_service_app.get_student_agent("racing_student")
+
+        student_service_app._create_student_agent = slow_create
+        try:
+            with quiet():
+                run_threads(worker, 16)
+        finally:
+            student_service_app._create_student_agent = original_create
+
+        self.assertEqual(created, ["racing_student"])
+        self.assertTrue(all(agent is results[0] for agent in results))
+
+    def test_03_summary_is_a_consistent_snapshot(self):
+        with quiet():
+            agent = StudentInteractionAgent("snapshot_student", syllabus_path=SYLLABUS_PATH)
+        stop = threading.Event()
+
+        def writer():
+            n = 0
+            with quiet():
+                while not stop.is_set() and n < 20000:
+                    # Alternate tagged and untagged, so any prefix has counts within one of each other
+                    agent.log_activity("learning", f"activity {n}", "sci_topic_02" if n % 2 == 0 else None)
+                    n += 1
+
+        writer_thread = threading.Thread(target=writer)
+        writer_thread.start()
+        try:
+            for _ in range(200):
+                summary = agent.get_activity_summary()
+                tagged = summary["Living Organisms"]["activity_count"]
+                untagged = summary.get("Untagged Activities", {}).get("activity_count", 0)
+                self.assertIn(tagged - untagged, (0, 1))
+                self.assertEqual(tagged, len(summary["Living Organisms"]["activities"]))
+        finally:
+            stop.set()
+            writer_thread.join()
+
+    def test_04_reads_do_not_wait_on_the_write_lock(self):
+        with quiet():
+            agent = StudentInteractionAgent("lock_free_student", syllabus_path=SYLLABUS_PATH)
+            agent.log_activity("quiz", "Quiz on cells", "sci_topic_02")
+        finished = threading.Event()
+
+        def reader():
+            agent.get_activity_summary()
+            agent.get_strengths_weaknesses()
+            finished.set()
+
+        with agent._write_lock: # Simulate a writer holding the lock indefinitely
+            threading.Thread(target=reader).start()
+            self.assertTrue(finished.wait(timeout=2), "Summary read blocked on the write lock.")
+
+    def test_05_read_throughput_with_more_threads(self):
+        with quiet():
+            agent = StudentInteractionAgent("throughput_student", syllabus_path=SYLLABUS_PATH)
+            for n in range(200):
+                agent.log_activity("exercise", f"activity {n}", f"sci_topic_0{n % 4 + 1}")
+
+        def measure(thread_count, duration=0.3):
+            counts = [0] * thread_count
+            deadline = time.perf_counter() + duration
+
+            def reader(idx):
+                while time.perf_counter() < deadline:
+                    agent.get_activity_summary()
+                    counts[idx] += 1
+
+            run_threads(reader, thread_count)
+            return sum(counts) / duration
+
+        throughput = {threads: measure(threads) for threads in (1, 2, 4)}
+        # Reads share no lock, so adding readers must not collapse aggregate throughput.
+        # With the GIL it stays roughly flat; on a free-threaded build it scales with cores.
+        self.assertGreater(throughput[4], 0.5 * throughput[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
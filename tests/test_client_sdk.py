@@ -0,0 +1,274 @@
+import unittest
+import asyncio
+import threading
+import time
+
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+
+import student_service_app
+import teacher_service_app
+from client.teaching_companion_client import (AsyncTeachingCompanionClient, TeachingCompanionAPIError,
+                                              TeachingCompanionClient)
+from tests.helpers import quiet
+
+# Runs both services on ephemeral ports inside the test process; nothing needs to be started by hand.
+TEACHER_ID = "teacher01"
+
+
+def serve(app):
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def make_flaky_app(failures):
+    """
+    Returns 503 (with Retry-After: 0) for the first `failures` calls, then 200.
+    """
+    app = Flask("flaky")
+    state = {"calls": 0}
+
+    @app.route('/students/<student_id>/syllabus')
+    def syllabus(student_id):
+        state["calls"] += 1
+        if state["calls"] <= failures:
+            return jsonify({"error": "busy"}), 503, {"Retry-After": "0"}
+        return jsonify({"course_name": "Flaky Course", "topics": []})
+
+    return app, state
+
+
+def make_batch_app(rejections, first_call_delay=0.0):
+    """
+    /activities/batch that records every item it receives and answers 429 for the first
+    `rejections` items sent, the way the queued student service does when its queue is full.
+    The first call is slowed down by first_call_delay, so a batch sent alongside it overtakes it.
+    """
+    app = Flask("batching")
+    state = {"received": [], "rejected": 0, "calls": 0}
+
+    @app.route('/activities/batch', methods=['POST'])
+    def batch():
+        state["calls"] += 1
+        if state["calls"] == 1:
+            time.sleep(first_call_delay)
+        results = []
+        for activity in request.get_json()["activities"]:
+            if state["rejected"] < rejections:
+                state["rejected"] += 1
+                results.append({"status": 429, "error": "Activity ingestion queue is full. Retry later."})
+            else:
+                state["received"].append(activity["activity_description"])
+                results.append({"status": 202, "activity": {"activity_id": activity["activity_description"], "status": "queued"}})
+        return jsonify({"results": results})
+
+    return app, state
+
+
+class ServiceFixture(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        student_service_app.student_agents.clear()
+        teacher_service_app.teacher_managed_student_agents.clear()
+        with quiet():
+            teacher_service_app.initialize_teacher_service()
+        cls.student_server, cls.student_url = serve(student_service_app.app)
+        cls.teacher_server, cls.teacher_url = serve(teacher_service_app.app)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.student_server.shutdown()
+        cls.teacher_server.shutdown()
+
+    def setUp(self):
+        self._quiet = quiet()
+        self._quiet.__enter__()
+
+    def tearDown(self):
+        self._quiet.__exit__(None, None, None)
+
+
+class TestSyncClient(ServiceFixture):
+
+    def setUp(self):
+        super().setUp()
+        self.client = TeachingCompanionClient(self.student_url, self.teacher_url, batch_max_delay=0.02)
+
+    def tearDown(self):
+        self.client.close()
+        super().tearDown()
+
+    def test_01_student_routes(self):
+        self.assertIn("topics", self.client.get_syllabus("sdk_student"))
+        activity = self.client.log_activity("sdk_student", "quiz", "SDK quiz", "sci_topic_01", outcome=True)
+        self.assertEqual(activity["activity_description"], "SDK quiz")
+        dashboard = self.client.get_dashboard_data("sdk_student", analysis="mastery")
+        self.assertIn("mastery", dashboard["strengths_weaknesses"])
+        self.assertEqual(self.client.get_ingestion_metrics()["mode"], "inline")
+
+    def test_02_teacher_routes(self):
+        self.assertIn("student001", self.client.get_students(TEACHER_ID)["student_ids"])
+        self.assertIn("summary", self.client.get_student_summary(TEACHER_ID, "student001"))
+        self.assertIn("strengths_weaknesses", self.client.get_student_strengths_weaknesses(TEACHER_ID, "student001"))
+        self.assertIn("student001", self.client.get_class_mastery(TEACHER_ID, recompute=True)["students"])
+        with self.assertRaises(TeachingCompanionAPIError) as ctx:
+            self.client.get_student_summary(TEACHER_ID, "nobody")
+        self.assertEqual(ctx.exception.status_code, 404)
+
+    def test_03_micro_batching(self):
+        sent = []
+        original_request = self.client.session.request
+
+        def counting_request(method, url, **kwargs):
+            sent.append(url)
+            return original_request(method, url, **kwargs)
+
+        self.client.session.request = counting_request
+        futures = [self.client.queue_activity(f"batch_student_{n % 3}", "exercise", f"Exercise {n}", "sci_topic_02")
+                   for n in range(25)]
+        results = [future.result(timeout=5) for future in futures]
+
+        self.assertEqual([r["activity_description"] for r in results], [f"Exercise {n}" for n in range(25)])
+        self.assertLessEqual(len(sent), 2) # 25 writes, one or two batch requests
+        self.assertTrue(all(url.endswith("/activities/batch") for url in sent))
+        bad = self.client.queue_activity("batch_student_0", "exercise", "", "sci_topic_02")
+        self.client.flush()
+        with self.assertRaises(TeachingCompanionAPIError):
+            bad.result(timeout=5)
+
+    def test_04_concurrent_multi_student_reads(self):
+        student_ids = [f"reader_{n}" for n in range(12)]
+        dashboards = self.client.get_dashboards(student_ids)
+        self.assertEqual(set(dashboards), set(student_ids))
+        self.assertEqual(dashboards["reader_3"]["student_id"], "reader_3")
+        summaries = self.client.get_summaries(TEACHER_ID, ["student001", "student002"])
+        self.assertEqual(summaries["student002"]["student_id"], "student002")
+
+    def test_05_stream_events(self):
+        events = self.client.stream_events(TEACHER_ID, last_event_id=0)
+        first = next(events)
+        events.close()
+        self.assertEqual(first["event"], "activity")
+        self.assertEqual(first["id"], 1)
+
+    def test_06_retries_with_backoff(self):
+        app, state = make_flaky_app(failures=2)
+        server, url = serve(app)
+        try:
+            with TeachingCompanionClient(url, url, backoff_factor=0.01) as client:
+                self.assertEqual(client.get_syllabus("anyone")["course_name"], "Flaky Course")
+                client.get_syllabus("anyone")
+            self.assertEqual(state["calls"], 4)
+        finally:
+            server.shutdown()
+
+        app, state = make_flaky_app(failures=1)
+        server, url = serve(app)
+        try:
+            with TeachingCompanionClient(url, url, max_retries=0) as client:
+                with self.assertRaises(TeachingCompanionAPIError) as ctx:
+                    client.get_syllabus("anyone")
+            self.assertEqual(ctx.exception.status_code, 503)
+        finally:
+            server.shutdown()
+
+    def test_07_batched_writes_retry_rejected_items(self):
+        app, state = make_batch_app(rejections=3)
+        server, url = serve(app)
+        try:
+            with TeachingCompanionClient(url, url, backoff_factor=0.01, batch_max_delay=0.01) as client:
+                futures = [client.queue_activity("s", "quiz", f"Quiz {n}") for n in range(5)]
+                self.assertEqual([f.result(timeout=5)["activity_id"] for f in futures], [f"Quiz {n}" for n in range(5)])
+            with TeachingCompanionClient(url, url, max_retries=0, batch_max_delay=0.01) as client:
+                state["rejected"] = 2
+                future = client.queue_activity("s", "quiz", "Rejected")
+                with self.assertRaises(TeachingCompanionAPIError) as ctx:
+                    future.result(timeout=5)
+            self.assertEqual(ctx.exception.status_code, 429)
+        finally:
+            server.shutdown()
+
+    def test_08_batches_leave_in_queued_order(self):
+        app, state = make_batch_app(rejections=0, first_call_delay=0.3)
+        server, url = serve(app)
+        try:
+            with TeachingCompanionClient(url, url, batch_size=5, batch_max_delay=0.01) as client:
+                futures = [client.queue_activity("s", "quiz", f"Quiz {n}") for n in range(3)]
+                time.sleep(0.05) # The timer's batch is now in flight
+                futures += [client.queue_activity("s", "quiz", f"Quiz {n}") for n in range(3, 8)] # Fills a batch
+                for future in futures:
+                    future.result(timeout=5)
+            self.assertEqual(state["received"], [f"Quiz {n}" for n in range(8)])
+        finally:
+            server.shutdown()
+
+    def test_09_batch_endpoint_validation(self):
+        app_client = student_service_app.app.test_client()
+        for body in ([1, 2], "x", {"activities": "x"}):
+            self.assertEqual(app_client.post("/activities/batch", json=body).status_code, 400)
+        response = app_client.post("/activities/batch", json={"activities": [
+            {"student_id": ["s"], "activity_type": "quiz", "activity_description": "Quiz"},
+            {"student_id": 7, "activity_type": "quiz", "activity_description": "Quiz"},
+            {"student_id": "batch_student_9", "activity_type": "quiz", "activity_description": "Quiz"},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result["status"] for result in response.get_json()["results"]], [400, 400, 201])
+
+
+class TestAsyncClient(ServiceFixture):
+
+    def test_01_routes_batching_and_concurrent_reads(self):
+        async def scenario():
+            async with AsyncTeachingCompanionClient(self.student_url, self.teacher_url, batch_max_delay=0.02) as client:
+                self.assertIn("topics", await client.get_syllabus("async_student"))
+                logged = await asyncio.gather(*(
+                    client.queue_activity("async_student", "quiz", f"Quiz {n}", "sci_topic_03", outcome=n % 2 == 0)
+                    for n in range(30)))
+                self.assertEqual([a["activity_description"] for a in logged], [f"Quiz {n}" for n in range(30)])
+                dashboards = await client.get_dashboards(["async_student", "async_other"])
+                summary = dashboards["async_student"]["activity_summary"]
+                self.assertEqual(summary["Earth and Space"]["activity_count"], 30)
+                self.assertIn("student_ids", await client.get_students(TEACHER_ID))
+                self.assertIn("strengths_weaknesses",
+                              await client.get_student_strengths_weaknesses(TEACHER_ID, "student001", analysis="mastery"))
+                async for event in client.stream_events(TEACHER_ID, last_event_id=0):
+                    self.assertEqual(event["event"], "activity")
+                    break
+
+        asyncio.run(scenario())
+
+    def test_02_retries(self):
+        app, state = make_flaky_app(failures=2)
+        server, url = serve(app)
+
+        async def scenario():
+            async with AsyncTeachingCompanionClient(url, url, backoff_factor=0.01) as client:
+                return await client.get_syllabus("anyone")
+
+        try:
+            self.assertEqual(asyncio.run(scenario())["course_name"], "Flaky Course")
+            self.assertEqual(state["calls"], 3)
+        finally:
+            server.shutdown()
+
+    def test_03_batched_writes_retry_and_keep_order(self):
+        app, state = make_batch_app(rejections=2, first_call_delay=0.1)
+        server, url = serve(app)
+
+        async def scenario():
+            async with AsyncTeachingCompanionClient(url, url, backoff_factor=0.01, batch_size=4, batch_max_delay=0.01) as client:
+                return await asyncio.gather(*(client.queue_activity("s", "quiz", f"Quiz {n}") for n in range(10)))
+
+        try:
+            self.assertEqual([r["activity_id"] for r in asyncio.run(scenario())], [f"Quiz {n}" for n in range(10)])
+            self.assertEqual(sorted(state["received"]), sorted(f"Quiz {n}" for n in range(10)))
+            # Batches after the first arrive in queued order
+            self.assertEqual(state["received"][-6:], [f"Quiz {n}" for n in range(4, 10)])
+        finally:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import unittest
+import json
+import os
+import tempfile
+
+from FunctionGemma.evaluation import (apply_format, extract_function_call, generate_outputs, get_scored_data_frame,
+                                      length_bucketed_batches, load_checkpoint, review, score_logs)
+from tests.functiongemma_fixtures import build_tiny_model, build_tiny_tokenizer, make_rows
+from tests.helpers import quiet
+
+# Runs on CPU against a tiny randomly initialized Gemma 3 model; nothing is downloaded.
+
+
+def call(name, **arguments):
+    return {"function": {"name": name, "arguments": arguments}}
+
+
+class TestEvaluationHelpers(unittest.TestCase):
+
+    def test_01_extract_function_call(self):
+        output = ("<start_function_call>call:log_activity{activity_type:<escape>quiz<escape>,"
+                  "activity_description:<escape>Fractions, part 2<escape>}<end_function_call>"
+                  "<start_function_call>call:get_syllabus{}<end_function_call>")
+        self.assertEqual(extract_function_call(output), [
+            call("log_activity", activity_type="quiz", activity_description="Fractions, part 2"),
+            call("get_syllabus")])
+        self.assertEqual(extract_function_call("<start_function_call>oops<end_function_call>"), [])
+
+    def test_02_length_bucketed_batches(self):
+        lengths = [5, 50, 7, 48, 6, 49]
+        self.assertEqual(length_bucketed_batches(lengths, batch_size=3), [[1, 5, 3], [2, 4, 0]])
+        # Token budget: 2 rows of 50 fit in 120, 3 do not
+        batches = length_bucketed_batches(lengths, batch_size=10, max_batch_tokens=120)
+        self.assertEqual(batches, [[1, 5], [3, 2], [4, 0]])
+        self.assertEqual(sorted(idx for batch in batches for idx in batch), list(range(6)))
+
+    def test_03_score_logs_vectorized(self):
+        logs = [
+            {"user": "a", "target_fc": [call("f", x="1", y="2")], "target_text": None,
+             "output_fc": [call("f", y="2", x="1")], "output_text": None}, # Argument order does not matter
+            {"user": "b", "target_fc": [call("f", x="1")], "target_text": None,
+             "output_fc": [call("g", x="1")], "output_text": None},
+            {"user": "c", "target_fc": [call("f", x="1")], "target_text": None,
+             "output_fc": [call("f", x="2")], "output_text": None},
+            {"user": "d", "target_fc": [], "target_text": "Hi", "output_fc": [], "output_text": "Hello"},
+            {"user": "e", "target_fc": [call("f"), call("g")], "target_text": None,
+             "output_fc": [call("g"), call("f")], "output_text": None}, # Call order does
+        ]
+        scored = score_logs(logs)
+        self.assertEqual(scored["correct_names"].tolist(), [True, False, True, True, False])
+        self.assertEqual(scored["correct_arguments"].tolist(), [True, True, False, True, True])
+        self.assertEqual(scored["correct"].tolist(), [True, False, False, True, False])
+        self.assertEqual(scored["target_arguments"][0], [{"x": "1", "y": "2"}])
+        # Same verdicts as the notebook's list comparisons
+        self.assertEqual(scored["correct_names"].tolist(),
+                         [t == o for t, o in zip(scored["target_names"], scored["output_names"])])
+        with quiet() as out:
+            review(scored)
+        self.assertIn("Sample #1 prompt", out.getvalue())
+        self.assertNotIn("Sample #0 prompt", out.getvalue())
+
+
+class TestBatchedEvaluation(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tokenizer = build_tiny_tokenizer()
+        cls.model = build_tiny_model(cls.tokenizer)
+        cls.rows = make_rows(10)
+        cls.prompts = [apply_format(row, cls.tokenizer)["prompt"] for row in cls.rows]
+
+    def count_generate_rows(self):
+        counted = []
+        original_generate = self.model.generate
+
+        def counting_generate(**kwargs):
+            counted.append(kwargs["input_ids"].shape[0])
+            return original_generate(**kwargs)
+
+        self.model.generate = counting_generate
+        self.addCleanup(delattr, self.model, "generate")
+        return counted
+
+    def test_01_batched_outputs_match_unbatched(self):
+        with quiet():
+            unbatched = generate_outputs(self.prompts, self.model, self.tokenizer, batch_size=1, max_new_tokens=12)
+            batched = generate_outputs(self.prompts, self.model, self.tokenizer, batch_size=4, max_new_tokens=12)
+        self.assertEqual(batched, unbatched)
+        self.assertTrue(all(isinstance(output, str) for output in batched))
+
+    def test_02_checkpoint_resume(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "eval.jsonl")
+            with quiet():
+                full = generate_outputs(self.prompts, self.model, self.tokenizer, batch_size=4, max_new_tokens=8,
+                                        checkpoint_path=path)
+            with open(path) as f:
+                lines = f.readlines()
+            self.assertEqual(len(lines), len(self.prompts))
+            # Simulate a crash after 4 rows, mid-way through writing the fifth
+            with open(path, "w") as f:
+                f.writelines(lines[:4])
+                f.write(lines[4][:10])
+            self.assertEqual(len(load_checkpoint(path, self.prompts)), 4)
+
+            counted = self.count_generate_rows()
+            with quiet() as out:
+                resumed = generate_outputs(self.prompts, self.model, self.tokenizer, batch_size=4, max_new_tokens=8,
+                                           checkpoint_path=path)
+            self.assertIn("4 of 10 outputs loaded", out.getvalue())
+            self.assertEqual(sum(counted), 6)
+            self.assertEqual(resumed, full)
+
+            # A checkpoint from other prompts is not reused
+            self.assertEqual(load_checkpoint(path, list(reversed(self.prompts))), {})
+
+            # Nor one from another model (e.g. the base model before fine-tuning) or other settings
+            with quiet():
+                with self.assertRaises(ValueError):
+                    generate_outputs(self.prompts, build_tiny_model(self.tokenizer, seed=1), self.tokenizer,
+                                     max_new_tokens=8, checkpoint_path=path)
+                with self.assertRaises(ValueError):
+                    generate_outputs(self.prompts, self.model, self.tokenizer, max_new_tokens=9, checkpoint_path=path)
+
+    def test_03_scored_data_frame(self):
+        with quiet():
+            scored = get_scored_data_frame(self.rows, self.model, self.tokenizer, batch_size=4, max_new_tokens=8)
+        self.assertEqual(len(scored), len(self.rows))
+        self.assertEqual(scored["user"][0], json.loads(self.rows[0]["text"])["messages"][1]["content"])
+        self.assertEqual(scored["target_names"][2], ["get_syllabus"])
+        self.assertEqual(scored["correct"].dtype, bool)
+
+
+if __name__ == '__main__':
+    unittest.main()
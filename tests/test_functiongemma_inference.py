@@ -0,0 +1,213 @@
+import unittest
+import threading
+
+import torch
+from transformers import LogitsProcessorList
+from werkzeug.serving import make_server
+
+import assistant_service_app
+import student_service_app
+from FunctionGemma.inference import FunctionCallingEngine, quantize_int8, run_benchmark
+from tests.functiongemma_fixtures import TOOLS, ForcedCompletionLogitsProcessor, build_tiny_model, build_tiny_tokenizer
+from tests.helpers import quiet
+
+# Runs on CPU against a tiny randomly initialized Gemma 3 model standing in for the
+# fine-tuned FunctionGemma 270M. A logits processor makes it answer with scripted calls,
+# so outputs are meaningful while the model does the full amount of work per token.
+STUDENT_ID = "assistant_student"
+
+
+def user_message(text):
+    return text.rsplit("<start_of_turn>user\n", 1)[-1].split("<end_of_turn>", 1)[0]
+
+
+def scripted_reply(text):
+    """
+    The stand-in model's "fine-tuning": a canned answer per kind of message.
+    """
+    message = user_message(text)
+    if "syllabus" in message:
+        return "<start_function_call>call:get_syllabus{}<end_function_call><start_function_response>"
+    if "map" in message:
+        return "<start_function_call>call:open_map{query:<escape>school<escape>}<end_function_call>"
+    if "forgot" in message:
+        return "<start_function_call>call:log_activity{activity_type:<escape>quiz<escape>}<end_function_call>"
+    if "quiz" in message:
+        return ("<start_function_call>call:log_activity{activity_type:<escape>quiz<escape>,activity_description:"
+                f"<escape>{message}<escape>,related_topic_id:<escape>sci_topic_02<escape>}}<end_function_call>"
+                "and then some trailing text the engine should never generate<end_of_turn>")
+    return "Keep up the good work!<end_of_turn>"
+
+
+def scripted(tokenizer):
+    return {"logits_processor": LogitsProcessorList([ForcedCompletionLogitsProcessor(tokenizer, scripted_reply)])}
+
+
+class TestFunctionCallingEngine(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tokenizer = build_tiny_tokenizer()
+        cls.model = build_tiny_model(cls.tokenizer)
+        cls.tools = TOOLS
+
+    def engine(self, **options):
+        options.setdefault("generate_kwargs", scripted(self.tokenizer))
+        return FunctionCallingEngine(self.model, self.tokenizer, self.tools, **options)
+
+    def test_01_prefix_cache_matches_uncached_generation(self):
+        messages = ["hi", "I did a quiz on cells", "please show my syllabus " + "now " * 9, "I did a quiz"]
+        # Unscripted, the random model's own greedy output must be identical too
+        for generate_kwargs in (scripted(self.tokenizer), {}):
+            cached = self.engine(generate_kwargs=generate_kwargs, max_new_tokens=10).generate_batch(messages)
+            uncached = [self.engine(generate_kwargs=generate_kwargs, max_new_tokens=10, use_prefix_cache=False)
+                        .generate_batch([message])[0] for message in messages]
+            for got, expected in zip(cached, uncached):
+                self.assertEqual((got["function_calls"], got["text"], got["generated_tokens"]),
+                                 (expected["function_calls"], expected["text"], expected["generated_tokens"]))
+
+    def test_02_early_stop_and_prefix_reuse(self):
+        engine = self.engine()
+        first = engine.generate_batch(["I did a quiz on cells"])[0]
+        second = engine.generate_batch(["I did a quiz on plants", "hello"])
+        self.assertEqual(first["function_calls"][0]["function"]["arguments"]["activity_description"], "I did a quiz on cells")
+        call_text = scripted_reply("<start_of_turn>user\nI did a quiz on cells<end_of_turn>").split("and then")[0]
+        self.assertEqual(first["generated_tokens"], len(self.tokenizer(call_text, add_special_tokens=False)["input_ids"]))
+        self.assertIsNotNone(first["time_to_first_call_seconds"])
+        self.assertEqual(second[1], dict(second[1], function_calls=[], text="Keep up the good work!"))
+        self.assertEqual(engine.get_metrics()["prefix_cache"], {"entries": 1, "hits": 1, "misses": 1})
+
+    def test_03_concurrent_requests_are_micro_batched(self):
+        engine = self.engine(batch_size=4, batch_max_delay=0.05).start()
+        try:
+            futures = [engine.submit(f"I did a quiz number {n}") for n in range(12)]
+            results = [future.result(timeout=30) for future in futures]
+        finally:
+            engine.stop()
+        self.assertEqual([r["function_calls"][0]["function"]["arguments"]["activity_description"] for r in results],
+                         [f"I did a quiz number {n}" for n in range(12)])
+        metrics = engine.get_metrics()
+        self.assertEqual(metrics["requests"], 12)
+        self.assertLess(metrics["batches"], 12)
+        self.assertGreater(metrics["tokens_per_second"], 0)
+        with self.assertRaises(RuntimeError):
+            engine.submit("not running")
+
+    def test_04_int8_quantization(self):
+        quantized = quantize_int8(build_tiny_model(self.tokenizer))
+        self.assertNotIn(torch.nn.Linear, {type(module) for module in quantized.modules()})
+        engine = FunctionCallingEngine(quantized, self.tokenizer, self.tools, generate_kwargs=scripted(self.tokenizer))
+        self.assertEqual(engine.generate_batch(["show my syllabus"])[0]["function_calls"],
+                         [{"function": {"name": "get_syllabus", "arguments": {}}}])
+
+    def test_05_message_longer_than_prefix(self):
+        engine = self.engine()
+        messages = ["I did a quiz", "hello " + "a" * 703]
+        results = engine.generate_batch(messages)
+        self.assertEqual(engine.get_metrics()["prefix_cache"]["entries"], 1) # Prefix was built, then not used
+        uncached = self.engine(use_prefix_cache=False)
+        for message, result in zip(messages, results):
+            expected = uncached.generate_batch([message])[0]
+            self.assertEqual((result["function_calls"], result["text"]), (expected["function_calls"], expected["text"]))
+        self.assertEqual(results[0]["function_calls"][0]["function"]["name"], "log_activity")
+        self.assertEqual(results[1]["text"], "Keep up the good work!")
+
+    def test_06_benchmark(self):
+        messages = [f"I did a quiz on topic {n}" + " with notes" * (n % 4) for n in range(24)]
+        configurations = [
+            ("baseline: no prefix cache, batch 1", self.model, dict(use_prefix_cache=False, batch_size=1)),
+            ("prefix cache, batch 1", self.model, dict(batch_size=1)),
+            ("prefix cache, micro-batch 8", self.model, dict(batch_size=8)),
+            ("prefix cache, micro-batch 8, int8", quantize_int8(build_tiny_model(self.tokenizer)), dict(batch_size=8)),
+        ]
+        print("\nFunction calling with the tiny stand-in model (24 requests, 8 concurrent clients):")
+        for label, model, options in configurations:
+            engine = FunctionCallingEngine(model, self.tokenizer, self.tools, generate_kwargs=scripted(self.tokenizer),
+                                           max_new_tokens=256, **options).start()
+            try:
+                report = run_benchmark(engine, messages, concurrency=8)
+            finally:
+                engine.stop()
+            print(f"  {label:38s} {report['tokens_per_second']:8.1f} tokens/s  "
+                  f"time to first call p50 {report['time_to_first_call_p50_seconds'] * 1000:7.1f} ms, "
+                  f"p95 {report['time_to_first_call_p95_seconds'] * 1000:7.1f} ms  (avg batch {report['average_batch_size']})")
+            self.assertEqual(report["calls"], len(messages))
+
+
+class TestAssistantAPI(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        student_service_app.student_agents.clear()
+        cls.student_server = make_server("127.0.0.1", 0, student_service_app.app, threaded=True)
+        threading.Thread(target=cls.student_server.serve_forever, daemon=True).start()
+        tokenizer = build_tiny_tokenizer()
+        with quiet():
+            assistant_service_app.initialize_assistant_service(
+                model=build_tiny_model(tokenizer), tokenizer=tokenizer,
+                student_service_url=f"http://127.0.0.1:{cls.student_server.server_port}",
+                generate_kwargs=scripted(tokenizer))
+        cls.client = assistant_service_app.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        assistant_service_app.shutdown_assistant_service()
+        cls.student_server.shutdown()
+
+    def ask(self, message, **extra):
+        with quiet():
+            response = self.client.post(f"/students/{STUDENT_ID}/assistant", json=dict(extra, message=message))
+        return response.status_code, response.get_json()
+
+    def test_01_logs_activity_through_student_service(self):
+        status, data = self.ask("I finished the quiz on cells")
+        self.assertEqual(status, 200)
+        self.assertEqual(data["function_call"]["function"]["name"], "log_activity")
+        self.assertEqual(data["result"]["activity_description"], "I finished the quiz on cells")
+        activities = student_service_app.student_agents[STUDENT_ID].get_activities()
+        self.assertEqual(activities[-1]["related_topic_id"], "sci_topic_02")
+        self.assertIsNotNone(data["metrics"]["time_to_first_call_seconds"])
+
+    def test_02_reads_and_dry_run(self):
+        status, data = self.ask("what is on my syllabus?")
+        self.assertEqual(status, 200)
+        self.assertIn("topics", data["result"])
+        count = len(student_service_app.student_agents[STUDENT_ID].get_activities())
+        status, data = self.ask("I did a quiz on plants", execute=False)
+        self.assertEqual((status, data["function_call"]["function"]["name"]), (200, "log_activity"))
+        self.assertNotIn("result", data)
+        self.assertEqual(len(student_service_app.student_agents[STUDENT_ID].get_activities()), count)
+
+    def test_03_text_replies_and_errors(self):
+        status, data = self.ask("hello there")
+        self.assertEqual((status, data["function_call"], data["text"]), (200, None, "Keep up the good work!"))
+        status, data = self.ask("open the map")
+        self.assertEqual(status, 422)
+        status, data = self.ask("I forgot what I did in the quiz") # log_activity without a description
+        self.assertEqual(status, 400)
+        self.assertIn("activity_description", data["error"])
+        self.assertEqual(self.ask("   ")[0], 400)
+        metrics = self.client.get("/assistant/metrics").get_json()
+        self.assertGreater(metrics["requests"], 0)
+        self.assertIn("prefix_cache", metrics)
+
+    def test_04_engine_failures(self):
+        running = assistant_service_app.function_calling_engine
+        tokenizer = build_tiny_tokenizer()
+        stopped = FunctionCallingEngine(running.model, tokenizer, assistant_service_app.STUDENT_TOOLS)
+        broken = FunctionCallingEngine(running.model, tokenizer, assistant_service_app.STUDENT_TOOLS,
+                                       generate_kwargs={"num_beams": 0}).start()
+        try:
+            assistant_service_app.function_calling_engine = stopped
+            self.assertEqual(self.ask("hello there")[0], 503)
+            assistant_service_app.function_calling_engine = broken
+            status, data = self.ask("hello there")
+            self.assertEqual(status, 500)
+            self.assertIn("Function calling failed", data["error"])
+        finally:
+            broken.stop()
+            assistant_service_app.function_calling_engine = running
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import unittest
+import copy
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from FunctionGemma.evaluation import apply_format
+from FunctionGemma.preprocessing import PreprocessedCache, cache_key, preprocess_dataset
+from tests.functiongemma_fixtures import CHAT_TEMPLATE, TOOLS, build_tiny_tokenizer, make_rows
+from tests.helpers import quiet
+
+# Uses a local tokenizer; nothing is downloaded.
+
+
+def mixed_rows(count):
+    """
+    make_rows with every third row on a second tool set.
+    """
+    rows = make_rows(count)
+    for idx in range(0, count, 3):
+        sample = json.loads(rows[idx]["text"])
+        sample["tools"] = TOOLS[:1]
+        sample["metadata"] = "train"
+        rows[idx] = {"text": json.dumps(sample)}
+    return rows
+
+
+class TestPreprocessing(unittest.TestCase):
+
+    def setUp(self):
+        self.tokenizer = build_tiny_tokenizer()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def expected(self, rows, tokenizer=None):
+        tokenizer = tokenizer or self.tokenizer
+        for row in rows:
+            formatted = apply_format(row, tokenizer)
+            ids = tokenizer(formatted["prompt"] + formatted["completion"], add_special_tokens=False)["input_ids"]
+            prompt_length = len(tokenizer(formatted["prompt"], add_special_tokens=False)["input_ids"])
+            yield ids, [0] * prompt_length + [1] * (len(ids) - prompt_length), formatted["split"]
+
+    def assertMatchesApplyFormat(self, cache, rows, tokenizer=None):
+        self.assertEqual(len(cache), len(rows))
+        for index, (ids, mask, split) in enumerate(self.expected(rows, tokenizer)):
+            self.assertEqual(cache[index], {"input_ids": ids, "completion_mask": mask, "split": split})
+
+    def test_01_matches_apply_format(self):
+        rows = mixed_rows(30)
+        with quiet():
+            cache = preprocess_dataset(rows, self.tokenizer, self.tmp.name, num_proc=1)
+        self.assertMatchesApplyFormat(cache, rows)
+        self.assertEqual(cache.meta["tool_sets"], 2)
+        self.assertEqual(cache.indices("train"), list(range(0, 30, 3)))
+        self.assertEqual(cache.max_length, max(len(cache[i]["input_ids"]) for i in range(len(cache))))
+        self.assertIsInstance(cache.input_ids, np.memmap)
+
+    def test_02_tool_schema_rendered_once_per_tool_set(self):
+        rendered_with_tools = []
+        original = self.tokenizer.apply_chat_template
+
+        def counting_apply_chat_template(messages, tools=None, **kwargs):
+            if tools:
+                rendered_with_tools.append(len(tools))
+            return original(messages, tools=tools, **kwargs)
+
+        self.tokenizer.apply_chat_template = counting_apply_chat_template
+        with quiet():
+            preprocess_dataset(mixed_rows(60), self.tokenizer, self.tmp.name, num_proc=1)
+        # Per tool set: one prefix render plus apply_format's two renders to check it; none per row
+        self.assertEqual(len(rendered_with_tools), 2 * 3)
+
+    def test_03_worker_processes_match_in_process(self):
+        rows = mixed_rows(40)
+        with quiet():
+            serial = preprocess_dataset(rows, self.tokenizer, os.path.join(self.tmp.name, "serial"), num_proc=1)
+            parallel = preprocess_dataset(rows, self.tokenizer, os.path.join(self.tmp.name, "parallel"),
+                                          num_proc=2, chunk_size=7)
+        for name in ("input_ids", "offsets", "prompt_lengths", "split_codes"):
+            np.testing.assert_array_equal(getattr(serial, name), getattr(parallel, name))
+
+    def test_04_cache_hit_skips_preprocessing(self):
+        rows = make_rows(200)
+        with quiet():
+            start = time.perf_counter()
+            first = preprocess_dataset(rows, self.tokenizer, self.tmp.name, num_proc=1)
+            build_seconds = time.perf_counter() - start
+        with quiet() as out:
+            start = time.perf_counter()
+            second = preprocess_dataset(rows, self.tokenizer, self.tmp.name, num_proc=1)
+            load_seconds = time.perf_counter() - start
+        self.assertIn("Loading preprocessed dataset", out.getvalue())
+        self.assertEqual(second.path, first.path)
+        self.assertEqual(second[5], first[5])
+        self.assertEqual(os.listdir(self.tmp.name), [os.path.basename(first.path)]) # No temp dirs left behind
+        self.assertLess(load_seconds, build_seconds)
+
+    def test_05_cache_key_covers_tokenizer_and_data(self):
+        rows = make_rows(5)
+        key = cache_key(self.tokenizer, rows)
+        self.assertEqual(cache_key(build_tiny_tokenizer(), make_rows(5)), key)
+        self.assertNotEqual(cache_key(self.tokenizer, make_rows(6)), key)
+        other = copy.deepcopy(self.tokenizer)
+        other.chat_template = CHAT_TEMPLATE.replace("developer\\n", "system\\n")
+        self.assertNotEqual(cache_key(other, rows), key)
+
+    def test_06_falls_back_when_template_rewrites_content(self):
+        tokenizer = build_tiny_tokenizer()
+        tokenizer.chat_template = CHAT_TEMPLATE.replace("'<start_of_turn>developer\\n' + message.content",
+                                                        "'<start_of_turn>developer\\n' + message.content | upper")
+        rows = make_rows(8)
+        with quiet() as out:
+            cache = preprocess_dataset(rows, tokenizer, self.tmp.name, num_proc=1)
+        self.assertIn("using apply_format", out.getvalue())
+        self.assertMatchesApplyFormat(cache, rows, tokenizer)
+        self.assertEqual(cache.meta["tool_sets"], 0)
+
+    def test_07_reopen_cache_directory(self):
+        rows = make_rows(4)
+        with quiet():
+            cache = preprocess_dataset(rows, self.tokenizer, self.tmp.name, num_proc=1)
+        self.assertEqual(PreprocessedCache(cache.path)[3], cache[3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+import time
+
+from transformers import LogitsProcessorList
+
+from FunctionGemma.evaluation import apply_format, extract_function_call
+from FunctionGemma.streaming import (FunctionCallStoppingCriteria, FunctionCallStreamParser, FunctionCallTokenParser,
+                                     generate_function_calls, stream_function_calls)
+from tests.functiongemma_fixtures import ScriptedLogitsProcessor, build_tiny_model, build_tiny_tokenizer, make_rows
+
+# Runs on CPU against a tiny randomly initialized Gemma 3 model; a scripted logits
+# processor makes it emit real function calls.
+LOG_CALL = ("<start_function_call>call:log_activity{activity_type:<escape>quiz<escape>,"
+            "activity_description:<escape>Fractions {part 2}<escape>}<end_function_call>")
+SYLLABUS_CALL = "<start_function_call>call:get_syllabus{}<end_function_call>"
+OUTPUT = "Sure. " + LOG_CALL + SYLLABUS_CALL + "<start_function_response>trailing text<end_of_turn>"
+
+
+class TestStreamParsers(unittest.TestCase):
+
+    def test_01_text_parser_matches_extract_function_call(self):
+        for chunk_size in (1, 3, 7, len(OUTPUT)):
+            parser = FunctionCallStreamParser()
+            emitted_at = []
+            for start in range(0, len(OUTPUT), chunk_size):
+                for function_call in parser.feed(OUTPUT[start:start + chunk_size]):
+                    emitted_at.append((start + chunk_size, function_call))
+            self.assertEqual([c for _, c in emitted_at], extract_function_call(OUTPUT))
+            self.assertEqual(parser.calls, extract_function_call(OUTPUT))
+            # Each call is emitted by the chunk holding the last character of its end marker
+            first_end = OUTPUT.index("<end_function_call>") + len("<end_function_call>")
+            self.assertGreaterEqual(emitted_at[0][0], first_end)
+            self.assertLess(emitted_at[0][0] - chunk_size, first_end)
+            self.assertEqual(parser.text, "Sure. <start_function_response>trailing text<end_of_turn>")
+
+    def test_02_text_parser_skips_malformed_calls(self):
+        parser = FunctionCallStreamParser()
+        self.assertEqual(parser.feed("<start_function_call>not a call<end_function_call><start_function_"), [])
+        self.assertEqual(parser.feed("call>call:get_syllabus{}<end_function_call>"),
+                         [{"function": {"name": "get_syllabus", "arguments": {}}}])
+
+    def test_03_token_parser(self):
+        tokenizer = build_tiny_tokenizer()
+        ids = tokenizer(OUTPUT, add_special_tokens=False)["input_ids"]
+        parser = FunctionCallTokenParser(tokenizer)
+        completed = [parser.feed_ids([token_id]) for token_id in ids]
+        self.assertEqual(parser.calls, extract_function_call(OUTPUT))
+        end_id = tokenizer.convert_tokens_to_ids("<end_function_call>")
+        # Calls are returned exactly on their <end_function_call> token
+        self.assertEqual([bool(c) for c in completed], [token_id == end_id for token_id in ids])
+
+
+class TestEarlyStop(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tokenizer = build_tiny_tokenizer()
+        cls.model = build_tiny_model(cls.tokenizer)
+        cls.prompts = [apply_format(row, cls.tokenizer)["prompt"] for row in make_rows(2)]
+
+    def scripted(self, prompts, completions):
+        prompt_length = self.tokenizer(prompts, add_special_tokens=False, padding=True,
+                                       return_tensors="pt")["input_ids"].shape[1]
+        return LogitsProcessorList([ScriptedLogitsProcessor(self.tokenizer, completions, prompt_length)])
+
+    def test_01_generation_stops_after_first_call(self):
+        seen = []
+        inputs = self.tokenizer(self.prompts[:1], add_special_tokens=False, return_tensors="pt")
+        criteria = FunctionCallStoppingCriteria(self.tokenizer, inputs["input_ids"].shape[1], max_calls=1,
+                                                on_call=lambda row, function_call: seen.append(row))
+        generated = self.model.generate(**inputs, max_new_tokens=200, do_sample=False, stopping_criteria=[criteria],
+                                        logits_processor=self.scripted(self.prompts[:1], [OUTPUT]),
+                                        pad_token_id=self.tokenizer.pad_token_id)
+        new_text = self.tokenizer.decode(generated[0, inputs["input_ids"].shape[1]:], skip_special_tokens=False)
+        self.assertEqual(new_text, "Sure. " + LOG_CALL) # Nothing generated after the first call
+        self.assertEqual(seen, [0])
+        self.assertEqual(criteria.calls, [extract_function_call(LOG_CALL)])
+
+    def test_02_batched_rows_stop_independently(self):
+        calls = generate_function_calls(self.model, self.tokenizer, self.prompts, max_calls=2, max_new_tokens=200,
+                                        logits_processor=self.scripted(self.prompts, [OUTPUT, "No call here.<end_of_turn>"]))
+        self.assertEqual(calls, [extract_function_call(OUTPUT), []])
+
+    def test_03_stream_yields_before_generation_finishes(self):
+        completion = LOG_CALL + "x" * 150
+        events = []
+        start = time.perf_counter()
+        for function_call in stream_function_calls(self.model, self.tokenizer, self.prompts[0], max_calls=None,
+                                                   max_new_tokens=len(completion) + 5,
+                                                   logits_processor=self.scripted(self.prompts[:1], [completion])):
+            events.append((time.perf_counter() - start, function_call))
+        total = time.perf_counter() - start
+        self.assertEqual([c for _, c in events], extract_function_call(LOG_CALL))
+        self.assertLess(events[0][0], total / 2) # The call arrived well before the 150 trailing tokens
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import unittest
+import threading
+
+import student_service_app
+from agents.ingestion_queue import ActivityIngestionQueue
+from tests.helpers import quiet
+
+# In-process tests using Flask's test client; the services do not need to be running.
+
+
+class TestQueuedIngestionAPI(unittest.TestCase):
+
+    def setUp(self):
+        student_service_app.student_agents.clear()
+        self.client = student_service_app.app.test_client()
+        with quiet():
+            student_service_app.enable_queued_ingestion(capacity=200, workers=2, batch_size=20)
+
+    def tearDown(self):
+        with quiet():
+            student_service_app.disable_queued_ingestion()
+
+    def post_activity(self, student_id, description, topic_id="sci_topic_01"):
+        return self.client.post(f"/students/{student_id}/activities", json={
+            "activity_type": "exercise",
+            "activity_description": description,
+            "related_topic_id": topic_id,
+        })
+
+    def test_01_post_returns_202_with_activity_id(self):
+        with quiet():
+            response = self.post_activity("queued_student", "Queued exercise")
+        self.assertEqual(response.status_code, 202)
+        data = response.get_json()
+        self.assertEqual(data["status"], "queued")
+        self.assertTrue(data["activity_id"])
+
+    def test_02_read_your_writes_on_dashboard(self):
+        with quiet():
+            ids = [self.post_activity("ryw_student", f"Exercise {n}").get_json()["activity_id"] for n in range(30)]
+            response = self.client.get("/students/ryw_student/dashboard_data")
+        summary = response.get_json()["activity_summary"]
+        logged = summary["The Scientific Method"]["activities"]
+        self.assertEqual([act["activity_id"] for act in logged], ids) # All present, in submission order
+
+    def test_03_bad_request_still_rejected_synchronously(self):
+        response = self.client.post("/students/queued_student/activities", json={"activity_description": "Missing type"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_04_metrics_endpoint(self):
+        with quiet():
+            self.post_activity("metrics_student", "Exercise")
+            self.client.get("/students/metrics_student/dashboard_data")
+        metrics = self.client.get("/ingestion/metrics").get_json()
+        self.assertEqual(metrics["mode"], "queued")
+        self.assertEqual(metrics["accepted"], 1)
+        self.assertEqual(metrics["applied"], 1)
+        self.assertEqual(metrics["queue_depth"], 0)
+        self.assertIn("last_batch_lag_seconds", metrics)
+
+
+class TestActivityIngestionQueue(unittest.TestCase):
+
+    def test_01_backpressure_when_full(self):
+        with quiet():
+            student_service_app.enable_queued_ingestion(capacity=2, workers=1)
+            student_service_app.ingestion_queue.stop() # No workers, so nothing drains
+        client = student_service_app.app.test_client()
+        try:
+            statuses = [client.post("/students/full_student/activities", json={
+                "activity_type": "quiz", "activity_description": f"Quiz {n}"}).status_code for n in range(3)]
+            self.assertEqual(statuses, [202, 202, 429])
+            metrics = client.get("/ingestion/metrics").get_json()
+            self.assertEqual(metrics["queue_depth"], 2)
+            self.assertEqual(metrics["rejected"], 1)
+        finally:
+            student_service_app.ingestion_queue = None
+
+    def test_02_batches_preserve_per_student_order_under_concurrency(self):
+        agents = {}
+
+        def get_agent(student_id):
+            with quiet():
+                return agents.setdefault(student_id, student_service_app._create_student_agent(student_id))
+
+        ingestion = ActivityIngestionQueue(get_agent, capacity=10000, workers=3, batch_size=64)
+        with quiet():
+            ingestion.start()
+
+        def producer(idx):
+            for n in range(300):
+                self.assertIsNotNone(ingestion.submit(f"student_{idx}", "exercise", str(n), "sci_topic_01"))
+
+        threads = [threading.Thread(target=producer, args=(idx,)) for idx in range(6)]
+        with quiet():
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            for idx in range(6):
+                self.assertTrue(ingestion.wait_until_applied(f"student_{idx}"))
+            ingestion.stop()
+
+        for idx in range(6):
+            descriptions = [act["activity_description"] for act in agents[f"student_{idx}"].get_activities()]
+            self.assertEqual(descriptions, [str(n) for n in range(300)])
+        metrics = ingestion.get_metrics()
+        self.assertEqual(metrics["applied"], 1800)
+        self.assertLess(metrics["batches"], 1800) # Writes were actually batched
+
+    def test_03_read_does_not_wait_for_later_writes(self):
+        gates = {"A": threading.Event(), "B": threading.Event()}
+
+        class GatedAgent:
+            def log_activities(self, pending_activities):
+                for pending in pending_activities:
+                    gates[pending["activity_description"]].wait(5)
+
+        ingestion = ActivityIngestionQueue(lambda student_id: GatedAgent(), capacity=10, workers=1, batch_size=1)
+        with quiet():
+            ingestion.start()
+        try:
+            ingestion.submit("busy_student", "quiz", "A")
+            read = {}
+            reader = threading.Thread(target=lambda: read.update(applied=ingestion.wait_until_applied("busy_student", 2)))
+            reader.start()
+            reader.join(0.1) # The read has begun before B is accepted
+            ingestion.submit("busy_student", "quiz", "B") # Stays unapplied until the read is done
+            gates["A"].set()
+            reader.join(3)
+            self.assertTrue(read["applied"])
+            self.assertEqual(ingestion.get_metrics()["students_with_pending_writes"], 1)
+        finally:
+            gates["B"].set()
+            ingestion.stop()
+        self.assertTrue(ingestion.wait_until_applied("busy_student", 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
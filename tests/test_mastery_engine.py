@@ -0,0 +1,187 @@
+import unittest
+import json
+import random
+import threading
+import time
+
+import numpy as np
+
+import student_service_app
+import teacher_service_app
+from agents.mastery_engine import MasteryEngine
+from agents.student_interaction_agent import StudentInteractionAgent
+from tests.helpers import SYLLABUS_PATH, quiet
+
+# In-process tests; the services do not need to be running.
+with open(SYLLABUS_PATH) as f:
+    SYLLABUS = json.load(f)
+
+
+def random_log(rng, length):
+    activity_types = ["learning", "quiz", "exercise", "learning"]
+    topic_ids = [topic["id"] for topic in SYLLABUS["topics"]] + [None, "not_in_syllabus"]
+    log = []
+    for _ in range(length):
+        activity = {"activity_type": rng.choice(activity_types), "related_topic_id": rng.choice(topic_ids)}
+        if activity["activity_type"] == "quiz":
+            activity["outcome"] = rng.choice([True, False, 0.5])
+        log.append(activity)
+    return log
+
+
+class TestMasteryEngine(unittest.TestCase):
+
+    def test_01_single_correct_observation_matches_bkt(self):
+        engine = MasteryEngine(SYLLABUS, p_init=0.2, p_learn=0.15, p_slip=0.1, p_guess=0.2)
+        engine.update("s1", {"activity_type": "quiz", "related_topic_id": "sci_topic_01", "outcome": True})
+        posterior = 0.2 * 0.9 / (0.2 * 0.9 + 0.8 * 0.2)
+        expected = posterior + (1 - posterior) * 0.15
+        self.assertAlmostEqual(engine.get_mastery("s1")["The Scientific Method"], round(expected, 4))
+
+    def test_02_learning_without_evidence_leaves_estimate(self):
+        engine = MasteryEngine(SYLLABUS, p_init=0.2, p_learn=0.15)
+        for _ in range(11):
+            engine.update("s1", {"activity_type": "learning", "related_topic_id": "sci_topic_02"})
+        self.assertAlmostEqual(engine.get_mastery("s1")["Living Organisms"], 0.2)
+        analysis = engine.get_strengths_weaknesses("s1")
+        self.assertNotIn("Living Organisms", analysis["strengths"]) # Reading alone is not a strength, as in rules mode
+        self.assertIn("Living Organisms (Low estimated mastery)", analysis["weaknesses"])
+
+    def test_03_batched_recompute_matches_incremental(self):
+        rng = random.Random(7)
+        logs = {f"student_{n}": random_log(rng, rng.randint(0, 60)) for n in range(40)}
+
+        incremental = MasteryEngine(SYLLABUS, initial_capacity=4) # Also exercises growth
+        for student_id, log in logs.items():
+            for activity in log:
+                incremental.update(student_id, activity)
+        batched = MasteryEngine(SYLLABUS)
+        batched.recompute(logs)
+
+        for student_id in logs:
+            np.testing.assert_allclose(
+                list(incremental.get_mastery(student_id).values()),
+                list(batched.get_mastery(student_id).values()))
+
+    def test_04_strengths_and_weaknesses_shape(self):
+        engine = MasteryEngine(SYLLABUS)
+        for _ in range(4):
+            engine.update("s1", {"activity_type": "quiz", "related_topic_id": "sci_topic_01", "outcome": True})
+        for _ in range(3):
+            engine.update("s1", {"activity_type": "quiz", "related_topic_id": "sci_topic_02", "outcome": False})
+        analysis = engine.get_strengths_weaknesses("s1")
+        self.assertEqual(analysis["strengths"], ["The Scientific Method"])
+        self.assertIn("Living Organisms (Low estimated mastery)", analysis["weaknesses"])
+        self.assertIn("Earth and Space (No activity logged)", analysis["weaknesses"])
+        self.assertEqual(set(analysis["mastery"]), {topic["title"] for topic in SYLLABUS["topics"]})
+
+    def test_05_agent_mastery_mode(self):
+        with quiet():
+            agent = StudentInteractionAgent("mode_student", syllabus_path=SYLLABUS_PATH)
+            self.assertIn("not enabled", agent.get_strengths_weaknesses(mode="mastery")["message"])
+            agent.log_activity("quiz", "Early quiz", "sci_topic_03", outcome=True) # Before watching: replayed
+            engine = MasteryEngine(SYLLABUS)
+            engine.watch_student(agent)
+            for _ in range(3):
+                agent.log_activity("quiz", "Quiz", "sci_topic_03", outcome=True)
+        self.assertEqual(agent.get_strengths_weaknesses(mode="mastery")["strengths"], ["Earth and Space"])
+        self.assertIn("message", agent.get_strengths_weaknesses()) # Rule-based mode is unchanged
+
+    def test_06_batched_class_recompute_is_faster_than_per_student_loop(self):
+        rng = random.Random(3)
+        logs = {f"student_{n}": random_log(rng, 50) for n in range(300)}
+
+        start = time.perf_counter()
+        looped = MasteryEngine(SYLLABUS)
+        for student_id, log in logs.items():
+            looped.recompute({student_id: log})
+        loop_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        MasteryEngine(SYLLABUS).recompute(logs)
+        batched_seconds = time.perf_counter() - start
+        self.assertLess(batched_seconds, loop_seconds)
+
+    def test_07_recompute_during_concurrent_logging(self):
+        with quiet():
+            agent = StudentInteractionAgent("busy_student", syllabus_path=SYLLABUS_PATH)
+        engine = MasteryEngine(SYLLABUS)
+        engine.watch_student(agent)
+        rng = random.Random(11)
+        log = random_log(rng, 400)
+
+        def write(activities):
+            for activity in activities:
+                agent.log_activity(activity["activity_type"], "Activity", activity["related_topic_id"], activity.get("outcome"))
+
+        writers = [threading.Thread(target=write, args=(log[n::4],)) for n in range(4)]
+        with quiet():
+            for writer in writers:
+                writer.start()
+            while any(writer.is_alive() for writer in writers):
+                engine.recompute_class([agent])
+            for writer in writers:
+                writer.join()
+        # Every activity applied exactly once, whatever the interleaving with the recomputes
+        replayed = MasteryEngine(SYLLABUS)
+        replayed.recompute({agent.student_id: agent.get_activities()})
+        np.testing.assert_allclose(list(engine.get_mastery(agent.student_id).values()),
+                                   list(replayed.get_mastery(agent.student_id).values()))
+        self.assertEqual(engine.get_strengths_weaknesses(agent.student_id)["details"],
+                         replayed.get_strengths_weaknesses(agent.student_id)["details"])
+
+    def test_08_writes_for_other_students_do_not_wait(self):
+        with quiet():
+            busy = StudentInteractionAgent("locked_student", syllabus_path=SYLLABUS_PATH)
+            other = StudentInteractionAgent("other_student", syllabus_path=SYLLABUS_PATH)
+        engine = MasteryEngine(SYLLABUS)
+        engine.watch_student(busy)
+        engine.watch_student(other)
+        self.assertIsNot(engine._student_locks.lock_for(busy.student_id), engine._student_locks.lock_for(other.student_id))
+        with engine._student_locks.lock_for(busy.student_id): # e.g. a long catch-up for busy
+            writer = threading.Thread(target=lambda: other.log_activity("quiz", "Quiz", "sci_topic_01", outcome=True))
+            with quiet():
+                writer.start()
+                writer.join(2)
+            self.assertFalse(writer.is_alive())
+        self.assertGreater(engine.get_mastery(other.student_id)["The Scientific Method"], 0.2)
+
+
+class TestMasteryAPI(unittest.TestCase):
+
+    def test_01_student_dashboard_mastery_analysis(self):
+        student_service_app.student_agents.clear()
+        client = student_service_app.app.test_client()
+        with quiet():
+            for outcome in (True, True, True, True):
+                response = client.post("/students/api_mastery_student/activities", json={
+                    "activity_type": "quiz", "activity_description": "Quiz", "related_topic_id": "sci_topic_04", "outcome": outcome})
+                self.assertEqual(response.status_code, 201)
+                self.assertTrue(response.get_json()["outcome"])
+            agent = student_service_app.student_agents["api_mastery_student"]
+            self.assertIsNone(agent.mastery_engine) # Not attached until mastery mode is read
+            data = client.get("/students/api_mastery_student/dashboard_data?analysis=mastery").get_json()
+        self.assertIs(agent.mastery_engine, student_service_app.mastery_engines[SYLLABUS["course_name"]])
+        self.assertIn("Matter and Its Properties", data["strengths_weaknesses"]["strengths"])
+        self.assertEqual(client.get("/students/api_mastery_student/dashboard_data?analysis=nope").status_code, 400)
+
+    def test_02_bad_outcome_rejected(self):
+        client = student_service_app.app.test_client()
+        response = client.post("/students/api_mastery_student/activities", json={
+            "activity_type": "quiz", "activity_description": "Quiz", "outcome": 3})
+        self.assertEqual(response.status_code, 400)
+
+    def test_03_teacher_class_mastery(self):
+        teacher_service_app.teacher_managed_student_agents.clear()
+        with quiet():
+            teacher_service_app.initialize_teacher_service()
+        client = teacher_service_app.app.test_client()
+        data = client.get("/teachers/teacher01/students/mastery?recompute=true").get_json()
+        self.assertEqual(len(data["topics"]), len(SYLLABUS["topics"]))
+        self.assertIn("student001", data["students"])
+        sw = client.get("/teachers/teacher01/students/student001/strengths_weaknesses?analysis=mastery").get_json()
+        self.assertIn("mastery", sw["strengths_weaknesses"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+import pstats
+import shutil
+import tempfile
+import time
+
+from flask import Flask, jsonify
+
+import student_service_app
+import teacher_service_app
+from request_profiler import install_request_profiler
+from tests.helpers import quiet
+
+# In-process tests; the services do not need to be running.
+
+
+def slow_helper():
+    time.sleep(0.03)
+    return sum(range(10000))
+
+
+class TestRequestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+
+        @self.app.route('/work')
+        def work():
+            return jsonify({"total": slow_helper()})
+
+        @self.app.route('/boom')
+        def boom():
+            raise RuntimeError("boom")
+
+        with quiet():
+            self.profiler = install_request_profiler(self.app, "test_service", enabled=True,
+                                                     output_dir=self.output_dir, max_per_minute=3)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_01_unflagged_request_is_not_profiled(self):
+        response = self.client.get('/work')
+        self.assertNotIn("X-Profile-Id", response.headers)
+        self.assertEqual(self.client.get('/_profiles').get_json()["profiles"], [])
+
+    def test_02_cprofile_dump_via_header_and_retrieval(self):
+        with quiet():
+            response = self.client.get('/work', headers={"X-Profile": "1"})
+        profile_id = response.headers["X-Profile-Id"]
+        self.assertTrue(profile_id.endswith(".prof"))
+        self.assertIn(profile_id, self.client.get('/_profiles').get_json()["profiles"])
+
+        stats = pstats.Stats(f"{self.output_dir}/{profile_id}")
+        self.assertTrue(any(func[2] == "slow_helper" for func in stats.stats))
+        text = self.client.get(f'/_profiles/{profile_id}?format=text').get_data(as_text=True)
+        self.assertIn("GET /work -> 200", text)
+        self.assertIn("slow_helper", text)
+        for limit in ("abc", "0"):
+            self.assertEqual(self.client.get(f'/_profiles/{profile_id}?format=text&limit={limit}').status_code, 400)
+
+    def test_03_sampled_stack_mode_via_query_flag(self):
+        with quiet():
+            response = self.client.get('/work?_profile=sample')
+        profile_id = response.headers["X-Profile-Id"]
+        text = self.client.get(f'/_profiles/{profile_id}').get_data(as_text=True)
+        self.assertIn("slow_helper", text)
+
+    def test_04_rate_limit(self):
+        with quiet():
+            ids = [self.client.get('/work', headers={"X-Profile": "cprofile"}).headers.get("X-Profile-Id") for _ in range(4)]
+        self.assertTrue(all(ids[:3]))
+        self.assertIsNone(ids[3])
+
+    def test_05_token_guard_and_bad_ids(self):
+        with quiet():
+            guarded = Flask("guarded")
+            guarded.add_url_rule('/work', 'work', lambda: "ok")
+            install_request_profiler(guarded, "guarded", enabled=True, output_dir=self.output_dir, token="secret")
+        client = guarded.test_client()
+        self.assertNotIn("X-Profile-Id", client.get('/work', headers={"X-Profile": "1"}).headers)
+        self.assertEqual(client.get('/_profiles').status_code, 403)
+        with quiet():
+            response = client.get('/work', headers={"X-Profile": "1", "X-Profile-Token": "secret"})
+        self.assertIn("X-Profile-Id", response.headers)
+        self.assertEqual(client.get('/_profiles/..%2Fsecret', headers={"X-Profile-Token": "secret"}).status_code, 404)
+
+    def test_06_failing_request_releases_profiler(self):
+        with quiet():
+            self.client.get('/boom', headers={"X-Profile": "1"})
+            response = self.client.get('/work', headers={"X-Profile": "1"})
+        self.assertIn("X-Profile-Id", response.headers)
+
+    def test_07_disabled_by_default_registers_nothing(self):
+        self.assertIsNone(student_service_app.request_profiler)
+        self.assertIsNone(teacher_service_app.request_profiler)
+        for app in (student_service_app.app, teacher_service_app.app):
+            self.assertFalse(app.before_request_funcs)
+            self.assertNotIn("list_request_profiles", app.view_functions)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import unittest
+import random
+import threading
+
+import teacher_service_app
+from agents.student_interaction_agent import StudentInteractionAgent
+from agents.teacher_event_feed import TeacherEventFeed
+from tests.helpers import SYLLABUS_PATH, quiet
+
+# In-process tests; the services do not need to be running.
+
+
+class TestTeacherEventFeed(unittest.TestCase):
+
+    def setUp(self):
+        with quiet():
+            self.agent = StudentInteractionAgent("feed_student", syllabus_path=SYLLABUS_PATH)
+        self.feed = TeacherEventFeed(history_size=50, max_buffered_per_connection=5)
+        self.feed.watch_student(self.agent)
+
+    def log(self, activity_type, topic_id="sci_topic_02"):
+        with quiet():
+            self.agent.log_activity(activity_type, f"{activity_type} on {topic_id}", topic_id)
+
+    def test_01_activity_and_classification_deltas(self):
+        subscription = self.feed.subscribe()
+        self.log("learning") # First activity makes 'Living Organisms' a weakness
+        self.log("learning") # Still a weakness: no new classification event
+        self.log("quiz")     # Third activity with application flips it to a strength
+        events = subscription.next_events(timeout=1)
+
+        self.assertEqual([e["event"] for e in events].count("activity"), 3)
+        self.assertNotIn("activity_description", events[0]["data"]) # Deltas stay compact
+        flips = [e["data"] for e in events if e["event"] == "classification"]
+        self.assertEqual(flips, [
+            {"student_id": "feed_student", "topic": "Living Organisms", "from": None, "to": "weakness"},
+            {"student_id": "feed_student", "topic": "Living Organisms", "from": "weakness", "to": "strength"},
+        ])
+        self.assertEqual([e["id"] for e in events], sorted(e["id"] for e in events))
+
+    def test_02_resume_from_last_event_id(self):
+        self.log("learning")
+        self.log("exercise")
+        first_id = self.feed.subscribe(last_event_id=0).next_events(timeout=1)[0]["id"]
+        resumed = self.feed.subscribe(last_event_id=first_id).next_events(timeout=1)
+        self.assertTrue(resumed)
+        self.assertTrue(all(e["id"] > first_id for e in resumed))
+
+    def test_03_resume_from_evicted_id_sends_reset(self):
+        for _ in range(30): # More events than the history holds
+            self.log("learning", topic_id="sci_topic_03")
+            self.log("exercise", topic_id="sci_topic_03")
+        events = self.feed.subscribe(last_event_id=1).next_events(timeout=1)
+        self.assertEqual([e["event"] for e in events], ["reset"])
+
+    def test_04_slow_connection_is_bounded(self):
+        subscription = self.feed.subscribe()
+        for _ in range(20):
+            self.log("learning", topic_id=None)
+        events = subscription.next_events(timeout=1)
+        self.assertEqual(events[0]["event"], "reset")
+        self.assertLessEqual(len(events), 5 + 1) # Buffer bound plus the reset marker
+
+    def test_05_no_events_returns_empty_after_timeout(self):
+        self.assertEqual(self.feed.subscribe().next_events(timeout=0.05), [])
+
+    def test_06_incremental_classification_matches_rules(self):
+        self.agent.get_strengths_weaknesses = None # Writes must not re-run the full analysis
+        rng = random.Random(5)
+        topic_ids = ["sci_topic_01", "sci_topic_02", "sci_topic_03", "sci_topic_04", None, "not_in_syllabus"]
+        for _ in range(60):
+            self.log(rng.choice(["learning", "learning", "quiz", "exercise"]), topic_id=rng.choice(topic_ids))
+        del self.agent.get_strengths_weaknesses
+        details = self.agent.get_strengths_weaknesses()["details"]
+        expected = {title: detail.split(":")[0].lower() for title, detail in details.items()}
+        self.assertEqual(self.feed._classifications["feed_student"], expected)
+
+    def test_07_writes_for_other_students_do_not_wait(self):
+        with quiet():
+            other = StudentInteractionAgent("other_feed_student", syllabus_path=SYLLABUS_PATH)
+        self.feed.watch_student(other)
+        self.assertIsNot(self.feed._student_locks.lock_for("feed_student"), self.feed._student_locks.lock_for(other.student_id))
+        with self.feed._student_locks.lock_for("feed_student"):
+            writer = threading.Thread(target=lambda: other.log_activity("quiz", "Quiz", "sci_topic_01"))
+            with quiet():
+                writer.start()
+                writer.join(2)
+            self.assertFalse(writer.is_alive())
+
+
+class TestTeacherEventStreamAPI(unittest.TestCase):
+
+    def setUp(self):
+        teacher_service_app.teacher_managed_student_agents.clear()
+        with quiet():
+            teacher_service_app.initialize_teacher_service()
+        self.client = teacher_service_app.app.test_client()
+
+    def read_chunks(self, response, count):
+        chunks = []
+        for chunk in response.response:
+            chunks.append(chunk.decode() if isinstance(chunk, bytes) else chunk)
+            if len(chunks) == count:
+                break
+        return chunks
+
+    def test_01_stream_replays_and_pushes_new_events(self):
+        response = self.client.get("/teachers/teacher01/students/events?last_event_id=0", buffered=False)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "text/event-stream")
+        chunks = self.read_chunks(response, 2)
+        self.assertTrue(chunks[0].startswith("retry:"))
+        self.assertIn("event: activity", chunks[1]) # Mock activities logged at initialization
+        response.close()
+
+    def test_02_heartbeat_when_idle(self):
+        original = teacher_service_app.SSE_HEARTBEAT_SECONDS
+        teacher_service_app.SSE_HEARTBEAT_SECONDS = 0.05
+        try:
+            response = self.client.get("/teachers/teacher01/students/events", buffered=False)
+            chunks = self.read_chunks(response, 2)
+            self.assertEqual(chunks[1], ": heartbeat\n\n")
+            response.close()
+        finally:
+            teacher_service_app.SSE_HEARTBEAT_SECONDS = original
+        self.assertEqual(teacher_service_app.teacher_event_feed.connection_count(), 0)
+
+    def test_03_bad_last_event_id(self):
+        response = self.client.get("/teachers/teacher01/students/events", headers={"Last-Event-ID": "abc"})
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()